@@ -0,0 +1,123 @@
+"""
+Benchmark for the enrichment pipeline in data_import.py.
+
+Builds a synthetic employee file (with homonyms and employees without a work center),
+a work center table with a few duplicated centers and a survey of 3000 respondents,
+then times data_import.enrich against the previous row-wise pipeline (apply(axis=1)
+name concatenation and groupby('id').apply duplicate resolution) and checks that both
+keep the same employee and work center for every record.
+
+Usage:
+    python benchmark_import.py [employee counts...]    (default: 20000 200000)
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+import data_import
+
+FIRST_NAMES = ['Juan', 'María', 'José', 'Ana', 'Luis', 'Carmen', 'Pedro', 'Lucía', 'Javier', 'Marta']
+SURNAMES = ['García', 'López', 'Martínez', 'Sánchez', 'Pérez', 'Gómez', 'Fernández', 'Ruiz', 'Díaz', 'Moreno']
+N_CENTERS = 2000
+N_RESPONDENTS = 3000
+
+
+def build_sources(n_employees, rng):
+    """Synthetic employee, work center and survey frames."""
+    df_emp = pd.DataFrame({
+        'PK_EMPL': np.arange(1, n_employees + 1),
+        'FK_CENTRO': rng.integers(1, N_CENTERS + 1, n_employees).astype(float),
+        'NOMBRE_EMPLEADO': rng.choice(FIRST_NAMES, n_employees),
+        'APELLIDO1_EMPLEADO': rng.choice(SURNAMES, n_employees),
+        # About one surname in three is shared with another employee of the same name
+        'APELLIDO2_EMPLEADO': [f'{surname}{number}' for surname, number in
+                               zip(rng.choice(SURNAMES, n_employees), rng.integers(0, n_employees // 3, n_employees))],
+    })
+    df_emp.loc[rng.random(n_employees) < 0.05, 'FK_CENTRO'] = -1
+    df_emp.loc[rng.random(n_employees) < 0.02, 'FK_CENTRO'] = np.nan
+
+    df_wc = pd.DataFrame({'PK_CENTRO': np.arange(1, N_CENTERS + 1)})
+    for level in ('CENTRO_GES', 'DAN', 'DG', 'DT', 'RED'):
+        if level != 'CENTRO_GES':
+            df_wc[f'COD_{level}'] = rng.integers(1, 50, N_CENTERS)
+        df_wc[f'DES_{level}'] = [f'{level} {value}' for value in rng.integers(1, 50, N_CENTERS)]
+    duplicated_centers = df_wc.sample(20, random_state=0).assign(DES_CENTRO_GES=np.nan)
+    df_wc = pd.concat([df_wc, duplicated_centers], ignore_index=True)
+
+    respondents = df_emp.sample(N_RESPONDENTS, random_state=1)
+    df = pd.DataFrame({
+        'id': np.arange(1, N_RESPONDENTS + 1),
+        'name': (respondents['NOMBRE_EMPLEADO'] + ' ' + respondents['APELLIDO1_EMPLEADO'] + ' '
+                 + respondents['APELLIDO2_EMPLEADO']).to_numpy(),
+    })
+    for col in data_import.COLUMN_MAPPING.values():
+        df[col] = np.nan
+    return df, df_emp, df_wc
+
+
+def legacy_enrich(df, df_emp, df_wc):
+    """The exact-join pipeline before vectorization, for comparison."""
+    df_emp['full_name'] = df_emp.apply(
+        lambda row: ' '.join(str(part).strip() for part in
+                             (row.get('NOMBRE_EMPLEADO'), row.get('APELLIDO1_EMPLEADO'), row.get('APELLIDO2_EMPLEADO'))
+                             if pd.notna(part) and str(part).strip()),
+        axis=1
+    )
+    df_enriched = df.copy().reset_index(drop=True)
+    original_row_count = len(df_enriched)
+    df_enriched = df_enriched.merge(df_emp[['full_name', 'PK_EMPL', 'FK_CENTRO']], left_on='name',
+                                    right_on='full_name', how='left', suffixes=('', '_emp')).reset_index(drop=True)
+    if len(df_enriched) > original_row_count:
+        def select_best_match(group):
+            valid_fk = group[group['FK_CENTRO'].notna() & (group['FK_CENTRO'] != -1)]
+            return valid_fk.iloc[0] if len(valid_fk) > 0 else group.iloc[0]
+        df_enriched = df_enriched.groupby('id', as_index=False).apply(select_best_match).reset_index(drop=True)
+
+    df_enriched = df_enriched.merge(df_wc, left_on='FK_CENTRO', right_on='PK_CENTRO',
+                                    how='left', suffixes=('', '_wc')).reset_index(drop=True)
+    if len(df_enriched) > original_row_count:
+        def select_best_wc_match(group):
+            valid_wc = group[group['DES_CENTRO_GES'].notna()]
+            return valid_wc.iloc[0] if len(valid_wc) > 0 else group.iloc[0]
+        df_enriched = df_enriched.groupby('id', as_index=False).apply(select_best_wc_match).reset_index(drop=True)
+
+    for source_col, target_col in data_import.COLUMN_MAPPING.items():
+        if source_col in df_enriched.columns:
+            mask = df_enriched[target_col].isna()
+            df_enriched.loc[mask, target_col] = df_enriched.loc[mask, source_col]
+    return df_enriched
+
+
+def same_matches(legacy, enriched):
+    """True when both pipelines kept the same employee and work center for every record."""
+    legacy = legacy.fillna({'pk_empl': -1, 'fk_centro': -1, 'des_centro_ges': 'not found'})
+    return (legacy['id'].tolist() == enriched['id'].tolist()
+            and (legacy['pk_empl'].astype(float) == enriched['pk_empl'].astype(float)).all()
+            and (legacy['fk_centro'].astype(float) == enriched['fk_centro'].astype(float)).all()
+            and (legacy['des_centro_ges'].astype(str) == enriched['des_centro_ges'].astype(str)).all())
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [20000, 200000]
+    rng = np.random.default_rng(42)
+
+    print(f"{'employees':>10} {'legacy s':>9} {'enrich s':>9} {'exact s':>8} {'approx s':>9} {'speedup':>8} {'same':>5}")
+    for n_employees in sizes:
+        df, df_emp, df_wc = build_sources(n_employees, rng)
+
+        start = time.perf_counter()
+        legacy = legacy_enrich(df, df_emp.copy(), df_wc)
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = data_import.enrich(df, df_emp.copy(), df_wc)
+        enrich_seconds = time.perf_counter() - start
+
+        stage_seconds = {stage: seconds for stage, _, seconds in result['stages']}
+        same = same_matches(legacy, result['df_enriched'])
+        print(f"{n_employees:>10} {legacy_seconds:>9.2f} {enrich_seconds:>9.2f} {stage_seconds['Exact join']:>8.2f} "
+              f"{stage_seconds['Approximate join']:>9.2f} {legacy_seconds / enrich_seconds:>7.1f}x {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
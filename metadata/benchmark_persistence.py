@@ -0,0 +1,78 @@
+"""
+Benchmark for the change-set engine in persistence.py.
+
+Builds synthetic master dataframes from excel_interpreter_spec, edits 1% of the cells,
+deletes 0.1% of the rows and appends 0.1% new ones, then times compute_changes and
+apply_to_frame. Time per record should stay flat as the record count grows.
+
+Usage:
+    python benchmark_persistence.py [record counts...]    (default: 1000 10000 100000)
+"""
+import sys
+import config_paths
+import time
+import numpy as np
+import pandas as pd
+import persistence
+import master_store
+
+
+def build_frame(config, n_records, rng):
+    """Synthetic master dataframe with the column types used by the app."""
+    data = {}
+    for column_id, sql_type in master_store.column_types(config).items():
+        if column_id == 'id':
+            data[column_id] = np.arange(1, n_records + 1)
+        elif sql_type == 'INTEGER':
+            data[column_id] = rng.integers(0, 2, n_records)
+        elif sql_type == 'TIMESTAMP':
+            data[column_id] = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, n_records), unit='D')
+        else:
+            data[column_id] = pd.Series(rng.integers(0, 50, n_records)).map(lambda value: f'{column_id} {value}')
+    return pd.DataFrame(data)
+
+
+def edit_frame(df, rng):
+    """Copy of df with 1% of cells changed, 0.1% of rows deleted and 0.1% appended."""
+    edited = df.copy()
+    columns = [col for col in df.columns if col != 'id']
+    n_edits = max(1, df.size // 100)
+    rows = rng.integers(0, len(df), n_edits)
+    cols = rng.integers(0, len(columns), n_edits)
+    for col_pos in np.unique(cols):
+        col = columns[col_pos]
+        target = rows[cols == col_pos]
+        edited.loc[target, col] = df[col].iloc[rng.integers(0, len(df), len(target))].to_numpy()
+
+    n_rows = max(1, len(df) // 1000)
+    edited = edited.drop(index=rng.choice(df.index, n_rows, replace=False))
+    new_rows = df.sample(n_rows, random_state=0).copy()
+    new_rows['id'] = np.arange(len(df) + 1, len(df) + 1 + n_rows)
+    return pd.concat([edited, new_rows], ignore_index=True)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    config = config_paths.load_config('config.json')
+    rng = np.random.default_rng(42)
+
+    print(f"{'records':>10} {'changes':>10} {'diff s':>9} {'apply s':>9} {'µs/record':>10}")
+    for n_records in sizes:
+        df = build_frame(config, n_records, rng)
+        edited = edit_frame(df, rng)
+
+        start = time.perf_counter()
+        changes = persistence.compute_changes(df, edited, config)
+        diff_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        persistence.apply_to_frame(df.copy(), changes, config)
+        apply_seconds = time.perf_counter() - start
+
+        n_changes = len(changes['updates']) + len(changes['inserts']) + len(changes['deletes'])
+        per_record = (diff_seconds + apply_seconds) / n_records * 1e6
+        print(f"{n_records:>10} {n_changes:>10} {diff_seconds:>9.3f} {apply_seconds:>9.3f} {per_record:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
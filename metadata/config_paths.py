@@ -0,0 +1,24 @@
+import json
+import os
+
+# Key added to the loaded config: folder of the config.json it was read from
+CONFIG_DIR_KEY = 'config_dir'
+
+
+def load_config(path='config.json'):
+    """Read config.json, remembering its folder so relative paths in it resolve there."""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config[CONFIG_DIR_KEY] = os.path.dirname(os.path.abspath(path))
+    return config
+
+
+def resolve(config, path):
+    """
+    Absolute form of a file or folder path from config.json.
+
+    Relative paths are taken from the folder config.json was read from (the working
+    folder when the config was not loaded with load_config), whatever the current
+    working folder is when the path is used.
+    """
+    return os.path.abspath(os.path.join(config.get(CONFIG_DIR_KEY, os.getcwd()), path))
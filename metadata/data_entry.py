@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
 import json
-from fuzzywuzzy import fuzz
-from fuzzywuzzy import process
+import persistence
+import schema
+import filter_index
+import name_index
 
 
 # Field configuration
@@ -30,6 +32,9 @@ def validate_field(field_name, value, dtype, is_required=False):
     """Validate a single field value."""
     if is_required and (not value or (isinstance(value, str) and value.strip() == "")):
         return f"Field '{field_name}' is required and cannot be empty."
+    if isinstance(dtype, pd.CategoricalDtype):
+        # Validate against the type of the category values
+        dtype = dtype.categories.dtype
     if value and not isinstance(value, bool):
         try:
             dtype.type(value)
@@ -41,7 +46,7 @@ def validate_field(field_name, value, dtype, is_required=False):
 def render_form_field(field, value, key_prefix, df, field_config):
     """Render a single form field based on its type."""
     if field in field_config['indicators']:
-        checked = bool(value == 1 or value == '1')
+        checked = schema.is_flag_set(value)
         return st.checkbox(field, value=checked, key=f"{key_prefix}_{field}")
     elif df[field].dtype == 'datetime64[ns]':
         date_value = pd.to_datetime(value).date() if pd.notna(value) else None
@@ -56,58 +61,8 @@ def render_form_field(field, value, key_prefix, df, field_config):
 
 
 def save_to_excel(df, config):
-    """Save dataframe back to Excel file atomically."""
-    import tempfile
-    import os
-    excel_path = config['excel_path']
-    sheet = config['excel_interpreter_spec']['sheet_name']
-
-    # Load full Excel
-    full_df = pd.read_excel(excel_path, sheet_name=sheet, header=0, engine='openpyxl')
-
-    # Map back to columns
-    column_map = {col_spec['column_id']: col_spec['column'] for col_spec in config['excel_interpreter_spec']['columns'] if col_spec['column_id'] != 'skip'}
-
-    # Find the id column name in full_df
-    id_column = None
-    for col_spec in config['excel_interpreter_spec']['columns']:
-        if col_spec['column_id'] == 'id':
-            id_column = full_df.columns[col_spec['column']]
-            break
-
-    # Keep only rows that exist in df (handle deletes)
-    full_df = full_df[full_df[id_column].isin(df['id'])].reset_index(drop=True)
-
-    # Update existing rows and add new rows
-    for _, row in df.iterrows():
-        row_id = row['id']
-        if row_id in full_df[id_column].values:
-            # Update existing row
-            full_idx = full_df[full_df[id_column] == row_id].index[0]
-            for col_id, value in row.items():
-                if col_id in column_map:
-                    col_idx = column_map[col_id]
-                    full_df.at[full_idx, full_df.columns[col_idx]] = value
-        else:
-            # Add new row
-            new_row = {}
-            for col in full_df.columns:
-                if col == id_column:
-                    new_row[col] = row['id']
-                else:
-                    # Map back from column_id to original column name
-                    col_id = next((cid for cid, cidx in column_map.items() if full_df.columns[cidx] == col), None)
-                    new_row[col] = row.get(col_id) if col_id else None
-            full_df = pd.concat([full_df, pd.DataFrame([new_row])], ignore_index=True)
-
-    # Write to a temporary file first
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', dir=os.path.dirname(excel_path)) as tmp_file:
-        tmp_path = tmp_file.name
-        with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
-            full_df.to_excel(writer, sheet_name=sheet, index=False)
-    
-    # Atomically replace the original file
-    os.replace(tmp_path, excel_path)
+    """Save dataframe back to Excel, patching only the cells that changed."""
+    persistence.save_changes(df, config)
 
 
 def run(df, filters, config):
@@ -123,11 +78,9 @@ def run(df, filters, config):
         st.session_state['last_tab'] = 'data_entry'
     
     # Apply filters
-    filtered_df = df.copy()
-    for col, selected in filters.items():
-        if selected:
-            # Include NaN values to show new records with empty fields
-            filtered_df = filtered_df[filtered_df[col].isin(selected) | filtered_df[col].isna()]
+    # Include NaN values to show new records with empty fields
+    mask = filter_index.get_mask(df, filters, include_missing=True)
+    filtered_df = df[mask]
 
     # Search bar and add button
     col_search, col_add = st.columns([3, 1])
@@ -142,11 +95,8 @@ def run(df, filters, config):
 
     # Fuzzy search
     if search_term:
-        names = filtered_df['name'].dropna().tolist()
-        matches = process.extract(search_term, names, scorer=fuzz.partial_ratio, limit=None)
-        good_matches = [(match[0], match[1]) for match in matches if match[1] >= 70]
+        good_matches = name_index.extract(df, search_term, mask, score_cutoff=70)
         if good_matches:
-            good_matches.sort(key=lambda x: x[1], reverse=True)
             matched_names = [name for name, score in good_matches]
             filtered_df = filtered_df[filtered_df['name'].isin(matched_names)]
             name_to_order = {name: i for i, (name, _) in enumerate(good_matches)}
@@ -220,20 +170,20 @@ def render_edit_section(df, filtered_df, config, field_config, search_term):
     for i, field in enumerate(field_config['regular']):
         col = col1 if i % 2 == 0 else col2
         with col:
-            render_form_field(field, selected_row[field], selected_id, df, field_config)
+            render_form_field(field, selected_row[field], f"de_{selected_id}", df, field_config)
     
     # Indicators in one line
     st.write("Indicators:")
     ind_cols = st.columns(len(field_config['indicators']))
     for i, field in enumerate(field_config['indicators']):
         with ind_cols[i]:
-            checked = bool(selected_row[field] == 1 or selected_row[field] == '1')
-            st.checkbox(field, value=checked, key=f"{selected_id}_{field}")
+            checked = schema.is_flag_set(selected_row[field])
+            st.checkbox(field, value=checked, key=f"de_{selected_id}_{field}")
     
     # URL field in full line, clickable
     if 'url_1to1' in df.columns:
         url_value = str(selected_row['url_1to1']) if pd.notna(selected_row['url_1to1']) else ""
-        st.text_input("url_1to1", value=url_value, key=f"{selected_id}_url_1to1")
+        st.text_input("url_1to1", value=url_value, key=f"de_{selected_id}_url_1to1")
         if url_value:
             st.markdown(f"[open link]({url_value})")
 
@@ -326,9 +276,10 @@ def render_add_section(df, config, field_config):
                         # Convert date to pandas datetime
                         new_row[field] = pd.to_datetime(inputs[field]) if inputs[field] else pd.NaT
                     else:
-                        new_row[field] = inputs[field]
+                        new_row[field] = schema.coerce_value(df, field, inputs[field])
                 
                 df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+                df = schema.apply_dtypes(df, config)
                 save_to_excel(df, config)
                 st.session_state['df'] = df
                 st.session_state.pop('adding_new', None)
@@ -343,12 +294,12 @@ def check_changes(selected_row, selected_id, field_config):
     """Check if any field has been modified."""
     all_fields = field_config['all'] + (['url_1to1'] if 'url_1to1' not in field_config['all'] else [])
     for field in all_fields:
-        key = f"{selected_id}_{field}"
+        key = f"de_{selected_id}_{field}"
         if key in st.session_state:
             current_session_value = st.session_state[key]
             original_value = selected_row[field]
             if field in field_config['indicators']:
-                original_bool = bool(original_value == 1 or original_value == '1')
+                original_bool = schema.is_flag_set(original_value)
                 if current_session_value != original_bool:
                     return True
             else:
@@ -365,7 +316,7 @@ def save_record_changes(df, selected_row, selected_id, field_config, config):
     
     # Validate all values before updating
     for field in all_fields:
-        key = f"{selected_id}_{field}"
+        key = f"de_{selected_id}_{field}"
         if key in st.session_state:
             new_value = st.session_state[key]
             if field not in field_config['indicators']:
@@ -381,7 +332,7 @@ def save_record_changes(df, selected_row, selected_id, field_config, config):
     # Update df with all current values
     idx = df[df['id'] == selected_id].index[0]
     for field in all_fields:
-        key = f"{selected_id}_{field}"
+        key = f"de_{selected_id}_{field}"
         if key in st.session_state:
             new_value = st.session_state[key]
             if field in field_config['indicators']:
@@ -389,6 +340,9 @@ def save_record_changes(df, selected_row, selected_id, field_config, config):
             elif df[field].dtype == 'datetime64[ns]':
                 # Convert date to pandas datetime
                 new_value = pd.to_datetime(new_value) if new_value else pd.NaT
+            else:
+                new_value = schema.coerce_value(df, field, new_value)
+            schema.add_categories(df, field, [new_value])
             df.at[idx, field] = new_value
     
     save_to_excel(df, config)
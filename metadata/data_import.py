@@ -1,10 +1,36 @@
 import streamlit as st
 import pandas as pd
 import logging
-import os
+import time
+import persistence
+import schema
+import normalization
+import name_index
+import reference_data
 
 logger = logging.getLogger(__name__)
 
+# Minimum fuzz.ratio score for matching a survey name to an employee the exact join missed
+APPROXIMATE_MATCH_THRESHOLD = 85
+
+# Employee / work center columns -> survey target columns
+COLUMN_MAPPING = {
+    'PK_EMPL': 'pk_empl',
+    'FK_CENTRO': 'fk_centro',
+    'DES_CENTRO_GES': 'des_centro_ges',
+    'COD_DAN': 'cod_dan',
+    'DES_DAN': 'des_dan',
+    'COD_DG': 'cod_dg',
+    'DES_DG': 'des_dg',
+    'COD_DT': 'cod_dt',
+    'DES_DT': 'des_dt',
+    'COD_RED': 'cod_red',
+    'DES_RED': 'des_red'
+}
+# Defaults for target columns still empty after enrichment
+NUMERIC_TARGET_COLUMNS = ['pk_empl', 'fk_centro', 'cod_dan', 'cod_dg', 'cod_dt', 'cod_red']
+TEXT_TARGET_COLUMNS = ['des_centro_ges', 'des_dan', 'des_dg', 'des_dt', 'des_red']
+
 
 def run(df, filters, config):
     """
@@ -32,8 +58,8 @@ def run(df, filters, config):
         return
     
     # Build file paths
-    emp_path = os.path.join(emp_config.get('path', ''), emp_config.get('file', ''))
-    wc_path = os.path.join(wc_config.get('path', ''), wc_config.get('file', ''))
+    emp_path = reference_data.get_source_path(emp_config)
+    wc_path = reference_data.get_source_path(wc_config)
     
     st.info(f"ℹ️ **Employee Source**: `{emp_path}`")
     st.info(f"ℹ️ **Work Center Source**: `{wc_path}`")
@@ -64,17 +90,12 @@ def run(df, filters, config):
     if st.button("🔍 Load and Enrich Data"):
         with st.spinner("Loading employee and work center data..."):
             try:
-                # Load employee data (semicolon separator)
-                df_emp = pd.read_csv(emp_path, sep=';', encoding='utf-8')
-                emp_keep_cols = emp_config.get('keep', [])
-                df_emp = df_emp[emp_keep_cols]
+                # Read once per CSV change and shared across sessions (see reference_data)
+                df_emp = reference_data.load_employees(config)
                 
                 st.success(f"✅ Loaded {len(df_emp)} employee records")
                 
-                # Load work center data (comma separator)
-                df_wc = pd.read_csv(wc_path, sep=',', encoding='utf-8')
-                wc_keep_cols = wc_config.get('keep', [])
-                df_wc = df_wc[wc_keep_cols]
+                df_wc = reference_data.load_workcenters(config)
                 
                 st.success(f"✅ Loaded {len(df_wc)} work center records")
                 
@@ -88,132 +109,21 @@ def run(df, filters, config):
         
         with st.spinner("Processing data enrichment..."):
             try:
-                # Create concatenated name in employee table
-                df_emp['full_name'] = df_emp.apply(
-                    lambda row: concatenate_name(
-                        row.get('NOMBRE_EMPLEADO'),
-                        row.get('APELLIDO1_EMPLEADO'),
-                        row.get('APELLIDO2_EMPLEADO')
-                    ),
-                    axis=1
-                )
-                
-                # Create a copy of base df for enrichment
-                df_enriched = df.copy().reset_index(drop=True)
-                
-                # Store original row count
-                original_row_count = len(df_enriched)
-                
-                # Match base table with employee data on NAME field
-                df_enriched = df_enriched.merge(
-                    df_emp[['full_name', 'PK_EMPL', 'FK_CENTRO']],
-                    left_on='name',
-                    right_on='full_name',
-                    how='left',
-                    suffixes=('', '_emp')
-                ).reset_index(drop=True)
-                
-                # Check for duplicates after first merge
-                duplicates_emp = []
-                if len(df_enriched) > original_row_count:
-                    # Find duplicate IDs
-                    duplicate_ids = df_enriched[df_enriched.duplicated(subset=['id'], keep=False)]['id'].unique()
-                    duplicates_emp = df_enriched[df_enriched['id'].isin(duplicate_ids)][['id', 'name', 'PK_EMPL', 'FK_CENTRO']].sort_values('id')
-                    
-                    # For duplicates, prioritize records with valid FK_CENTRO (not null and not -1)
-                    def select_best_match(group):
-                        # First, try to get rows with valid FK_CENTRO
-                        valid_fk = group[group['FK_CENTRO'].notna() & (group['FK_CENTRO'] != -1)]
-                        if len(valid_fk) > 0:
-                            return valid_fk.iloc[0]
-                        # Otherwise, return first row
-                        return group.iloc[0]
-                    
-                    # Group by ID and select best match for each
-                    df_enriched = df_enriched.groupby('id', as_index=False).apply(select_best_match).reset_index(drop=True)
-                
-                # Join with work center data
-                df_enriched = df_enriched.merge(
-                    df_wc,
-                    left_on='FK_CENTRO',
-                    right_on='PK_CENTRO',
-                    how='left',
-                    suffixes=('', '_wc')
-                ).reset_index(drop=True)
-                
-                # Check for duplicates after second merge
-                duplicates_wc = []
-                if len(df_enriched) > original_row_count:
-                    duplicate_ids = df_enriched[df_enriched.duplicated(subset=['id'], keep=False)]['id'].unique()
-                    duplicates_wc = df_enriched[df_enriched['id'].isin(duplicate_ids)][['id', 'name', 'FK_CENTRO', 'PK_CENTRO']].sort_values('id')
-                    
-                    # For duplicates, prioritize records with non-null work center data
-                    def select_best_wc_match(group):
-                        # Try to get rows with non-null DES_CENTRO_GES
-                        valid_wc = group[group['DES_CENTRO_GES'].notna()]
-                        if len(valid_wc) > 0:
-                            return valid_wc.iloc[0]
-                        return group.iloc[0]
-                    
-                    df_enriched = df_enriched.groupby('id', as_index=False).apply(select_best_wc_match).reset_index(drop=True)
+                result = enrich(df, df_emp, df_wc)
+                df_enriched = result['df_enriched']
+                approximate = result['approximate']
                 
-                # Store duplicate info in session state
-                if len(duplicates_emp) > 0:
-                    st.session_state['duplicates_emp'] = duplicates_emp
-                if len(duplicates_wc) > 0:
-                    st.session_state['duplicates_wc'] = duplicates_wc
-                
-                # Update target columns in base df with enriched data
-                # Columns 27-37 mapping
-                column_mapping = {
-                    'PK_EMPL': 'pk_empl',
-                    'FK_CENTRO': 'fk_centro',
-                    'DES_CENTRO_GES': 'des_centro_ges',
-                    'COD_DAN': 'cod_dan',
-                    'DES_DAN': 'des_dan',
-                    'COD_DG': 'cod_dg',
-                    'DES_DG': 'des_dg',
-                    'COD_DT': 'cod_dt',
-                    'DES_DT': 'des_dt',
-                    'COD_RED': 'cod_red',
-                    'DES_RED': 'des_red'
-                }
-                
-                # Count unique records that have at least one null in target columns
-                target_cols_list = list(column_mapping.values())
-                existing_target_cols = [col for col in target_cols_list if col in df.columns]
-                if existing_target_cols:
-                    records_updated = df[existing_target_cols].isna().any(axis=1).sum()
-                else:
-                    records_updated = len(df)
-                
-                # Map source columns to target columns - populate or update
-                for source_col, target_col in column_mapping.items():
-                    if source_col in df_enriched.columns:
-                        # If target column exists and has nulls, fill from source
-                        if target_col in df_enriched.columns:
-                            # Fill nulls in target with values from source
-                            mask = df_enriched[target_col].isna()
-                            df_enriched.loc[mask, target_col] = df_enriched.loc[mask, source_col]
-                        else:
-                            # Create target column from source
-                            df_enriched[target_col] = df_enriched[source_col]
-                
-                # Apply default values for remaining nulls
-                numeric_cols = ['pk_empl', 'fk_centro', 'cod_dan', 'cod_dg', 'cod_dt', 'cod_red']
-                text_cols = ['des_centro_ges', 'des_dan', 'des_dg', 'des_dt', 'des_red']
-                
-                for col in numeric_cols:
-                    if col in df_enriched.columns:
-                        df_enriched[col] = df_enriched[col].fillna(-1).astype(int)
-                
-                for col in text_cols:
-                    if col in df_enriched.columns:
-                        df_enriched[col] = df_enriched[col].fillna("not found")
+                # Store join stats and duplicate info in session state
+                st.session_state['join_stages'] = result['stages']
+                st.session_state['approximate_matches'] = approximate[['name', 'full_name', 'match_score', 'PK_EMPL']]
+                if len(result['duplicates_emp']) > 0:
+                    st.session_state['duplicates_emp'] = result['duplicates_emp']
+                if len(result['duplicates_wc']) > 0:
+                    st.session_state['duplicates_wc'] = result['duplicates_wc']
                 
                 # Store in session state
                 st.session_state['df_enriched'] = df_enriched
-                st.session_state['records_updated'] = records_updated
+                st.session_state['records_updated'] = result['records_updated']
                 st.session_state['total_records'] = len(df_enriched)
                 
                 st.success(f"✅ Data enrichment completed!")
@@ -243,6 +153,15 @@ def run(df, filters, config):
         st.markdown("### Sample of Enriched Data (First 10 rows)")
         st.dataframe(df_enriched[available_display_cols].head(10), height=300)
         
+        if 'join_stages' in st.session_state:
+            st.markdown("### Employee Matching")
+            for stage, matched_count, seconds in st.session_state['join_stages']:
+                st.markdown(f"- **{stage}**: {matched_count} records matched in {seconds:.2f}s")
+            approximate = st.session_state['approximate_matches']
+            if len(approximate) > 0:
+                st.info(f"ℹ️ {len(approximate)} records matched by similar name (score ≥ {APPROXIMATE_MATCH_THRESHOLD}); please review:")
+                st.dataframe(approximate.rename(columns={'full_name': 'employee name', 'match_score': 'score'}), height=200)
+        
         # Show duplicate warnings if any
         if 'duplicates_emp' in st.session_state:
             duplicates_emp = st.session_state['duplicates_emp']
@@ -276,7 +195,7 @@ def run(df, filters, config):
                     if success:
                         st.success(f"✅ Successfully updated {records_updated} records!")
                         # Update session state
-                        st.session_state['df'] = df_enriched
+                        st.session_state['df'] = schema.apply_dtypes(df_enriched, config)
                         # Clear enrichment session state
                         del st.session_state['df_enriched']
                         del st.session_state['records_updated']
@@ -285,6 +204,8 @@ def run(df, filters, config):
                             del st.session_state['duplicates_emp']
                         if 'duplicates_wc' in st.session_state:
                             del st.session_state['duplicates_wc']
+                        st.session_state.pop('join_stages', None)
+                        st.session_state.pop('approximate_matches', None)
                         st.balloons()
                         st.rerun()
         with col2:
@@ -297,71 +218,217 @@ def run(df, filters, config):
                     del st.session_state['duplicates_emp']
                 if 'duplicates_wc' in st.session_state:
                     del st.session_state['duplicates_wc']
+                st.session_state.pop('join_stages', None)
+                st.session_state.pop('approximate_matches', None)
                 st.info("Enrichment cancelled")
                 st.rerun()
 
 
+def enrich(df, df_emp, df_wc):
+    """
+    Add employee and work center information to the survey records.
+
+    Survey names are joined to employee full names (normalized), names left unmatched
+    get an approximate match, and work center data is joined on FK_CENTRO. Where a record
+    matches several employees or work centers, one row is kept per id. Missing target
+    columns are then filled from the joined data and defaulted (-1 / "not found").
+
+    Args:
+        df: Survey master dataframe
+        df_emp: Employee table (not modified)
+        df_wc: Work center table
+
+    Returns:
+        dict with:
+            'df_enriched': Enriched dataframe, one row per survey record
+            'duplicates_emp', 'duplicates_wc': Records with several employee / work center matches
+            'approximate': Approximate matches (see approximate_employee_matches), with the survey 'name'
+            'records_updated': Records that had empty target columns
+            'stages': [(stage, records matched, seconds)] for the exact and approximate joins
+    """
+    # Create concatenated name in employee table (on a copy: the reference data is shared)
+    full_name = concatenate_name(
+        df_emp.get('NOMBRE_EMPLEADO'),
+        df_emp.get('APELLIDO1_EMPLEADO'),
+        df_emp.get('APELLIDO2_EMPLEADO')
+    )
+    # Join key ignoring case, accents and spacing
+    df_emp = df_emp.assign(full_name=full_name, name_key=normalization.normalize_names(full_name))
+
+    df_enriched = df.copy().reset_index(drop=True)
+    original_row_count = len(df_enriched)
+
+    # Match base table with employee data on NAME field
+    stage_start = time.perf_counter()
+    df_enriched = df_enriched.assign(name_key=normalization.normalize_names(df_enriched['name'])).merge(
+        df_emp.loc[df_emp['name_key'] != '', ['full_name', 'name_key', 'PK_EMPL', 'FK_CENTRO']],
+        on='name_key',
+        how='left',
+        suffixes=('', '_emp')
+    ).drop(columns='name_key')
+
+    # For duplicates, prioritize records with valid FK_CENTRO (not null and not -1)
+    duplicates_emp = []
+    if len(df_enriched) > original_row_count:
+        duplicated = df_enriched.duplicated(subset=['id'], keep=False)
+        duplicates_emp = df_enriched.loc[duplicated, ['id', 'name', 'PK_EMPL', 'FK_CENTRO']].sort_values('id', kind='stable')
+        valid_fk = df_enriched['FK_CENTRO'].notna() & (df_enriched['FK_CENTRO'] != -1)
+        df_enriched = keep_best_match(df_enriched, valid_fk)
+
+    exact_seconds = time.perf_counter() - stage_start
+    exact_matched = int(df_enriched['PK_EMPL'].notna().sum())
+
+    # Approximate join for names the exact join missed
+    stage_start = time.perf_counter()
+    unmatched = df_enriched['PK_EMPL'].isna() & df_enriched['name'].notna()
+    approximate = approximate_employee_matches(df_enriched.loc[unmatched, 'name'], df_emp)
+    df_enriched.loc[approximate.index, ['full_name', 'PK_EMPL', 'FK_CENTRO']] = approximate[['full_name', 'PK_EMPL', 'FK_CENTRO']]
+    approximate.insert(0, 'name', df_enriched.loc[approximate.index, 'name'])
+    approximate_seconds = time.perf_counter() - stage_start
+    logger.info(f"✅ Employee join: exact {exact_matched} matched in {exact_seconds:.2f}s, "
+                f"approximate {len(approximate)} of {int(unmatched.sum())} remaining in {approximate_seconds:.2f}s")
+
+    # Join with work center data
+    df_enriched = df_enriched.merge(
+        df_wc,
+        left_on='FK_CENTRO',
+        right_on='PK_CENTRO',
+        how='left',
+        suffixes=('', '_wc')
+    )
+
+    # For duplicates, prioritize records with non-null work center data
+    duplicates_wc = []
+    if len(df_enriched) > original_row_count:
+        duplicated = df_enriched.duplicated(subset=['id'], keep=False)
+        duplicates_wc = df_enriched.loc[duplicated, ['id', 'name', 'FK_CENTRO', 'PK_CENTRO']].sort_values('id', kind='stable')
+        df_enriched = keep_best_match(df_enriched, df_enriched['DES_CENTRO_GES'].notna())
+
+    # Count unique records that have at least one null in target columns
+    existing_target_cols = [col for col in COLUMN_MAPPING.values() if col in df.columns]
+    if existing_target_cols:
+        records_updated = df[existing_target_cols].isna().any(axis=1).sum()
+    else:
+        records_updated = len(df)
+
+    # Map source columns to target columns: fill nulls of existing targets, create the others
+    sources = df_enriched[[col for col in COLUMN_MAPPING if col in df_enriched.columns]].rename(columns=COLUMN_MAPPING)
+    to_fill = [col for col in sources.columns if col in df_enriched.columns]
+    for col in to_fill:
+        schema.add_categories(df_enriched, col, sources.loc[df_enriched[col].isna(), col])
+    df_enriched[to_fill] = df_enriched[to_fill].fillna(sources[to_fill])
+    to_create = [col for col in sources.columns if col not in df_enriched.columns]
+    df_enriched[to_create] = sources[to_create]
+
+    # Apply default values for remaining nulls
+    for col in NUMERIC_TARGET_COLUMNS:
+        if col in df_enriched.columns:
+            schema.add_categories(df_enriched, col, [-1])
+            df_enriched[col] = df_enriched[col].fillna(-1).astype(int)
+
+    for col in TEXT_TARGET_COLUMNS:
+        if col in df_enriched.columns:
+            schema.add_categories(df_enriched, col, ["not found"])
+            df_enriched[col] = df_enriched[col].fillna("not found")
+
+    return {
+        'df_enriched': df_enriched,
+        'duplicates_emp': duplicates_emp,
+        'duplicates_wc': duplicates_wc,
+        'approximate': approximate,
+        'records_updated': records_updated,
+        'stages': [
+            ('Exact join', exact_matched, exact_seconds),
+            ('Approximate join', len(approximate), approximate_seconds),
+        ],
+    }
+
+
+def keep_best_match(df, preferred):
+    """
+    One row per id: its first preferred row, or its first row when none is preferred.
+
+    Rows come out sorted by id, as groupby('id') would return them.
+    """
+    return (df.assign(_fallback=~preferred.fillna(False).astype(bool))
+              .sort_values(['id', '_fallback'], kind='stable')
+              .drop_duplicates(subset=['id'])
+              .drop(columns='_fallback')
+              .reset_index(drop=True))
+
+
+def approximate_employee_matches(names, df_emp, score_cutoff=APPROXIMATE_MATCH_THRESHOLD):
+    """
+    Best employee for each survey name the exact join missed, by fuzzy name similarity.
+
+    Employees are indexed by the words of their normalized surnames, and a name is only
+    scored against employees sharing one of its words, so the cost follows the size of
+    those blocks rather than the directory. Among employees with the same name, one with
+    a valid FK_CENTRO is preferred, as for exact matches.
+
+    Args:
+        names: Survey names to match, indexed like the enriched dataframe
+        df_emp: Employee table with 'full_name' and 'name_key' (see run)
+        score_cutoff: Minimum fuzz.ratio score
+
+    Returns:
+        DataFrame indexed like names (matched names only) with full_name, PK_EMPL, FK_CENTRO, match_score
+    """
+    columns = ['full_name', 'PK_EMPL', 'FK_CENTRO', 'match_score']
+    if len(names) == 0:
+        return pd.DataFrame(columns=columns)
+
+    # One employee per distinct name, preferring a valid work center
+    invalid_fk = df_emp['FK_CENTRO'].isna() | (df_emp['FK_CENTRO'] == -1)
+    employees = df_emp[df_emp['name_key'] != ''].assign(_invalid_fk=invalid_fk).sort_values('_invalid_fk', kind='stable')
+    employees = employees.drop_duplicates(subset=['name_key']).reset_index(drop=True)
+
+    surname_columns = [col for col in ('APELLIDO1_EMPLEADO', 'APELLIDO2_EMPLEADO') if col in employees.columns]
+    surnames = pd.concat([normalization.normalize_names(employees[col]) for col in surname_columns] or [employees['name_key']])
+    words = surnames.str.split().explode().dropna()
+    words = words[words != '']
+    blocks = pd.Series(words.index.to_numpy()).groupby(words.to_numpy()).unique().to_dict()
+
+    best = name_index.extract_best(names.tolist(), employees['name_key'].tolist(), score_cutoff, blocks=blocks)
+    position = {key: i for i, key in enumerate(employees['name_key'])}
+    matched = [(label, match) for label, match in zip(names.index, best) if match is not None]
+    rows = employees.iloc[[position[key] for _, (key, _) in matched]]
+    return pd.DataFrame({
+        'full_name': rows['full_name'].to_numpy(),
+        'PK_EMPL': rows['PK_EMPL'].to_numpy(),
+        'FK_CENTRO': rows['FK_CENTRO'].to_numpy(),
+        'match_score': [score for _, (_, score) in matched],
+    }, index=pd.Index([label for label, _ in matched]), columns=columns)
+
+
 def concatenate_name(first_name, last_name1, last_name2):
     """
-    Concatenate employee names with single spaces, avoiding double spaces.
+    Concatenate employee name columns with single spaces, avoiding double spaces.
     Trim trailing spaces if second last name is missing.
+
+    Args:
+        first_name, last_name1, last_name2: Name part columns (None for a missing column)
+
+    Returns:
+        Series of full names
     """
-    parts = []
-    
-    if pd.notna(first_name) and str(first_name).strip():
-        parts.append(str(first_name).strip())
-    
-    if pd.notna(last_name1) and str(last_name1).strip():
-        parts.append(str(last_name1).strip())
-    
-    if pd.notna(last_name2) and str(last_name2).strip():
-        parts.append(str(last_name2).strip())
-    
-    return ' '.join(parts)
+    parts = [part for part in (first_name, last_name1, last_name2) if part is not None]
+    full_name = pd.Series('', index=parts[0].index if parts else None, dtype=object)
+    for part in parts:
+        part = part.astype(str).str.strip().where(part.notna(), '')
+        joined = full_name + ' ' + part
+        full_name = joined.where((full_name != '') & (part != ''), full_name + part)
+    return full_name
 
 
 def save_enriched_data(df_enriched, config):
     """
     Save enriched data back to Excel file.
-    Uses atomic write pattern (temp file + replace).
+    Only cells that changed are patched; uses atomic write pattern (temp file + replace).
     """
-    import tempfile
-    import os
-    
     try:
-        excel_path = config['excel_path']
-        sheet = config['excel_interpreter_spec']['sheet_name']
-        excel_spec = config['excel_interpreter_spec']
-        
-        # Load full Excel with header
-        full_df = pd.read_excel(excel_path, sheet_name=sheet, header=0, engine='openpyxl')
-        
-        # Get column mapping from config (column_id -> column index)
-        column_id_to_index = {col['column_id']: col['column'] for col in excel_spec['columns'] if col['column_id'] != 'skip'}
-        
-        # Get list of column_ids that we should update
-        expected_column_ids = list(column_id_to_index.keys())
-        
-        # Only update columns that exist in both df_enriched and the config
-        for col_id in expected_column_ids:
-            if col_id in df_enriched.columns:
-                col_index = column_id_to_index[col_id]
-                if col_index < len(full_df.columns):
-                    # Ensure same length
-                    if len(df_enriched) == len(full_df):
-                        full_df.iloc[:, col_index] = df_enriched[col_id].values
-                    else:
-                        st.error(f"⚠️ Row count mismatch: enriched={len(df_enriched)}, original={len(full_df)}")
-                        return False
-        
-        # Write to temporary file first (atomic write)
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', dir=os.path.dirname(excel_path)) as tmp_file:
-            tmp_path = tmp_file.name
-            with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
-                full_df.to_excel(writer, sheet_name=sheet, index=False)
-        
-        # Atomically replace the original file
-        os.replace(tmp_path, excel_path)
+        # Enrichment never removes records, so ids are matched but never deleted
+        persistence.save_changes(df_enriched, config, allow_deletes=False)
         
         logger.info(f"✅ Saved enriched data successfully")
         return True
@@ -1,6 +1,11 @@
 import streamlit as st
 import pandas as pd
 import logging
+import persistence
+import schema
+import sync_rules
+import source_watermark
+import workbook_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -10,7 +15,8 @@ def run(df, filters, config):
     Data Sync Module: Syncs new records from source Excel to main Excel.
     
     Process:
-    1. Read source Excel using source_path and source_path_spec
+    1. Read source Excel using source_path and source_path_spec (only the rows added
+       since the last sync when config.json has a source_watermark entry)
     2. Compare IDs to find new records (in source but not in main Excel)
     3. Display preview and ask for confirmation
     4. On confirmation: insert new records, apply replicate rules, convert binary_check fields
@@ -50,18 +56,18 @@ def run(df, filters, config):
     if st.button("🔍 Load and Compare Data"):
         with st.spinner("Loading source data..."):
             try:
-                # Read source Excel - use numeric column indexes directly
-                df_source = pd.read_excel(
-                    source_path, 
-                    sheet_name=source_sheet, 
-                    header=None, 
-                    usecols=source_columns, 
-                    skiprows=1, 
-                    engine='openpyxl'
-                )
-                df_source.columns = [str(i) for i in source_columns[:len(df_source.columns)]]
-                
-                st.success(f"✅ Loaded {len(df_source)} records from source")
+                if source_watermark.is_enabled(config):
+                    # Only the rows added to the source since the last sync
+                    df_source, watermark = source_watermark.read_new_rows(config)
+                    st.success(f"✅ Loaded {len(df_source)} records from source (rows after the last sync)")
+                else:
+                    # Read source Excel - use numeric column indexes directly
+                    snapshot = workbook_snapshot.load(source_path, source_sheet, config)
+                    df_source = workbook_snapshot.frame(snapshot, usecols=source_columns, skiprows=1)
+                    df_source.columns = [str(i) for i in source_columns[:len(df_source.columns)]]
+                    watermark = None
+                    
+                    st.success(f"✅ Loaded {len(df_source)} records from source")
                 
             except FileNotFoundError:
                 st.error(f"❌ Source file not found: {source_path}")
@@ -77,6 +83,8 @@ def run(df, filters, config):
         new_ids = source_ids - existing_ids
         
         if not new_ids:
+            if watermark is not None:
+                source_watermark.save(config, watermark)
             st.success("✅ No new records to sync. All source records already exist in main Excel.")
             return
         
@@ -87,6 +95,7 @@ def run(df, filters, config):
         st.session_state['df_new'] = df_new
         st.session_state['new_ids'] = new_ids
         st.session_state['source_columns'] = source_columns
+        st.session_state['source_watermark'] = watermark
         
         st.success(f"🔍 Found **{len(df_new)}** new records to sync")
     
@@ -138,6 +147,10 @@ def run(df, filters, config):
                     success = sync_data(df, df_new, config, source_columns)
                     if success:
                         st.success(f"✅ Successfully synced {len(df_new)} new records!")
+                        # The next sync starts after the rows just added
+                        watermark = st.session_state.pop('source_watermark', None)
+                        if watermark is not None:
+                            source_watermark.save(config, watermark)
                         # Clear session state
                         del st.session_state['df_new']
                         del st.session_state['new_ids']
@@ -150,6 +163,7 @@ def run(df, filters, config):
                 del st.session_state['df_new']
                 del st.session_state['new_ids']
                 del st.session_state['source_columns']
+                st.session_state.pop('source_watermark', None)
                 st.info("Sync cancelled")
                 st.rerun()
 
@@ -160,100 +174,44 @@ def sync_data(df_main, df_new, config, source_columns):
     1. Map source columns to main Excel columns
     2. Apply replicate rules (copy to both origin and destination)
     3. Apply binary_check rules (convert 'Sí' → 1, other → 0)
-    4. Append to Excel file
+    4. Append rows to Excel file (existing cells are left untouched)
     """
-    import tempfile
-    import os
-    
     try:
-        excel_path = config['excel_path']
-        sheet = config['excel_interpreter_spec']['sheet_name']
-        excel_spec = config['excel_interpreter_spec']
+        master_schema = schema.get_schema(config)
         source_spec = config['source_path_spec']
         
-        # Load full Excel with header
-        full_df = pd.read_excel(excel_path, sheet_name=sheet, header=0, engine='openpyxl')
+        # New rows as {column index: value}, built column by column; unset cells stay empty
+        new_columns = pd.DataFrame(index=df_new.index)
         
-        # Create column mapping: column_index -> column_id
-        column_id_map = {str(col['column']): col['column_id'] for col in excel_spec['columns'] if col['column_id'] != 'skip'}
-        column_to_index = {str(col['column']): col['column'] for col in excel_spec['columns']}
+        # Map source columns to Excel columns
+        for source_col in source_columns:
+            source_col_str = str(source_col)
+            if source_col in master_schema['index_to_id'] and source_col_str in df_new.columns:
+                new_columns[source_col] = df_new[source_col_str]
         
-        # Prepare new rows to append
-        new_rows = []
+        rules = sync_rules.apply_rules(source_spec, df_new)
         
-        for _, source_row in df_new.iterrows():
-            # Create empty row with all Excel columns
-            new_excel_row = pd.Series([None] * len(full_df.columns), index=full_df.columns)
-            
-            # Map source columns to Excel columns
-            for source_col in source_columns:
-                source_col_str = str(source_col)
-                if source_col_str in column_id_map and source_col_str in source_row:
-                    col_id = column_id_map[source_col_str]
-                    if source_col < len(full_df.columns):
-                        new_excel_row[full_df.columns[source_col]] = source_row[source_col_str]
-            
-            # Apply replicate rules (copy to both origin and destination)
-            replicate_rules = source_spec.get('replicate', [])
-            missing_field_value = source_spec.get('missing_field_value', 'sin respuesta')
-            missing_fields = source_spec.get('missing_fields', [])
-            
-            for rule in replicate_rules:
-                origin_col = rule.get('origin')
-                dest_col = rule.get('destination')
-                origin_col_str = str(origin_col)
-                if origin_col_str in source_row:
-                    value = source_row[origin_col_str]
-                    # Check if value is missing/empty and origin_col is in missing_fields
-                    if (pd.isna(value) or str(value).strip() == '') and origin_col in missing_fields:
-                        value = missing_field_value
-                    # Set destination column
-                    if dest_col < len(full_df.columns):
-                        new_excel_row[full_df.columns[dest_col]] = value
-                    # Also ensure origin column is set (may already be set from source mapping)
-                    if origin_col < len(full_df.columns):
-                        new_excel_row[full_df.columns[origin_col]] = value
-            
-            # Apply binary_check rules (save original value + convert 'Sí' → 1, other → 0)
-            binary_check_rules = source_spec.get('binary_check', [])
-            for rule in binary_check_rules:
-                source_col = rule.get('column')
-                dest_col = rule.get('destination')
-                source_col_str = str(source_col)
-                if source_col_str in source_row:
-                    # Save original value in source column
-                    original_value = source_row[source_col_str]
-                    if source_col < len(full_df.columns):
-                        new_excel_row[full_df.columns[source_col]] = original_value
-                    
-                    # Convert to binary in destination column
-                    # Check if 'Sí' is contained in the string (case-insensitive)
-                    value_str = str(original_value).strip() if pd.notna(original_value) else ''
-                    binary_value = 1 if 'sí' in value_str.lower() else 0
-                    if dest_col < len(full_df.columns):
-                        new_excel_row[full_df.columns[dest_col]] = binary_value
-            
-            # Set ind_review, ind_select, ind_1to1 to 0 by default
-            default_indicators = ['ind_review', 'ind_select', 'ind_1to1']
-            for col_spec in excel_spec['columns']:
-                if col_spec['column_id'] in default_indicators:
-                    col_idx = col_spec['column']
-                    if col_idx < len(full_df.columns):
-                        new_excel_row[full_df.columns[col_idx]] = 0
-            
-            new_rows.append(new_excel_row)
+        # Apply replicate rules (copy to both origin and destination)
+        for rule, values in rules['replicate']:
+            new_columns[rule['destination']] = values
+            new_columns[rule['origin']] = values
+        
+        # Apply binary_check rules (save original value + convert 'Sí' → 1, other → 0)
+        for rule, values in rules['binary_check']:
+            new_columns[rule['column']] = df_new[str(rule['column'])]
+            new_columns[rule['destination']] = values
         
-        # Append new rows to full_df
-        full_df = pd.concat([full_df, pd.DataFrame(new_rows)], ignore_index=True)
+        # Set ind_review, ind_select, ind_1to1 to 0 by default
+        default_indicators = ['ind_review', 'ind_select', 'ind_1to1']
+        for column_id in default_indicators:
+            if column_id in master_schema['id_to_index']:
+                new_columns[master_schema['id_to_index'][column_id]] = 0
         
-        # Write to temporary file first (atomic write)
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', dir=os.path.dirname(excel_path)) as tmp_file:
-            tmp_path = tmp_file.name
-            with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
-                full_df.to_excel(writer, sheet_name=sheet, index=False)
+        columns = list(new_columns.columns)
+        new_rows = [dict(zip(columns, row)) for row in zip(*(new_columns[col].tolist() for col in columns))]
         
-        # Atomically replace the original file
-        os.replace(tmp_path, excel_path)
+        # Append new rows to the workbook without rewriting existing cells
+        persistence.apply_changes(config, {'inserts': new_rows})
         
         logger.info(f"✅ Synced {len(df_new)} records successfully")
         return True
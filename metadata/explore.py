@@ -2,15 +2,155 @@ import streamlit as st
 import pandas as pd
 import json
 import plotly.express as px
-from collections import Counter
+import numpy as np
+import hashlib
+import filter_index
+import persistence
+
+# Pie chart breakdowns: (column, title, share below which values go to 'Other', lowercase labels)
+BREAKDOWNS = [
+    ('company', 'Breakdown by Company', 0.01, False),
+    ('place', 'Breakdown by Place', 0.01, False),
+    ('des_dt', 'Breakdown by N+3(dt)', 0.03, True),
+    ('des_dg', 'Breakdown by N+2(dg)', 0.03, True),
+    ('des_dan', 'Breakdown by N+1(dan)', 0.03, True),
+    ('des_centro_ges', 'Breakdown by center', 0.03, True),
+]
+# Skill level fields and their answers, in display order
+SKILL_FIELDS = ['nvl_excel', 'nvl_python', 'nvl_sas', 'nvl_sql', 'nvl_vba']
+SKILL_LEVELS = [
+    "nunca lo he utilizado",
+    "alguna base",
+    "usuario habitual",
+    "usuario experto",
+    "usuario avanzado"
+]
+# Session key holding the use-case and skill-level token index of the session dataframe
+TOKEN_INDEX_KEY = 'explore_token_index'
+# Session key memoizing the breakdown figures by filter mask
+BREAKDOWNS_KEY = 'explore_breakdowns'
+MAX_CACHED_BREAKDOWNS = 8
+
+
+def palette(n):
+    """Top value blue, the rest graded from light (#D9D9D9) to dark (#404040) gray."""
+    factor = (np.arange(1, n) - 1) / (n - 2) if n > 2 else np.zeros(max(n - 1, 0))
+    grays = (217 + (64 - 217) * factor).astype(int)
+    return ['#1E88E5'] + [f'rgb({gray},{gray},{gray})' for gray in grays]
+
+
+def bucket_counts(col, labels, counts, threshold):
+    """
+    Counts per label, largest first, with labels below the threshold share summed into 'Other'.
+
+    Args:
+        col: Name of the label column in the result
+        labels: Labels, aligned with counts
+        counts: Record counts per label (zero counts are dropped)
+        threshold: Share of the total below which a label goes to 'Other'
+
+    Returns:
+        DataFrame with col, 'count', 'percentage'
+    """
+    order = np.argsort(-counts, kind='stable')
+    order = order[counts[order] > 0]
+    counts = counts[order]
+    labels = np.asarray(labels, dtype=object)[order]
+    total = counts.sum()
+    share = counts / total if total else counts.astype(float)
+
+    main = share >= threshold
+    bucketed = pd.DataFrame({col: labels[main], 'count': counts[main], 'percentage': share[main]})
+    rest_count = counts[~main].sum()
+    if rest_count > 0:
+        bucketed.loc[len(bucketed)] = ['Other', rest_count, rest_count / total]
+    return bucketed
+
+
+def compute_breakdowns(df, mask):
+    """
+    Record counts per value of every BREAKDOWNS column, for the rows selected by mask.
+
+    Counts come from the columns' category codes (one bincount per column, no per-column
+    filtering or value_counts); values below the column's share threshold are summed into 'Other'.
+
+    Returns:
+        {column: DataFrame with column, 'count', 'percentage'}, largest first
+    """
+    breakdowns = {}
+    for col, _, threshold, lowercase in BREAKDOWNS:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, labels = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            codes, labels = pd.factorize(values)
+        selected = codes[mask]
+        breakdown = bucket_counts(col, labels, np.bincount(selected[selected >= 0], minlength=len(labels)), threshold)
+        if lowercase:
+            breakdown[col] = breakdown[col].str.lower()
+        breakdowns[col] = breakdown
+    return breakdowns
+
+
+def get_token_index(df):
+    """
+    Use cases and skill levels of every record, tokenized once per dataframe version.
+
+    Returns:
+        dict with:
+            'use_case_rows': Record position of each use-case token
+            'use_case_codes': Code of each use-case token into 'use_cases'
+            'use_cases': Distinct use cases, in order of first appearance
+            'skill_levels': (records x SKILL_FIELDS) array of level * len(SKILL_FIELDS) + field,
+                -1 where the answer is not one of SKILL_LEVELS
+    """
+    version = (st.session_state.get(persistence.VERSION_KEY, 0), id(df), len(df))
+    index = st.session_state.get(TOKEN_INDEX_KEY)
+    if index is not None and index['version'] == version:
+        return index
+
+    # One (record, use case) pair per ';'-separated item
+    items = df['use_cases'].astype(object).reset_index(drop=True).str.split(';').explode().str.strip()
+    items = items[items.fillna('') != '']
+    use_case_codes, use_cases = pd.factorize(items)
+
+    levels = np.column_stack([pd.Categorical(df[field], categories=SKILL_LEVELS).codes for field in SKILL_FIELDS])
+    skill_levels = np.where(levels >= 0, levels * len(SKILL_FIELDS) + np.arange(len(SKILL_FIELDS)), -1)
+
+    index = {
+        'version': version,
+        'use_case_rows': items.index.to_numpy(),
+        'use_case_codes': use_case_codes,
+        'use_cases': use_cases,
+        'skill_levels': skill_levels,
+    }
+    st.session_state[TOKEN_INDEX_KEY] = index
+    return index
+
+
+def get_breakdown_figures(df, mask):
+    """Pie charts for BREAKDOWNS, memoized per dataframe version and filter mask."""
+    key = (st.session_state.get(persistence.VERSION_KEY, 0), id(df), len(df),
+           hashlib.sha1(np.packbits(mask).tobytes()).hexdigest())
+    cache = st.session_state.setdefault(BREAKDOWNS_KEY, {})
+    if key not in cache:
+        breakdowns = compute_breakdowns(df, mask)
+        figures = {}
+        for col, title, _, _ in BREAKDOWNS:
+            breakdown = breakdowns[col]
+            color_map = dict(zip(breakdown[col], palette(len(breakdown))))
+            figures[col] = px.pie(breakdown, values='count', names=col, title=title, color=col, color_discrete_map=color_map)
+        if len(cache) >= MAX_CACHED_BREAKDOWNS:
+            cache.clear()
+        cache[key] = figures
+    return cache[key]
+
 
 def run(df, filters, config):
 
     # Apply filters to df
-    filtered_df = df.copy()
-    for col, selected in filters.items():
-        if selected and col in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df[col].isin(selected)]
+    mask = filter_index.get_mask(df, filters)
+    filtered_df = df[mask]
 
     # Title
     st.title("Survey Data Dashboard")
@@ -39,220 +179,29 @@ def run(df, filters, config):
     st.markdown("---")
 
     # Pie charts in two columns
-    col1, col2 = st.columns(2)
+    figures = get_breakdown_figures(df, mask)
+    for row_start in range(0, len(BREAKDOWNS), 2):
+        for column, (col, _, _, _) in zip(st.columns(2), BREAKDOWNS[row_start:row_start + 2]):
+            with column:
+                st.plotly_chart(figures[col], width='stretch')
 
-    with col1:
-        company_df = filtered_df['company'].value_counts().reset_index()
-        company_df.columns = ['company', 'count']
-        company_df = company_df.sort_values('count', ascending=False)
-        total_company = company_df['count'].sum()
-        company_df['percentage'] = company_df['count'] / total_company
-        main_company = company_df[company_df['percentage'] >= 0.01]
-        rest_count = company_df[company_df['percentage'] < 0.01]['count'].sum()
-        if rest_count > 0:
-            rest_df = pd.DataFrame({'company': ['Other'], 'count': [rest_count], 'percentage': [rest_count / total_company]})
-            company_df = pd.concat([main_company, rest_df], ignore_index=True)
-        else:
-            company_df = main_company
-        n_company = len(company_df)
-        company_colors = ['#1E88E5']  # Top is blue
-        for i in range(1, n_company):
-            if n_company > 2:
-                factor = (i - 1) / (n_company - 2)
-            else:
-                factor = 0
-            gray = int(217 + (64 - 217) * factor)  # From #D9D9D9 (217) to #404040 (64)
-            company_colors.append(f'rgb({gray},{gray},{gray})')
-        company_color_map = dict(zip(company_df['company'], company_colors))
-        fig1 = px.pie(company_df, values='count', names='company', title='Breakdown by Company', color='company', color_discrete_map=company_color_map)
-        st.plotly_chart(fig1, width='stretch')
-
-    with col2:
-        place_df = filtered_df['place'].value_counts().reset_index()
-        place_df.columns = ['place', 'count']
-        place_df = place_df.sort_values('count', ascending=False)
-        total_place = place_df['count'].sum()
-        place_df['percentage'] = place_df['count'] / total_place
-        main_place = place_df[place_df['percentage'] >= 0.01]
-        rest_count = place_df[place_df['percentage'] < 0.01]['count'].sum()
-        if rest_count > 0:
-            rest_df = pd.DataFrame({'place': ['Other'], 'count': [rest_count], 'percentage': [rest_count / total_place]})
-            place_df = pd.concat([main_place, rest_df], ignore_index=True)
-        else:
-            place_df = main_place
-        n_place = len(place_df)
-        place_colors = ['#1E88E5']  # Top is blue
-        for i in range(1, n_place):
-            if n_place > 2:
-                factor = (i - 1) / (n_place - 2)
-            else:
-                factor = 0
-            gray = int(217 + (64 - 217) * factor)  # From #D9D9D9 (217) to #404040 (64)
-            place_colors.append(f'rgb({gray},{gray},{gray})')
-        place_color_map = dict(zip(place_df['place'], place_colors))
-        fig2 = px.pie(place_df, values='count', names='place', title='Breakdown by Place', color='place', color_discrete_map=place_color_map)
-        st.plotly_chart(fig2, width='stretch')
-
-    # Additional pie charts
-    col1, col2 = st.columns(2)
-
-    with col1:
-        dt_df = filtered_df['des_dt'].value_counts().reset_index()
-        dt_df.columns = ['des_dt', 'count']
-        dt_df = dt_df.sort_values('count', ascending=False)
-        total_dt = dt_df['count'].sum()
-        dt_df['percentage'] = dt_df['count'] / total_dt
-        main_dt = dt_df[dt_df['percentage'] >= 0.03]  # Change threshold to 3%
-        rest_count = dt_df[dt_df['percentage'] < 0.03]['count'].sum()  # Change threshold to 3%
-        if rest_count > 0:
-            rest_df = pd.DataFrame({'des_dt': ['Other'], 'count': [rest_count], 'percentage': [rest_count / total_dt]})
-            dt_df = pd.concat([main_dt, rest_df], ignore_index=True)
-        else:
-            dt_df = main_dt
-        dt_df['des_dt'] = dt_df['des_dt'].str.lower()
-        n_dt = len(dt_df)
-        dt_colors = ['#1E88E5']  # Top is blue
-        for i in range(1, n_dt):
-            if n_dt > 2:
-                factor = (i - 1) / (n_dt - 2)
-            else:
-                factor = 0
-            gray = int(217 + (64 - 217) * factor)  # From #D9D9D9 (217) to #404040 (64)
-            dt_colors.append(f'rgb({gray},{gray},{gray})')
-        dt_color_map = dict(zip(dt_df['des_dt'], dt_colors))
-        fig3 = px.pie(dt_df, values='count', names='des_dt', title='Breakdown by N+3(dt)', color='des_dt', color_discrete_map=dt_color_map)
-        st.plotly_chart(fig3, width='stretch')
-
-    with col2:
-        dg_df = filtered_df['des_dg'].value_counts().reset_index()
-        dg_df.columns = ['des_dg', 'count']
-        dg_df = dg_df.sort_values('count', ascending=False)
-        total_dg = dg_df['count'].sum()
-        dg_df['percentage'] = dg_df['count'] / total_dg
-        main_dg = dg_df[dg_df['percentage'] >= 0.03]  # Change threshold to 3%
-        rest_count = dg_df[dg_df['percentage'] < 0.03]['count'].sum()  # Change threshold to 3%
-        if rest_count > 0:
-            rest_df = pd.DataFrame({'des_dg': ['Other'], 'count': [rest_count], 'percentage': [rest_count / total_dg]})
-            dg_df = pd.concat([main_dg, rest_df], ignore_index=True)
-        else:
-            dg_df = main_dg
-        dg_df['des_dg'] = dg_df['des_dg'].str.lower()
-        n_dg = len(dg_df)
-        dg_colors = ['#1E88E5']  # Top is blue
-        for i in range(1, n_dg):
-            if n_dg > 2:
-                factor = (i - 1) / (n_dg - 2)
-            else:
-                factor = 0
-            gray = int(217 + (64 - 217) * factor)  # From #D9D9D9 (217) to #404040 (64)
-            dg_colors.append(f'rgb({gray},{gray},{gray})')
-        dg_color_map = dict(zip(dg_df['des_dg'], dg_colors))
-        fig4 = px.pie(dg_df, values='count', names='des_dg', title='Breakdown by N+2(dg)', color='des_dg', color_discrete_map=dg_color_map)
-        st.plotly_chart(fig4, width='stretch')
-
-    col1, col2 = st.columns(2)
-
-    with col1:
-        dan_df = filtered_df['des_dan'].value_counts().reset_index()
-        dan_df.columns = ['des_dan', 'count']
-        dan_df = dan_df.sort_values('count', ascending=False)
-        total_dan = dan_df['count'].sum()
-        dan_df['percentage'] = dan_df['count'] / total_dan
-        main_dan = dan_df[dan_df['percentage'] >= 0.03]  # Change threshold to 3%
-        rest_count = dan_df[dan_df['percentage'] < 0.03]['count'].sum()  # Change threshold to 3%
-        if rest_count > 0:
-            rest_df = pd.DataFrame({'des_dan': ['Other'], 'count': [rest_count], 'percentage': [rest_count / total_dan]})
-            dan_df = pd.concat([main_dan, rest_df], ignore_index=True)
-        else:
-            dan_df = main_dan
-        dan_df['des_dan'] = dan_df['des_dan'].str.lower()
-        n_dan = len(dan_df)
-        dan_colors = ['#1E88E5']  # Top is blue
-        for i in range(1, n_dan):
-            if n_dan > 2:
-                factor = (i - 1) / (n_dan - 2)
-            else:
-                factor = 0
-            gray = int(217 + (64 - 217) * factor)  # From #D9D9D9 (217) to #404040 (64)
-            dan_colors.append(f'rgb({gray},{gray},{gray})')
-        dan_color_map = dict(zip(dan_df['des_dan'], dan_colors))
-        fig5 = px.pie(dan_df, values='count', names='des_dan', title='Breakdown by N+1(dan)', color='des_dan', color_discrete_map=dan_color_map)
-        st.plotly_chart(fig5, width='stretch')
-
-    with col2:
-        centro_df = filtered_df['des_centro_ges'].value_counts().reset_index()
-        centro_df.columns = ['des_centro_ges', 'count']
-        centro_df = centro_df.sort_values('count', ascending=False)
-        total_centro = centro_df['count'].sum()
-        centro_df['percentage'] = centro_df['count'] / total_centro
-        main_centro = centro_df[centro_df['percentage'] >= 0.03]  # Change threshold to 3%
-        rest_count = centro_df[centro_df['percentage'] < 0.03]['count'].sum()  # Change threshold to 3%
-        if rest_count > 0:
-            rest_df = pd.DataFrame({'des_centro_ges': ['Other'], 'count': [rest_count], 'percentage': [rest_count / total_centro]})
-            centro_df = pd.concat([main_centro, rest_df], ignore_index=True)
-        else:
-            centro_df = main_centro
-        centro_df['des_centro_ges'] = centro_df['des_centro_ges'].str.lower()
-        n_centro = len(centro_df)
-        centro_colors = ['#1E88E5']  # Top is blue
-        for i in range(1, n_centro):
-            if n_centro > 2:
-                factor = (i - 1) / (n_centro - 2)
-            else:
-                factor = 0
-            gray = int(217 + (64 - 217) * factor)  # From #D9D9D9 (217) to #404040 (64)
-            centro_colors.append(f'rgb({gray},{gray},{gray})')
-        centro_color_map = dict(zip(centro_df['des_centro_ges'], centro_colors))
-        fig6 = px.pie(centro_df, values='count', names='des_centro_ges', title='Breakdown by center', color='des_centro_ges', color_discrete_map=centro_color_map)
-        st.plotly_chart(fig6, width='stretch')
-
-    # Process use_cases: split by ';'
-    use_cases_all = []
-    for uc in filtered_df['use_cases'].dropna():
-        use_cases_all.extend([item.strip() for item in uc.split(';') if item.strip()])
-
-    use_cases_counts = Counter(use_cases_all)
+    # Use cases and skill levels are counted from the token index, restricted to the filtered rows
+    tokens = get_token_index(df)
+    use_case_rows = mask[tokens['use_case_rows']]
+    use_case_counts = np.bincount(tokens['use_case_codes'][use_case_rows], minlength=len(tokens['use_cases']))
 
     # Vertical bar chart for use_cases
-    use_cases_df = pd.DataFrame(list(use_cases_counts.items()), columns=['use_case', 'count'])
-    use_cases_df = use_cases_df.sort_values('count', ascending=False)
-    total_use = use_cases_df['count'].sum()
-    use_cases_df['percentage'] = use_cases_df['count'] / total_use
-    main_use = use_cases_df[use_cases_df['percentage'] >= 0.01]
-    rest_count = use_cases_df[use_cases_df['percentage'] < 0.01]['count'].sum()
-    if rest_count > 0:
-        rest_df = pd.DataFrame({'use_case': ['Other'], 'count': [rest_count], 'percentage': [rest_count / total_use]})
-        use_cases_df = pd.concat([main_use, rest_df], ignore_index=True)
-    else:
-        use_cases_df = main_use
-    n_use = len(use_cases_df)
-    use_colors = ['#1E88E5']  # Top is blue
-    for i in range(1, n_use):
-        if n_use > 2:
-            factor = (i - 1) / (n_use - 2)
-        else:
-            factor = 0
-        gray = int(217 + (64 - 217) * factor)  # From #D9D9D9 (217) to #404040 (64)
-        use_colors.append(f'rgb({gray},{gray},{gray})')
-    use_color_map = dict(zip(use_cases_df['use_case'], use_colors))
+    use_cases_df = bucket_counts('use_case', tokens['use_cases'], use_case_counts, 0.01)
+    use_color_map = dict(zip(use_cases_df['use_case'], palette(len(use_cases_df))))
     fig3 = px.bar(use_cases_df, x='count', y='use_case', title='Use Cases Breakdown', color='use_case', color_discrete_map=use_color_map, orientation='h', labels={'use_case': ''})
     st.plotly_chart(fig3, width='stretch')
 
     # Distribution of nvl_ fields
     st.subheader("Distribution of Skill Levels")
-    nvl_fields = ['nvl_excel', 'nvl_python', 'nvl_sas', 'nvl_sql', 'nvl_vba']
-    labels = [
-        "nunca lo he utilizado",
-        "alguna base",
-        "usuario habitual",
-        "usuario experto",
-        "usuario avanzado"
-    ]
-    distribution = pd.DataFrame(index=labels, columns=nvl_fields)
-    for field in nvl_fields:
-        counts = filtered_df[field].value_counts()
-        for label in labels:
-            distribution.loc[label, field] = counts.get(label, 0)
+    level_cells = tokens['skill_levels'][mask].ravel()
+    level_counts = np.bincount(level_cells[level_cells >= 0], minlength=len(SKILL_FIELDS) * len(SKILL_LEVELS))
+    distribution = pd.DataFrame(level_counts.reshape(len(SKILL_LEVELS), len(SKILL_FIELDS)),
+                                index=SKILL_LEVELS, columns=SKILL_FIELDS)
     # Friendly column names for visualization
     friendly_names = {
         'nvl_excel': 'Excel skill',
@@ -413,7 +362,7 @@ def render_phase2_metrics(filtered_df):
                 
                 st.markdown(f"**{display_name}**")
                 
-                grouped = confirmed_df.groupby(col_name).agg({
+                grouped = confirmed_df.groupby(col_name, observed=True).agg({
                     'id': 'count',
                     'ind_session': lambda x: (x == 1).sum(),
                     'ind_waitlist': lambda x: (x == 1).sum()
@@ -0,0 +1,90 @@
+import streamlit as st
+import pandas as pd
+import persistence
+import schema
+
+# Session key holding the per-column value counts of the session dataframe
+INDEX_KEY = 'facet_index'
+
+
+def get_counts(df, col):
+    """
+    Distinct non-missing values of a column with their row counts.
+
+    Counted once per column and kept up to date by apply_changes() when records are
+    saved; recounted only when the dataframe changed some other way.
+
+    Returns:
+        {value: count}; callers must not modify it
+    """
+    index = _get_index(df)
+    counts = index['columns'].get(col)
+    if counts is None:
+        counts = {value: int(count) for value, count in df[col].value_counts().items() if count > 0}
+        index['columns'][col] = counts
+    return counts
+
+
+def apply_changes(previous, changes, config, previous_version):
+    """
+    Update the cached counts with a saved change set instead of recounting.
+
+    Args:
+        previous: Dataframe state the change set was computed from
+        changes: Change set from persistence.compute_changes
+        config: Configuration dict
+        previous_version: Dataframe version the cached counts must match
+    """
+    index = st.session_state.get(INDEX_KEY)
+    if index is None or index['version'] != previous_version:
+        return
+
+    updates = changes.get('updates', {})
+    inserts = changes.get('inserts', [])
+    deletes = changes.get('deletes', [])
+    id_to_index = schema.get_schema(config)['id_to_index']
+
+    touched_ids = {row_id for row_id, _ in updates} | set(deletes)
+    old_rows = previous[previous['id'].isin(list(touched_ids))].drop_duplicates(subset=['id']).set_index('id')
+
+    updates_by_index = {}
+    for (row_id, col_idx), value in updates.items():
+        updates_by_index.setdefault(col_idx, []).append((row_id, value))
+
+    try:
+        for col, counts in index['columns'].items():
+            col_idx = id_to_index.get(col)
+            if col_idx is None:
+                continue
+            for row_id, value in updates_by_index.get(col_idx, []):
+                _add(counts, old_rows.at[row_id, col], -1)
+                _add(counts, value, 1)
+            for row_id in deletes:
+                _add(counts, old_rows.at[row_id, col], -1)
+            for new_row in inserts:
+                _add(counts, new_row.get(col_idx), 1)
+    except KeyError:
+        # Row not found in the previous state; recount on next use
+        del st.session_state[INDEX_KEY]
+        return
+
+    index['rows'] += len(inserts) - len(deletes)
+    index['version'] = st.session_state.get(persistence.VERSION_KEY, 0)
+
+
+def _get_index(df):
+    """Counts for the current dataframe version, reset when the data changed."""
+    version = st.session_state.get(persistence.VERSION_KEY, 0)
+    index = st.session_state.get(INDEX_KEY)
+    if index is None or index['version'] != version or index['rows'] != len(df):
+        index = {'version': version, 'rows': len(df), 'columns': {}}
+        st.session_state[INDEX_KEY] = index
+    return index
+
+
+def _add(counts, value, delta):
+    if pd.isna(value):
+        return
+    counts[value] = counts.get(value, 0) + delta
+    if counts[value] <= 0:
+        del counts[value]
@@ -0,0 +1,88 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import persistence
+
+# Session key holding the bitmap index of the session dataframe
+INDEX_KEY = 'filter_index'
+# Filter combinations kept per dataframe version
+MAX_CACHED_MASKS = 16
+
+
+def apply(df, filters, include_missing=False):
+    """
+    Rows of df matching the sidebar filters.
+
+    Args:
+        df: Session dataframe
+        filters: {column: selected values}; empty selections are ignored
+        include_missing: Also keep rows with an empty value in a filtered column
+            (entry tabs show new records whose fields are not filled in yet)
+    """
+    return df[get_mask(df, filters, include_missing)]
+
+
+def get_mask(df, filters, include_missing=False):
+    """
+    Boolean row mask for the sidebar filters, combined from per-value bitmaps.
+
+    Bitmaps are built once per column and dataframe version; the combined mask is
+    memoized, so every tab of a rerun reuses the same one.
+    """
+    index = _get_index(df)
+    key = (include_missing, tuple((col, tuple(selected)) for col, selected in filters.items()))
+    mask = index['masks'].get(key)
+    if mask is not None:
+        return mask
+
+    combined = None
+    for col, selected in filters.items():
+        if not selected or col not in df.columns:
+            continue
+        column = _get_column(index, df, col)
+        selected = set(selected)
+        if selected.issuperset(column['values']):
+            if include_missing:
+                continue
+            bits = column['present']
+        else:
+            bits = np.zeros_like(column['present'])
+            for value in selected:
+                value_bits = column['values'].get(value)
+                if value_bits is not None:
+                    bits |= value_bits
+            if include_missing:
+                bits |= ~column['present']
+        combined = bits.copy() if combined is None else combined & bits
+
+    if combined is None:
+        mask = np.ones(len(df), dtype=bool)
+    else:
+        mask = np.unpackbits(combined, count=len(df)).astype(bool)
+    if len(index['masks']) >= MAX_CACHED_MASKS:
+        index['masks'].clear()
+    index['masks'][key] = mask
+    return mask
+
+
+def _get_index(df):
+    """Index for the current dataframe version, rebuilt when the data changed."""
+    version = (st.session_state.get(persistence.VERSION_KEY, 0), id(df), len(df))
+    index = st.session_state.get(INDEX_KEY)
+    if index is None or index['version'] != version:
+        index = {'version': version, 'columns': {}, 'masks': {}}
+        st.session_state[INDEX_KEY] = index
+    return index
+
+
+def _get_column(index, df, col):
+    """Packed bitmaps for one column: one per distinct value, plus non-missing rows."""
+    column = index['columns'].get(col)
+    if column is None:
+        codes, uniques = pd.factorize(df[col])
+        column = {
+            'values': {value: np.packbits(codes == code) for code, value in enumerate(uniques)},
+            'present': np.packbits(codes >= 0),
+        }
+        index['columns'][col] = column
+    return column
@@ -0,0 +1,220 @@
+import pandas as pd
+import logging
+import threading
+import json
+import os
+import datetime
+import tempfile
+import config_paths
+import persistence
+
+logger = logging.getLogger(__name__)
+
+# Appends and the compactor's rewrite of the journal file
+_file_lock = threading.Lock()
+# Serializes compactions between sessions and the background timer
+_compact_lock = threading.Lock()
+_timer_lock = threading.Lock()
+_compact_timer = None
+
+
+def is_enabled(config):
+    """True when config.json has an edit_journal entry (used when no master_store is configured)."""
+    return bool(config.get('edit_journal', {}).get('path'))
+
+
+def get_journal_path(config):
+    """Journal file path (see config_paths.resolve)."""
+    return config_paths.resolve(config, config['edit_journal']['path'])
+
+
+def append(config, changes):
+    """
+    Append a change set (see persistence.compute_changes) to the journal.
+
+    The edit is durable once this returns; the workbook is patched later by compact().
+    """
+    updates = changes.get('updates', {})
+    inserts = changes.get('inserts', [])
+    deletes = changes.get('deletes', [])
+    if not updates and not inserts and not deletes:
+        return
+
+    with _file_lock:
+        entries = _read_entries(config)
+        seq = entries[-1][0] + 1 if entries else 1
+        path = get_journal_path(config)
+        with open(path, 'a', encoding='utf-8') as f:
+            if f.tell() and not _ends_with_newline(path):
+                # Terminate a torn entry so it does not swallow this one
+                f.write('\n')
+            f.write(json.dumps({'seq': seq, 'change': encode_change(changes)}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    logger.info(f"✅ Journaled edit {seq}: {len(updates)} cells updated, {len(inserts)} rows added, {len(deletes)} rows deleted")
+
+    if config['edit_journal'].get('compact', 'background') == 'background':
+        schedule_compaction(config)
+
+
+def pending(config):
+    """Number of journaled change sets not yet folded into the workbook."""
+    with _file_lock:
+        return len(_read_entries(config))
+
+
+def replay(config, df):
+    """
+    Apply journaled change sets that have not reached the workbook to df.
+
+    Called on load so edits survive a restart or a workbook that was locked.
+    """
+    with _file_lock:
+        entries = _read_entries(config)
+    if not entries:
+        return df
+
+    for _, change in entries:
+        df = persistence.apply_to_frame(df, decode_change(change), config)
+    logger.info(f"✅ Replayed {len(entries)} journaled edits not yet in the workbook")
+
+    if config['edit_journal'].get('compact', 'background') == 'background':
+        schedule_compaction(config)
+    return df
+
+
+def compact(config):
+    """
+    Fold all journaled change sets into the workbook in a single patch.
+
+    Returns:
+        Number of change sets compacted (0 if there was nothing to do)
+    """
+    with _compact_lock:
+        with _file_lock:
+            entries = _read_entries(config)
+        if not entries:
+            return 0
+
+        id_index = persistence.get_column_index(config).get('id', 0)
+        merged = merge_changes((decode_change(change) for _, change in entries), id_index)
+        persistence.patch_workbook(config, merged)
+
+        # Keep entries appended while the workbook was being written
+        last_seq = entries[-1][0]
+        with _file_lock:
+            remaining = [entry for entry in _read_entries(config) if entry[0] > last_seq]
+            _write_entries(config, remaining)
+
+    logger.info(f"✅ Compacted {len(entries)} journaled edits into {config['excel_path']}")
+    return len(entries)
+
+
+def schedule_compaction(config):
+    """Compact the journal in the background once edits pause for compact_delay_seconds."""
+    global _compact_timer
+    delay = config['edit_journal'].get('compact_delay_seconds', 10)
+
+    def run_compaction():
+        try:
+            compact(config)
+        except Exception as e:
+            # Typically the workbook is open/locked; edits stay journaled for the next attempt
+            logger.warning(f"⚠️ Background journal compaction failed, will retry on next change: {e}")
+
+    with _timer_lock:
+        if _compact_timer is not None:
+            _compact_timer.cancel()
+        _compact_timer = threading.Timer(delay, run_compaction)
+        _compact_timer.daemon = True
+        _compact_timer.start()
+
+
+def encode_change(changes):
+    """Serialize a change set to JSON (datetimes as {'$datetime': iso})."""
+    return json.dumps({
+        'updates': [[_encode_value(row_id), col_idx, _encode_value(value)] for (row_id, col_idx), value in changes.get('updates', {}).items()],
+        'inserts': [[[col_idx, _encode_value(value)] for col_idx, value in new_row.items()] for new_row in changes.get('inserts', [])],
+        'deletes': [_encode_value(row_id) for row_id in changes.get('deletes', [])],
+    })
+
+
+def decode_change(payload):
+    """Inverse of encode_change."""
+    data = json.loads(payload)
+    return {
+        'updates': {(_decode_value(row_id), col_idx): _decode_value(value) for row_id, col_idx, value in data['updates']},
+        'inserts': [{col_idx: _decode_value(value) for col_idx, value in new_row} for new_row in data['inserts']],
+        'deletes': [_decode_value(row_id) for row_id in data['deletes']],
+    }
+
+
+def merge_changes(change_sets, id_index):
+    """Fold consecutive change sets into one, later values winning."""
+    updates = {}
+    inserts = {}
+    deletes = []
+    for changes in change_sets:
+        for (row_id, col_idx), value in changes['updates'].items():
+            key = persistence.normalize_id(row_id)
+            if key in inserts:
+                inserts[key][col_idx] = value
+            else:
+                updates[(row_id, col_idx)] = value
+        for row_id in changes['deletes']:
+            key = persistence.normalize_id(row_id)
+            updates = {k: v for k, v in updates.items() if persistence.normalize_id(k[0]) != key}
+            if key in inserts:
+                del inserts[key]
+            else:
+                deletes.append(row_id)
+        for new_row in changes['inserts']:
+            row_id = new_row.get(id_index)
+            inserts[persistence.normalize_id(row_id)] = dict(new_row)
+    return {'updates': updates, 'inserts': list(inserts.values()), 'deletes': deletes}
+
+
+def _read_entries(config):
+    """Read (seq, change) pairs; a torn last line from a crash mid-append is ignored."""
+    path = get_journal_path(config)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning("⚠️ Ignoring incomplete journal entry")
+                continue
+            entries.append((entry['seq'], entry['change']))
+    return entries
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _write_entries(config, entries):
+    path = get_journal_path(config)
+    with tempfile.NamedTemporaryFile('w', delete=False, dir=os.path.dirname(path), encoding='utf-8') as tmp_file:
+        for seq, change in entries:
+            tmp_file.write(json.dumps({'seq': seq, 'change': change}) + '\n')
+        tmp_path = tmp_file.name
+    os.replace(tmp_path, path)
+
+
+def _encode_value(value):
+    value = persistence.to_cell_value(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return {'$datetime': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and '$datetime' in value:
+        return pd.Timestamp(value['$datetime']).to_pydatetime()
+    return value
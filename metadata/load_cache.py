@@ -0,0 +1,132 @@
+import pandas as pd
+import logging
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import config_paths
+
+logger = logging.getLogger(__name__)
+
+# Latest cached frame per name, shared by all sessions of this process: {name: (version, df)}
+_memory = {}
+_lock = threading.Lock()
+
+
+def is_enabled(config):
+    """True when config.json has a load_cache entry."""
+    return bool(config.get('load_cache', {}).get('path'))
+
+
+def get_cache_dir(config):
+    """Sidecar folder (see config_paths.resolve)."""
+    return config_paths.resolve(config, config['load_cache']['path'])
+
+
+def file_version(config, name, path):
+    """
+    Content version of a source file.
+
+    The file is only re-hashed when its mtime or size differ from the ones recorded
+    with the cached frame, so an unchanged workbook costs a single stat call.
+    """
+    stat = os.stat(path)
+    known = _read_meta(config, name).get('source', {})
+    if known.get('mtime_ns') == stat.st_mtime_ns and known.get('size') == stat.st_size and known.get('sha1'):
+        return known['sha1']
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_or_load(config, name, version, loader, source_path=None, copy=True):
+    """
+    Return the frame cached under name if it was built for version, otherwise loader().
+
+    Hits are served from process memory, then from a Parquet sidecar in the cache folder.
+    Misses call loader() and refresh both. Callers receive their own copy unless
+    copy=False, for read-only frames shared by all sessions.
+
+    Args:
+        config: Configuration dict
+        name: Cache entry name (one sidecar file per name)
+        version: String identifying the source state the frame was built from
+        loader: Function returning the frame on a miss
+        source_path: Source file whose mtime/size are recorded for file_version
+        copy: Return a copy of the cached frame rather than the cached frame itself
+    """
+    if not is_enabled(config):
+        return loader()
+
+    with _lock:
+        cached = _memory.get(name)
+    if cached and cached[0] == version:
+        return cached[1].copy() if copy else cached[1]
+
+    meta = _read_meta(config, name)
+    if meta.get('version') == version:
+        try:
+            df = _read_frame(config, name, meta.get('format'))
+            with _lock:
+                _memory[name] = (version, df)
+            logger.info(f"✅ Loaded {name} from sidecar cache")
+            return df.copy() if copy else df
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read {name} sidecar, reloading: {e}")
+
+    df = loader()
+    with _lock:
+        _memory[name] = (version, df.copy() if copy else df)
+    try:
+        _write_frame(config, name, version, df, source_path)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not write {name} sidecar: {e}")
+    return df
+
+
+def _meta_path(config, name):
+    return os.path.join(get_cache_dir(config), f'{name}.json')
+
+
+def _read_meta(config, name):
+    try:
+        with open(_meta_path(config, name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _read_frame(config, name, fmt):
+    path = os.path.join(get_cache_dir(config), f'{name}.{fmt}')
+    if fmt == 'parquet':
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def _write_frame(config, name, version, df, source_path):
+    """Write the sidecar (Parquet, or pickle for columns Arrow cannot type) and its metadata."""
+    cache_dir = get_cache_dir(config)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(delete=False, dir=cache_dir) as tmp_file:
+        tmp_path = tmp_file.name
+    try:
+        df.to_parquet(tmp_path, index=False)
+        fmt = 'parquet'
+    except Exception:
+        # Mixed-type object columns (e.g. numbers typed into a text field)
+        df.to_pickle(tmp_path)
+        fmt = 'pickle'
+    os.replace(tmp_path, os.path.join(cache_dir, f'{name}.{fmt}'))
+
+    meta = {'version': version, 'format': fmt}
+    if source_path:
+        stat = os.stat(source_path)
+        meta['source'] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': version.split(':')[0]}
+    with tempfile.NamedTemporaryFile('w', delete=False, dir=cache_dir, suffix='.json') as tmp_file:
+        json.dump(meta, tmp_file)
+        tmp_path = tmp_file.name
+    os.replace(tmp_path, _meta_path(config, name))
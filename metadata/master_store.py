@@ -0,0 +1,324 @@
+import pandas as pd
+import logging
+import sqlite3
+import threading
+import os
+import datetime
+import contextlib
+import uuid
+import config_paths
+import persistence
+import load_cache
+import schema
+import journal
+
+logger = logging.getLogger(__name__)
+
+# Serializes snapshot exports between sessions and the background timer
+_export_lock = threading.Lock()
+_timer_lock = threading.Lock()
+_export_timer = None
+
+
+def is_enabled(config):
+    """True when config.json points the master data at an embedded database."""
+    return bool(config.get('master_store', {}).get('path'))
+
+
+def get_db_path(config):
+    """Database file path (see config_paths.resolve)."""
+    return config_paths.resolve(config, config['master_store']['path'])
+
+
+def column_types(config):
+    """
+    Map each column_id in excel_interpreter_spec to a SQLite column type.
+
+    Types follow the column_id prefixes used throughout the app.
+    """
+    types = {}
+    for col_spec in config['excel_interpreter_spec']['columns']:
+        column_id = col_spec['column_id']
+        if column_id == 'skip':
+            continue
+        if column_id == 'id' or column_id.startswith(('ind_', 'cod_', 'pk_', 'fk_')):
+            types[column_id] = 'INTEGER'
+        elif column_id.startswith('timestamp_'):
+            types[column_id] = 'TIMESTAMP'
+        else:
+            types[column_id] = 'TEXT'
+    return types
+
+
+def load(config):
+    """
+    Load the master dataframe from the database, creating it from the workbook on first use.
+
+    Change sets left over from a previous run (e.g. an export that failed because the
+    workbook was open in Excel) are exported first. If there are then no changes waiting
+    and the workbook was modified outside the app since the last import/export, the
+    database is refreshed from the workbook.
+    """
+    with _connect(config) as conn:
+        pending = _pending_count(conn)
+        seeded = _get_meta(conn, 'seeded') == '1'
+
+    if seeded and pending and config['master_store'].get('export', 'background') == 'background':
+        try:
+            export_snapshot(config)
+        except Exception as e:
+            logger.warning(f"⚠️ Excel export of {pending} pending change set(s) failed, will retry on next load or change: {e}")
+
+    with _connect(config) as conn:
+        pending = _pending_count(conn)
+        excel_mtime = _get_meta(conn, 'excel_mtime')
+
+    current_mtime = _workbook_mtime(config)
+    if not seeded:
+        import_workbook(config)
+    elif pending == 0 and current_mtime is not None and current_mtime != excel_mtime:
+        try:
+            import_workbook(config)
+        except ValueError as e:
+            logger.warning(f"⚠️ Workbook edits not loaded, keeping the master store as it was: {e}")
+    elif pending and current_mtime is not None and current_mtime != excel_mtime:
+        logger.warning("⚠️ Workbook modified outside the app while changes are waiting for export; "
+                       "its edits are loaded once the export succeeds")
+
+    with _connect(config) as conn:
+        version = f"{_get_meta(conn, 'store_id')}:{_get_meta(conn, 'data_version')}:{schema.get_schema(config)['fingerprint']}"
+    df = load_cache.get_or_load(config, 'master_store', version, lambda: _read_master(config))
+    # Parquet keeps string categoricals only; numeric ones come back dense
+    return schema.apply_dtypes(df, config)
+
+
+def _read_master(config):
+    """Read the master table with the dtypes read_workbook would give."""
+    types = column_types(config)
+    columns = ', '.join(f'"{col}"' for col in types)
+    with _connect(config) as conn:
+        df = pd.read_sql_query(f'SELECT {columns} FROM master ORDER BY rowid', conn)
+
+    for col, sql_type in types.items():
+        if sql_type == 'TIMESTAMP':
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        else:
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+    return schema.apply_dtypes(df, config)
+
+
+def import_workbook(config):
+    """
+    Replace the database contents with the current master workbook.
+
+    Raises:
+        ValueError: If an id is on more than one workbook row; the database is left
+            as it was, since the id is its primary key and the rows would be lost
+    """
+    df = persistence.read_workbook(config)
+    types = column_types(config)
+    columns = list(types)
+
+    missing_ids = df['id'].isna().sum()
+    if missing_ids:
+        logger.warning(f"⚠️ Skipping {missing_ids} workbook rows without id")
+    df = df[df['id'].notna()]
+
+    duplicated = df['id'].map(persistence.normalize_id)
+    duplicated = df.loc[duplicated.duplicated(keep=False).to_numpy(), 'id'].unique().tolist()
+    if duplicated:
+        raise ValueError(f"Workbook has {len(duplicated)} id(s) on more than one row "
+                         f"({', '.join(str(row_id) for row_id in duplicated[:10])}); give each row its own id in Excel")
+
+    rows = [tuple(_to_sql(value) for value in row) for row in df.reindex(columns=columns).itertuples(index=False, name=None)]
+    placeholders = ', '.join('?' for _ in columns)
+    column_list = ', '.join(f'"{col}"' for col in columns)
+
+    with _connect(config) as conn:
+        conn.execute('DELETE FROM master')
+        conn.executemany(f'INSERT INTO master ({column_list}) VALUES ({placeholders})', rows)
+        _set_meta(conn, 'seeded', '1')
+        if _get_meta(conn, 'store_id') is None:
+            _set_meta(conn, 'store_id', uuid.uuid4().hex)
+        _bump_data_version(conn)
+        _set_meta(conn, 'excel_mtime', _workbook_mtime(config))
+
+    logger.info(f"✅ Imported {len(rows)} records from workbook into {get_db_path(config)}")
+
+
+def apply_changes(config, changes):
+    """
+    Commit a change set (see persistence.compute_changes) in one transaction.
+
+    The same change set is queued for the Excel snapshot, including cells in
+    workbook columns that are not mapped in config.
+    """
+    index_to_id = schema.get_schema(config)['index_to_id']
+    id_index = persistence.get_column_index(config).get('id', 0)
+
+    updates = changes.get('updates', {})
+    inserts = changes.get('inserts', [])
+    deletes = changes.get('deletes', [])
+    if not updates and not inserts and not deletes:
+        return
+
+    with _connect(config) as conn:
+        for (row_id, col_idx), value in updates.items():
+            column_id = index_to_id.get(col_idx)
+            if column_id and column_id != 'id':
+                conn.execute(f'UPDATE master SET "{column_id}" = ? WHERE id = ?', (_to_sql(value), _to_sql(row_id)))
+
+        for row_id in deletes:
+            conn.execute('DELETE FROM master WHERE id = ?', (_to_sql(row_id),))
+
+        for new_row in inserts:
+            values = {index_to_id[col_idx]: _to_sql(value) for col_idx, value in new_row.items() if col_idx in index_to_id}
+            if values.get('id') is None:
+                logger.warning(f"⚠️ Skipping new row without id (column {id_index})")
+                continue
+            column_list = ', '.join(f'"{col}"' for col in values)
+            placeholders = ', '.join('?' for _ in values)
+            conn.execute(f'INSERT OR REPLACE INTO master ({column_list}) VALUES ({placeholders})', list(values.values()))
+
+        conn.execute('INSERT INTO excel_outbox (change) VALUES (?)', (journal.encode_change(changes),))
+        _bump_data_version(conn)
+
+    logger.info(f"✅ Committed to master store: {len(updates)} cells updated, {len(inserts)} rows added, {len(deletes)} rows deleted")
+
+    if config['master_store'].get('export', 'background') == 'background':
+        schedule_export(config)
+
+
+def pending_exports(config):
+    """Number of committed change sets not yet written to the Excel snapshot."""
+    with _connect(config) as conn:
+        return _pending_count(conn)
+
+
+def workbook_modified(config):
+    """True when the workbook was edited outside the app while changes wait for export."""
+    with _connect(config) as conn:
+        pending = _pending_count(conn)
+        excel_mtime = _get_meta(conn, 'excel_mtime')
+    current_mtime = _workbook_mtime(config)
+    return bool(pending) and current_mtime is not None and current_mtime != excel_mtime
+
+
+def export_snapshot(config):
+    """
+    Write all pending change sets to the Excel workbook in a single patch.
+
+    Only the changed cells are patched, so edits made in the workbook outside the app
+    are kept; the database is then refreshed from the patched workbook so it holds
+    them too (on the same cell, the app's change wins).
+
+    Returns:
+        Number of change sets exported (0 if there was nothing to do)
+    """
+    with _export_lock:
+        with _connect(config) as conn:
+            entries = conn.execute('SELECT seq, change FROM excel_outbox ORDER BY seq').fetchall()
+            modified_outside = _workbook_mtime(config) != _get_meta(conn, 'excel_mtime')
+        if not entries:
+            return 0
+
+        id_index = persistence.get_column_index(config).get('id', 0)
+        merged = journal.merge_changes((journal.decode_change(change) for _, change in entries), id_index)
+        persistence.patch_workbook(config, merged)
+
+        last_seq = entries[-1][0]
+        with _connect(config) as conn:
+            conn.execute('DELETE FROM excel_outbox WHERE seq <= ?', (last_seq,))
+            _set_meta(conn, 'excel_mtime', _workbook_mtime(config))
+
+        if modified_outside:
+            logger.warning("⚠️ Workbook was modified outside the app since the last export; reloading it into the master store")
+            try:
+                import_workbook(config)
+            except ValueError as e:
+                logger.warning(f"⚠️ Workbook edits not loaded, keeping the master store as it was: {e}")
+
+    logger.info(f"✅ Exported {len(entries)} change sets to {config['excel_path']}")
+    return len(entries)
+
+
+def schedule_export(config):
+    """Export the Excel snapshot in the background once edits pause for export_delay_seconds."""
+    global _export_timer
+    delay = config['master_store'].get('export_delay_seconds', 10)
+
+    def run_export():
+        try:
+            export_snapshot(config)
+        except Exception as e:
+            # Typically the workbook is open/locked; changes stay queued for the next export
+            logger.warning(f"⚠️ Background Excel export failed, will retry on next load or change: {e}")
+
+    with _timer_lock:
+        if _export_timer is not None:
+            _export_timer.cancel()
+        _export_timer = threading.Timer(delay, run_export)
+        _export_timer.daemon = True
+        _export_timer.start()
+
+
+@contextlib.contextmanager
+def _connect(config):
+    """Open the database in a transaction, creating or migrating the schema as needed."""
+    conn = sqlite3.connect(get_db_path(config), timeout=30)
+    try:
+        # WAL lets sessions keep reading while another one commits
+        conn.execute('PRAGMA journal_mode=WAL')
+        with conn:
+            types = column_types(config)
+            column_defs = ', '.join(f'"{col}" {sql_type}' + (' PRIMARY KEY' if col == 'id' else '') for col, sql_type in types.items())
+            conn.execute(f'CREATE TABLE IF NOT EXISTS master ({column_defs})')
+            conn.execute('CREATE TABLE IF NOT EXISTS excel_outbox (seq INTEGER PRIMARY KEY AUTOINCREMENT, change TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)')
+
+            # Columns added to excel_interpreter_spec after the database was created
+            existing = {row[1] for row in conn.execute('PRAGMA table_info(master)')}
+            for col, sql_type in types.items():
+                if col not in existing:
+                    conn.execute(f'ALTER TABLE master ADD COLUMN "{col}" {sql_type}')
+
+            yield conn
+    finally:
+        conn.close()
+
+
+def _workbook_mtime(config):
+    excel_path = config['excel_path']
+    return str(os.path.getmtime(excel_path)) if os.path.exists(excel_path) else None
+
+
+def _pending_count(conn):
+    return conn.execute('SELECT COUNT(*) FROM excel_outbox').fetchone()[0]
+
+
+def _get_meta(conn, key):
+    row = conn.execute('SELECT value FROM store_meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(conn, key, value):
+    conn.execute('INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)', (key, value))
+
+
+def _bump_data_version(conn):
+    """Mark the master table as changed; keys the load cache for this database."""
+    version = int(_get_meta(conn, 'data_version') or 0) + 1
+    _set_meta(conn, 'data_version', str(version))
+
+
+def _to_sql(value):
+    """Convert a dataframe value to a SQLite parameter (datetimes as ISO text)."""
+    value = persistence.to_cell_value(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime.datetime) else value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
@@ -0,0 +1,102 @@
+import logging
+import json
+import os
+import tempfile
+from fuzzywuzzy import utils
+import config_paths
+import name_index
+
+logger = logging.getLogger(__name__)
+
+# Phase 2 names are compared in process.extractOne's own form (case and punctuation
+# folded, accents kept): with accents stripped, different people such as 'Pau García
+# García' and 'Joan Garcia Garcia' reach the cutoff
+PROCESSOR = utils.full_process
+# Bump when the comparison changes, so stored decisions are redone
+MATCHER = 'full_process-1'
+
+
+def is_enabled(config):
+    """True when config.json has a match_cache entry."""
+    return bool(config.get('match_cache', {}).get('path'))
+
+
+def get_cache_path(config):
+    """Decision file path (see config_paths.resolve)."""
+    return config_paths.resolve(config, config['match_cache']['path'])
+
+
+def extract_best(config, queries, choices, score_cutoff=85):
+    """
+    name_index.extract_best, reusing the decisions of earlier syncs.
+
+    Names decided on a previous run are only compared with the master names added or
+    renamed since then; a decision is redone in full when its matched master name is
+    gone. New or changed phase 2 names are matched against all master names.
+
+    Args:
+        config: Configuration dict
+        queries: Phase 2 names to match
+        choices: Master names, in master order
+        score_cutoff: Minimum fuzz.ratio score
+
+    Returns:
+        [(choice, score) or None] aligned with queries
+    """
+    cached = _read(config)
+    compatible = cached.get('score_cutoff') == score_cutoff and cached.get('matcher') == MATCHER
+    decisions = cached['decisions'] if compatible else {}
+    known_choices = set(cached.get('choices', [])) if decisions else set()
+
+    current = set(choices)
+    added = [choice for choice in dict.fromkeys(choices) if choice not in known_choices]
+    position = {}
+    for i, choice in enumerate(choices):
+        position.setdefault(choice, i)
+
+    distinct = list(dict.fromkeys(queries))
+    reused = [query for query in distinct if query in decisions
+              and (decisions[query] is None or decisions[query][0] in current)]
+    reused_set = set(reused)
+    to_match = [query for query in distinct if query not in reused_set]
+
+    results = dict(zip(to_match, name_index.extract_best(to_match, choices, score_cutoff, processor=PROCESSOR)))
+    if reused and added:
+        # A new master name replaces the earlier decision if it scores higher, or equal and comes first
+        for query, new_best in zip(reused, name_index.extract_best(reused, added, score_cutoff, processor=PROCESSOR)):
+            best = decisions[query]
+            if new_best is not None and (best is None or new_best[1] > best[1]
+                                         or (new_best[1] == best[1] and position[new_best[0]] < position[best[0]])):
+                best = new_best
+            results[query] = best
+    else:
+        results.update((query, decisions[query]) for query in reused)
+    results = {query: None if best is None else (best[0], best[1]) for query, best in results.items()}
+
+    logger.info(f"✅ Matched {len(to_match)} new names, reused {len(reused)} earlier decisions "
+                f"({len(added) if reused else 0} new master names checked)")
+    updated = {'score_cutoff': score_cutoff, 'matcher': MATCHER, 'choices': list(dict.fromkeys(choices)),
+               'decisions': {query: None if results[query] is None else list(results[query]) for query in distinct}}
+    if updated != cached:
+        _write(config, updated)
+    return [results[query] for query in queries]
+
+
+def _read(config):
+    try:
+        with open(get_cache_path(config), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(config, cached):
+    path = get_cache_path(config)
+    try:
+        with tempfile.NamedTemporaryFile('w', delete=False, dir=os.path.dirname(path), suffix='.json', encoding='utf-8') as tmp_file:
+            json.dump(cached, tmp_file, ensure_ascii=False)
+            tmp_path = tmp_file.name
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # The cache only saves time; matching already succeeded
+        logger.warning(f"⚠️ Could not write match cache {path}: {e}")
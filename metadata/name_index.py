@@ -0,0 +1,209 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from collections import Counter
+from fuzzywuzzy import fuzz, utils
+import persistence
+import normalization
+
+# Session key holding the name index of the session dataframe
+INDEX_KEY = 'name_index'
+
+
+def extract(df, search_term, mask=None, score_cutoff=70):
+    """
+    Names of df scoring at least score_cutoff against search_term with fuzz.partial_ratio.
+
+    Ranked like process.extract(search_term, names, scorer=fuzz.partial_ratio, limit=None)
+    filtered at score_cutoff, where names are the non-empty names of the selected rows and
+    both sides are compared in extract's own utils.full_process form. Only names whose
+    character counts allow the cutoff are scored, so a search costs one vectorized pass
+    over the distinct names' character counts plus the fuzzy comparisons of a shortlist.
+
+    The shortlist comes from character counts rather than trigram postings: partial_ratio
+    is an indel ratio, and at a cutoff of 70 a name can share no trigram with the query
+    and still pass ('abcdefgh' and 'abxdexgh' score 75), so a trigram filter would drop
+    results.
+
+    Args:
+        df: Session dataframe
+        search_term: Text typed in the search box
+        mask: Boolean row mask (e.g. from filter_index.get_mask); all rows when None
+        score_cutoff: Minimum partial_ratio score
+
+    Returns:
+        [(name, score)], best score first
+    """
+    index = _get_index(df)
+    query = utils.full_process(search_term)
+
+    selected = index['codes'] >= 0
+    if mask is not None:
+        selected &= mask
+    rows = np.flatnonzero(selected)
+    codes = index['codes'][rows]
+    candidates = np.unique(codes)
+
+    # partial_ratio is 2 * common characters / (shorter + window length), where the window
+    # is a len(shorter) slice of the longer string; the common characters can't exceed the
+    # characters both contain, first checked on whole names, then on every window
+    query_counts = [(index['chars'][char], count) for char, count in Counter(query).items() if char in index['chars']]
+    min_ratio = (score_cutoff - 0.5) / 100 - 1e-9
+    overlap = np.zeros(len(candidates))
+    for column, count in query_counts:
+        overlap += np.minimum(index['counts'][candidates, column], count)
+    shorter = np.minimum(index['lengths'][candidates], len(query))
+    candidates = candidates[2 * overlap >= min_ratio * (shorter + overlap)]
+
+    longer = candidates[index['lengths'][candidates] > len(query)]
+    if len(query) and len(longer):
+        windows = _window_overlap(index['chars_by_position'][longer], query_counts, len(query))
+        too_far = longer[2 * windows < min_ratio * (len(query) + windows)]
+        candidates = np.setdiff1d(candidates, too_far, assume_unique=True)
+
+    candidate_scores = np.zeros(len(index['processed']), dtype=int)
+    for code in candidates:
+        candidate_scores[code] = fuzz.partial_ratio(query, index['processed'][code])
+    scores = candidate_scores[codes]
+
+    matched = np.flatnonzero(scores >= score_cutoff)
+    matched = matched[np.argsort(-scores[matched], kind='stable')]
+    names = df['name'].to_numpy()
+    return [(names[rows[i]], int(scores[i])) for i in matched]
+
+
+def extract_best(queries, choices, score_cutoff=85, blocks=None, processor=None):
+    """
+    Best fuzz.ratio match among choices for each query, kept when it reaches score_cutoff.
+
+    Picks like process.extractOne(query, choices, scorer=fuzz.ratio, processor=processor),
+    comparing the processed forms. Only choices whose length and character counts allow
+    the cutoff are scored; repeated queries are scored once.
+
+    The length bands and character counts never exclude a choice that could reach the
+    cutoff. Token-set or surname-initial blocks would: with typos, a name's best match
+    can share no word with it or start its surname differently. They are therefore only
+    applied when passed as blocks. There is no process pool either: scoring the
+    shortlists of a 1000-name form takes about 0.2 s.
+
+    Args:
+        queries: Names to match
+        choices: Candidate names, in the order extractOne would see them
+        score_cutoff: Minimum fuzz.ratio score
+        blocks: Optional blocking index {processed word: choice positions}; a query is
+            then only compared with the choices listed under one of its words
+        processor: Function giving the compared form of a name; normalization.normalize_name
+            (accents stripped) when None. Pass utils.full_process for extractOne's own
+            processing, which keeps accents
+
+    Returns:
+        [(choice, score) or None] aligned with queries
+    """
+    if not queries:
+        return []
+    if processor is None:
+        processed_choices = normalization.normalize_names(choices).tolist()
+        processor = normalization.normalize_name
+    else:
+        processed_choices = [processor(choice) for choice in choices]
+    # Codes follow first appearance, so the lowest code among equal scores is extractOne's pick
+    codes, uniques = pd.factorize(pd.Series(processed_choices, dtype=object))
+    _, first_choice = np.unique(codes, return_index=True)
+    index = _build_counts(list(uniques))
+    by_length = np.argsort(index['lengths'], kind='stable')
+    sorted_lengths = index['lengths'][by_length]
+    block_codes = None if blocks is None else {word: np.unique(codes[positions]) for word, positions in blocks.items()}
+    min_ratio = (score_cutoff - 0.5) / 100 - 1e-9
+
+    best = {}
+    results = []
+    for query in queries:
+        query = processor(query)
+        if query not in best:
+            if block_codes is None:
+                # fuzz.ratio is 2 * common characters / total length: lengths too far apart can't reach the cutoff
+                low = np.searchsorted(sorted_lengths, len(query) * min_ratio / (2 - min_ratio), side='left')
+                high = np.searchsorted(sorted_lengths, len(query) * (2 - min_ratio) / min_ratio, side='right')
+                candidates = np.sort(by_length[low:high])
+            else:
+                in_blocks = [block_codes[word] for word in set(query.split()) if word in block_codes]
+                candidates = np.unique(np.concatenate(in_blocks)) if in_blocks else np.array([], dtype=int)
+            best[query] = _best_ratio(query, candidates, index, uniques, min_ratio, score_cutoff)
+        code, score = best[query]
+        results.append(None if code is None else (choices[first_choice[code]], score))
+    return results
+
+
+def _best_ratio(query, candidates, index, uniques, min_ratio, score_cutoff):
+    """(code, score) of the best candidate for a normalized query, (None, None) below the cutoff."""
+    if not query or not len(candidates):
+        return None, None
+    # fuzz.ratio is 2 * common characters / total length, so choices sharing too few
+    # characters with the query can't reach the cutoff
+    overlap = np.zeros(len(candidates))
+    for char, count in Counter(query).items():
+        column = index['chars'].get(char)
+        if column is not None:
+            overlap += np.minimum(index['counts'][candidates, column], count)
+    candidates = candidates[2 * overlap >= min_ratio * (len(query) + index['lengths'][candidates])]
+
+    best_code, best_score = None, None
+    for code in candidates:
+        score = fuzz.ratio(query, uniques[code])
+        if best_score is None or score > best_score:
+            best_code, best_score = code, score
+    if best_score is None or best_score < score_cutoff:
+        return None, None
+    return best_code, best_score
+
+
+def _get_index(df):
+    """Index for the current dataframe version, rebuilt when the data changed."""
+    version = (st.session_state.get(persistence.VERSION_KEY, 0), id(df), len(df))
+    index = st.session_state.get(INDEX_KEY)
+    if index is None or index['version'] != version:
+        index = _build(df['name'])
+        index['version'] = version
+        st.session_state[INDEX_KEY] = index
+    return index
+
+
+def _window_overlap(positions, query_counts, width):
+    """Most query characters found in any width-long slice of each name."""
+    overlap = np.zeros((len(positions), positions.shape[1] - width + 1))
+    for code, count in query_counts:
+        hits = np.zeros((len(positions), positions.shape[1] + 1), dtype=np.int32)
+        np.cumsum(positions == code, axis=1, out=hits[:, 1:])
+        overlap += np.minimum(hits[:, width:] - hits[:, :-width], count)
+    return overlap.max(axis=1)
+
+
+def _build(names):
+    """Distinct names in utils.full_process form, with per-name character counts and positions."""
+    codes, uniques = pd.factorize(names)
+    index = _build_counts([utils.full_process(name) for name in uniques])
+    index['codes'] = codes
+    return index
+
+
+def _build_counts(processed):
+    """Character counts and left-aligned character codes (0-padded) of processed names."""
+    chars = {}
+    for name in processed:
+        for char in name:
+            chars.setdefault(char, len(chars) + 1)
+    lengths = np.array([len(name) for name in processed], dtype=int)
+    chars_by_position = np.zeros((len(processed), lengths.max(initial=0)), dtype=np.uint16)
+    counts = np.zeros((len(processed), len(chars) + 1), dtype=np.uint16)
+    for row, name in enumerate(processed):
+        name_codes = [chars[char] for char in name]
+        chars_by_position[row, :len(name_codes)] = name_codes
+        for code, count in Counter(name_codes).items():
+            counts[row, code] = count
+    return {
+        'processed': processed,
+        'lengths': lengths,
+        'chars': chars,
+        'counts': counts,
+        'chars_by_position': chars_by_position,
+    }
@@ -0,0 +1,53 @@
+import pandas as pd
+import re
+import unicodedata
+
+# Bump when normalize_name changes, so stored match decisions are redone
+VERSION = 1
+
+# Anything but letters and digits separates tokens
+_SEPARATORS = re.compile(r'[\W_]+')
+# Accents left as separate characters by NFKD decomposition
+_COMBINING_MARKS = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]')
+# Normalized names by (raw value, token_sort); surnames and first names repeat a lot
+_memo = {}
+MAX_MEMO = 500000
+
+
+def normalize_name(value, token_sort=False):
+    """
+    Comparable form of a person's name: case-folded, accents stripped, punctuation and
+    repeated whitespace collapsed to single spaces ('  José  García-Núñez' -> 'jose garcia nunez').
+
+    Args:
+        value: Name; missing values normalize to ''
+        token_sort: Also sort the words. Off by default: swapped surnames are usually
+            different people ('Pérez García' and 'García Pérez')
+    """
+    if pd.isna(value):
+        return ''
+    key = (value, token_sort)
+    normalized = _memo.get(key)
+    if normalized is None:
+        text = str(value).casefold()
+        if not text.isascii():
+            text = _COMBINING_MARKS.sub('', unicodedata.normalize('NFKD', text))
+        normalized = _SEPARATORS.sub(' ', text).strip()
+        if token_sort:
+            normalized = ' '.join(sorted(normalized.split()))
+        if len(_memo) >= MAX_MEMO:
+            _memo.clear()
+        _memo[key] = normalized
+    return normalized
+
+
+def normalize_names(values, token_sort=False):
+    """
+    normalize_name over a column, computed once per distinct value.
+
+    Returns:
+        Series aligned with values; missing values stay missing
+    """
+    values = pd.Series(values, dtype=object) if not isinstance(values, pd.Series) else values
+    normalized = {value: normalize_name(value, token_sort) for value in pd.unique(values.dropna())}
+    return values.map(normalized)
@@ -2,17 +2,27 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import logging
-import os
+import participation_index
+import reference_data
 
 logger = logging.getLogger(__name__)
 
+# Hierarchy level -> (code, description) columns of the employee hierarchy
+HIERARCHY_LEVELS = {
+    'DAN': ('COD_DAN', 'DES_DAN'),
+    'DG': ('COD_DG', 'DES_DG'),
+    'DT': ('COD_DT', 'DES_DT')
+}
+# Area totals of the last df_total seen by this process: {'source': df_total, 'totals': ...}
+_area_totals = {}
+
 
 def run(df, filters, config):
     """
     Participation Analysis Module: Compare survey participation against total employee population.
     
     Process:
-    1. Load unfiltered employee and work center data (total population)
+    1. Load unfiltered employee and work center data (total population, see reference_data)
     2. Calculate total employees by hierarchy level (DAN, DG, DT)
     3. Apply filters to survey data (participation)
     4. Calculate participation metrics by hierarchy level
@@ -29,32 +39,9 @@ def run(df, filters, config):
         st.error("⚠️ Employee or work center configuration missing in config.json")
         return
     
-    # Build file paths
-    emp_path = os.path.join(emp_config.get('path', ''), emp_config.get('file', ''))
-    wc_path = os.path.join(wc_config.get('path', ''), wc_config.get('file', ''))
-    
-    # Load unfiltered data (total population)
+    # Load unfiltered data (total population), shared across sessions until the CSVs change
     try:
-        # Load employee data (semicolon separator)
-        df_emp = pd.read_csv(emp_path, sep=';', encoding='utf-8')
-        emp_keep_cols = emp_config.get('keep', [])
-        df_emp = df_emp[emp_keep_cols]
-        
-        # Load work center data (comma separator)
-        df_wc = pd.read_csv(wc_path, sep=',', encoding='utf-8')
-        wc_keep_cols = wc_config.get('keep', [])
-        df_wc = df_wc[wc_keep_cols]
-        
-        # Join employee with work center to get hierarchy
-        df_total = df_emp.merge(
-            df_wc,
-            left_on='FK_CENTRO',
-            right_on='PK_CENTRO',
-            how='left'
-        )
-        
-        logger.info(f"✅ Loaded {len(df_total)} total employees with hierarchy data")
-        
+        df_total = reference_data.load_total(config)
     except FileNotFoundError as e:
         st.error(f"❌ File not found: {e}")
         return
@@ -63,28 +50,27 @@ def run(df, filters, config):
         logger.error(f"Error loading source files: {e}")
         return
     
-    # Apply filters to survey data (participation)
-    filtered_df = df.copy()
-    for col, selected in filters.items():
-        if selected and col in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df[col].isin(selected)]
+    # Totals per area are cached with the population; participant counters follow the
+    # filters and are updated by saves (see participation_index)
+    area_totals = get_area_totals(df_total)
+    participation = participation_index.get_counts(df, filters)
     
     # Pre-calculate aggregated metrics for overall display
     # We'll aggregate by each hierarchy level to get areas with participants (most aggregate to least)
-    hierarchy_levels = ['DAN', 'DG', 'DT']
+    hierarchy_levels = list(HIERARCHY_LEVELS)
     all_treemap_data = {}
     
     for level in hierarchy_levels:
-        treemap_data = generate_treemap_data(df_total, filtered_df, level)
-        if treemap_data is not None and len(treemap_data) > 0:
+        treemap_data = generate_treemap_data(area_totals[level], participation['levels'][level])
+        if len(treemap_data) > 0:
             # Filter to show only areas with at least 1 participant
-            treemap_data = treemap_data[treemap_data['participants'] > 0]
+            treemap_data = treemap_data[treemap_data['participants'] > 0].copy()
             all_treemap_data[level] = treemap_data
     
     # Calculate overall metrics based on aggregated hierarchy data
     # Use the most granular level with data to avoid double counting
     total_employees = 0
-    total_participants = len(filtered_df)
+    total_participants = participation['participants']
     
     # Find areas with participants at each level and sum their total employees
     # Use DT (most granular with good data coverage) if available, else DG, else DAN
@@ -122,72 +108,61 @@ def run(df, filters, config):
             st.warning(f"⚠️ No areas with participants for {level} level")
 
 
-def generate_treemap_data(df_total, df_participants, level):
+def get_area_totals(df_total):
+    """
+    Employees per area for every hierarchy level, from one grouping pass over df_total.
+
+    Employees are counted once per (DAN, DG, DT) combination and each level is rolled up
+    from those counts. The result is kept for the df_total frame, which reference_data
+    shares until the CSVs change, so filter changes never recount the population.
+
+    Returns:
+        {level: DataFrame with the area key (index), 'area' (lowercase) and 'total_employees',
+        largest areas first}
+    """
+    cached = _area_totals.get('totals')
+    if cached is not None and _area_totals.get('source') is df_total:
+        return cached
+
+    des_cols = [des_col for _, des_col in HIERARCHY_LEVELS.values()]
+    combinations = df_total.groupby(des_cols, dropna=False).size()
+
+    totals = {}
+    for level, (_, des_col) in HIERARCHY_LEVELS.items():
+        # Employees without an area at this level are left out
+        total_by_area = combinations.groupby(level=des_col).sum()
+        level_totals = pd.DataFrame({
+            'area': total_by_area.index.str.lower(),
+            'total_employees': total_by_area.to_numpy()
+        }, index=total_by_area.index)
+        level_totals = level_totals[level_totals['area'].notna()]
+        totals[level] = level_totals.sort_values('total_employees', ascending=False)
+
+    _area_totals.update(source=df_total, totals=totals)
+    logger.info(f"✅ Rolled up {len(df_total)} employees into {sum(len(t) for t in totals.values())} areas")
+    return totals
+
+
+def generate_treemap_data(total_by_area, participants_by_area):
     """
     Generate treemap data for a specific hierarchy level.
     
     Args:
-        df_total: Unfiltered employee data with hierarchy
-        df_participants: Filtered survey data (participants)
-        level: Hierarchy level (DAN, DG, DT, RED)
+        total_by_area: Level totals from get_area_totals
+        participants_by_area: {area: participants} (see participation_index.get_counts)
     
     Returns:
         DataFrame with columns: area, total_employees, participants, participation_rate
     """
-    # Map level to column names
-    level_map = {
-        'DAN': ('COD_DAN', 'DES_DAN'),
-        'DG': ('COD_DG', 'DES_DG'),
-        'DT': ('COD_DT', 'DES_DT')
-    }
-    
-    if level not in level_map:
-        return None
-    
-    cod_col, des_col = level_map[level]
-    
-    # Calculate total employees by area (unfiltered)
-    total_by_area = df_total.groupby(des_col).size().reset_index(name='total_employees')
-    
-    # Map survey column names (lowercase)
-    survey_des_col = des_col.lower()
-    
-    # Calculate participants by area (filtered survey data)
-    if survey_des_col in df_participants.columns:
-        participants_by_area = df_participants.groupby(survey_des_col).size().reset_index(name='participants')
-        participants_by_area.columns = [des_col, 'participants']
-    else:
-        # If column not in survey data, no participants
-        participants_by_area = pd.DataFrame({des_col: [], 'participants': []})
-    
-    # Merge total and participants
-    treemap_data = total_by_area.merge(
-        participants_by_area,
-        on=des_col,
-        how='left'
-    )
-    
-    # Fill missing participants with 0
-    treemap_data['participants'] = treemap_data['participants'].fillna(0).astype(int)
+    treemap_data = total_by_area.copy()
+    treemap_data['participants'] = [participants_by_area.get(area, 0) for area in treemap_data.index]
     
     # Calculate participation rate
     treemap_data['participation_rate'] = (
         treemap_data['participants'] / treemap_data['total_employees'] * 100
     ).round(2)
     
-    # Rename area column
-    treemap_data = treemap_data.rename(columns={des_col: 'area'})
-    
-    # Clean area names (lowercase for consistency)
-    treemap_data['area'] = treemap_data['area'].str.lower()
-    
-    # Remove rows with null area
-    treemap_data = treemap_data[treemap_data['area'].notna()]
-    
-    # Sort by total employees (descending)
-    treemap_data = treemap_data.sort_values('total_employees', ascending=False)
-    
-    return treemap_data
+    return treemap_data.reset_index(drop=True)
 
 
 def display_treemap(treemap_data, level):
@@ -204,20 +179,20 @@ def display_treemap(treemap_data, level):
     st.markdown(f"### 🗺️ Treemap: {display_label}")
     
     # Create custom labels
-    treemap_data['label'] = treemap_data.apply(
-        lambda row: f"{row['area']}<br>{row['participants']}/{row['total_employees']} ({row['participation_rate']}%)",
-        axis=1
+    treemap_data['label'] = (
+        treemap_data['area'] + '<br>' + treemap_data['participants'].astype(str) + '/'
+        + treemap_data['total_employees'].astype(str) + ' (' + treemap_data['participation_rate'].astype(str) + '%)'
     )
     
     # Generate color based on participation rate (blue for top, grey shades for rest)
-    treemap_data_sorted = treemap_data.sort_values('participation_rate', ascending=False).reset_index(drop=True)
+    areas_by_rate = treemap_data.sort_values('participation_rate', ascending=False)['area'].tolist()
     
-    n_areas = len(treemap_data_sorted)
+    n_areas = len(areas_by_rate)
     color_map = {}
     
     if n_areas > 0:
         # Top area gets blue
-        color_map[treemap_data_sorted.iloc[0]['area']] = '#1E88E5'
+        color_map[areas_by_rate[0]] = '#1E88E5'
         
         # Rest get grey shades from light to dark
         for i in range(1, n_areas):
@@ -226,7 +201,7 @@ def display_treemap(treemap_data, level):
             else:
                 factor = 1
             gray = int(217 + (64 - 217) * factor)  # From #D9D9D9 (217) to #404040 (64)
-            color_map[treemap_data_sorted.iloc[i]['area']] = f'rgb({gray},{gray},{gray})'
+            color_map[areas_by_rate[i]] = f'rgb({gray},{gray},{gray})'
     
     # Create treemap
     fig = px.treemap(
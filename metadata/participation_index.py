@@ -0,0 +1,128 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import persistence
+import schema
+import filter_index
+
+# Session key holding the participant counters of the session dataframe
+INDEX_KEY = 'participation_index'
+# Hierarchy level -> survey column holding the participant's area
+AREA_COLUMNS = {
+    'DAN': 'des_dan',
+    'DG': 'des_dg',
+    'DT': 'des_dt'
+}
+
+
+def get_counts(df, filters):
+    """
+    Participants matching the sidebar filters, in total and per area of each hierarchy level.
+
+    Counted once per filter selection and kept up to date by apply_changes() when
+    records are saved; recounted only when the filters or the dataframe changed some
+    other way.
+
+    Returns:
+        {'participants': count, 'levels': {level: {area: count}}}; callers must not modify it
+    """
+    version = st.session_state.get(persistence.VERSION_KEY, 0)
+    key = _filters_key(filters)
+    index = st.session_state.get(INDEX_KEY)
+    if index is None or index['version'] != version or index['rows'] != len(df) or index['filters_key'] != key:
+        mask = filter_index.get_mask(df, filters)
+        levels = {}
+        for level, col in AREA_COLUMNS.items():
+            if col in df.columns:
+                counts = df.loc[mask, col].value_counts()
+                levels[level] = {area: int(count) for area, count in counts.items() if count > 0}
+            else:
+                levels[level] = {}
+        index = {
+            'version': version,
+            'rows': len(df),
+            'filters_key': key,
+            'filters': {col: set(selected) for col, selected in filters.items() if selected and col in df.columns},
+            'participants': int(np.count_nonzero(mask)),
+            'levels': levels
+        }
+        st.session_state[INDEX_KEY] = index
+    return {'participants': index['participants'], 'levels': index['levels']}
+
+
+def apply_changes(previous, changes, config, previous_version):
+    """
+    Update the participant counters with a saved change set instead of recounting.
+
+    Each changed record is taken out of the counters as it was and added back as it
+    is now (if it still matches the filters), so an edit costs a few dict updates.
+
+    Args:
+        previous: Dataframe state the change set was computed from
+        changes: Change set from persistence.compute_changes
+        config: Configuration dict
+        previous_version: Dataframe version the counters must match
+    """
+    index = st.session_state.get(INDEX_KEY)
+    if index is None or index['version'] != previous_version:
+        return
+
+    updates = changes.get('updates', {})
+    inserts = changes.get('inserts', [])
+    deletes = changes.get('deletes', [])
+    compiled = schema.get_schema(config)
+    index_to_id = compiled['index_to_id']
+    columns = set(index['filters']) | set(AREA_COLUMNS.values())
+
+    touched_ids = {row_id for row_id, _ in updates} | set(deletes)
+    old_rows = previous[previous['id'].isin(list(touched_ids))].drop_duplicates(subset=['id']).set_index('id')
+
+    new_values = {}
+    for (row_id, col_idx), value in updates.items():
+        col = index_to_id.get(col_idx)
+        if col in columns:
+            new_values.setdefault(row_id, {})[col] = value
+
+    try:
+        for row_id in touched_ids:
+            old_row = {col: old_rows.at[row_id, col] for col in columns if col in old_rows.columns}
+            _add(index, old_row, -1)
+            if row_id not in deletes:
+                _add(index, {**old_row, **new_values.get(row_id, {})}, 1)
+        for new_row in inserts:
+            _add(index, {index_to_id[col_idx]: value for col_idx, value in new_row.items()
+                         if index_to_id.get(col_idx) in columns}, 1)
+    except KeyError:
+        # Row not found in the previous state; recount on next use
+        del st.session_state[INDEX_KEY]
+        return
+
+    index['rows'] += len(inserts) - len(deletes)
+    index['version'] = st.session_state.get(persistence.VERSION_KEY, 0)
+
+
+def _filters_key(filters):
+    return tuple((col, tuple(selected)) for col, selected in filters.items())
+
+
+def _matches(index, row):
+    """True when a record passes the filters the counters were built for (as filter_index.get_mask)."""
+    for col, selected in index['filters'].items():
+        value = row.get(col)
+        if pd.isna(value) or value not in selected:
+            return False
+    return True
+
+
+def _add(index, row, delta):
+    if not _matches(index, row):
+        return
+    index['participants'] += delta
+    for level, col in AREA_COLUMNS.items():
+        area = row.get(col)
+        if pd.isna(area):
+            continue
+        counts = index['levels'][level]
+        counts[area] = counts.get(area, 0) + delta
+        if counts[area] <= 0:
+            del counts[area]
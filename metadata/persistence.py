@@ -0,0 +1,351 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import logging
+import tempfile
+import os
+from openpyxl import load_workbook
+import master_store
+import load_cache
+import schema
+import facet_index
+import participation_index
+import journal
+import workbook_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Session key holding the last dataframe state known to be in the workbook
+BASELINE_KEY = 'df_persisted'
+# Session key counting saves of the session dataframe, for caches derived from it
+VERSION_KEY = 'df_version'
+# Session key set while the session dataframe holds edits not yet saved (see mark_unsaved)
+UNSAVED_KEY = 'df_unsaved'
+
+
+def get_column_index(config):
+    """Map column_id -> zero-based Excel column index from excel_interpreter_spec."""
+    return schema.get_schema(config)['id_to_index']
+
+
+def load_master(config):
+    """
+    Load the master dataframe from the configured store.
+
+    Reads the embedded master database when one is configured (see master_store.py),
+    otherwise the master workbook plus any journaled edits not yet compacted into it
+    (see journal.py).
+    """
+    if master_store.is_enabled(config):
+        return master_store.load(config)
+    df = read_workbook(config)
+    if journal.is_enabled(config):
+        df = journal.replay(config, df)
+    return df
+
+
+def read_workbook(config):
+    """
+    Load the master workbook and map its columns to the column_ids in config.
+
+    The mapped frame is cached (see load_cache.py) until the workbook content or
+    excel_interpreter_spec changes, so only a changed workbook is parsed again.
+
+    Returns:
+        DataFrame with one column per mapped column_id, in config order
+    """
+    if not load_cache.is_enabled(config):
+        return _parse_workbook(config)
+    excel_path = config['excel_path']
+    version = f"{load_cache.file_version(config, 'workbook', excel_path)}:{schema.get_schema(config)['fingerprint']}"
+    df = load_cache.get_or_load(config, 'workbook', version, lambda: _parse_workbook(config), source_path=excel_path)
+    # Parquet keeps string categoricals only; numeric ones come back dense
+    return schema.apply_dtypes(df, config)
+
+
+def _parse_workbook(config):
+    excel_path = config['excel_path']
+    excel_spec = config['excel_interpreter_spec']
+    sheet = excel_spec['sheet_name']
+
+    # Preserve column order from config
+    usecols = [col['column'] for col in excel_spec['columns']]
+    # The mapped frame is what load_cache keeps, so the parsed cells are not cached
+    snapshot = workbook_snapshot.load(excel_path, sheet, config, use_cache=False)
+    df = workbook_snapshot.frame(snapshot, usecols=usecols, skiprows=1)
+    df.columns = [str(i) for i in usecols]
+
+    # Map columns based on config
+    for col_spec in excel_spec['columns']:
+        if col_spec['column_id'] != 'skip':
+            column_idx = str(col_spec['column'])
+            if column_idx in df.columns:
+                df[col_spec['column_id']] = df[column_idx]
+
+    # Keep only the mapped columns, with their declared dtypes
+    df = df[schema.get_schema(config)['columns']].copy()
+    return schema.apply_dtypes(df, config)
+
+
+def remember_state(df):
+    """Record df as the last state known to be persisted in the workbook."""
+    st.session_state[BASELINE_KEY] = df.copy()
+    st.session_state[VERSION_KEY] = st.session_state.get(VERSION_KEY, 0) + 1
+
+
+def mark_unsaved():
+    """
+    Record that the session dataframe was edited in memory without being saved.
+
+    The version is bumped so caches derived from the dataframe are rebuilt, while the
+    baseline stays the last saved state, so the next save_changes() writes these edits.
+    """
+    st.session_state[UNSAVED_KEY] = True
+    st.session_state[VERSION_KEY] = st.session_state.get(VERSION_KEY, 0) + 1
+
+
+def compute_changes(previous, current, config):
+    """
+    Compute the cell-level delta between two versions of the master dataframe.
+
+    Rows are aligned on 'id'; only columns mapped in excel_interpreter_spec are compared.
+
+    Returns:
+        dict with:
+            'updates': {(row_id, column_index): value} for changed cells of existing rows
+            'inserts': list of {column_index: value} for rows only present in current
+            'deletes': list of row ids only present in previous
+    """
+    column_index = get_column_index(config)
+
+    prev = previous.drop_duplicates(subset=['id']).set_index('id')
+    cur = current.drop_duplicates(subset=['id']).set_index('id')
+    compare_cols = [col for col in column_index if col != 'id' and col in cur.columns]
+
+    # Align the rows present in both versions once; set operations on the id index
+    if prev.index.equals(cur.index):
+        common_ids = cur.index
+        prev_common, cur_common = prev, cur
+    else:
+        common_ids = cur.index.intersection(prev.index, sort=False)
+        prev_common, cur_common = prev.reindex(common_ids), cur.reindex(common_ids)
+
+    updates = {}
+    for col in compare_cols:
+        new_values = cur_common[col]
+        if col in prev_common.columns:
+            old_values = prev_common[col]
+            # Cheap whole-column check first; most columns are untouched by an edit
+            if old_values.equals(new_values):
+                continue
+            try:
+                # Native comparison (category codes, flags, datetimes); boxing to objects is the slow part
+                equal = old_values.eq(new_values)
+            except TypeError:
+                # Categoricals with different categories
+                equal = old_values.astype(object).eq(new_values.astype(object))
+            equal = equal.to_numpy(dtype=bool, na_value=False)
+            changed = ~(equal | (old_values.isna().to_numpy() & new_values.isna().to_numpy()))
+        else:
+            changed = new_values.notna().to_numpy()
+        positions = np.flatnonzero(changed)
+        col_idx = column_index[col]
+        changed_values = new_values.iloc[positions].astype(object).to_numpy()
+        updates.update(zip(((row_id, col_idx) for row_id in common_ids[positions]), changed_values))
+
+    new_ids = cur.index.difference(prev.index, sort=False)
+    new_rows = cur.loc[new_ids, compare_cols].astype(object)
+    new_rows.columns = [column_index[col] for col in compare_cols]
+    new_rows.insert(0, column_index['id'], new_ids.astype(object))
+    inserts = new_rows.to_dict('records')
+
+    deletes = list(prev.index.difference(cur.index, sort=False))
+
+    return {'updates': updates, 'inserts': inserts, 'deletes': deletes}
+
+
+def apply_to_frame(df, changes, config):
+    """
+    Apply a change set from compute_changes to a master dataframe (column_ids as columns).
+
+    Updates are applied per column in one vectorized assignment, deletes as a single
+    id mask and inserts as a single concat.
+
+    Returns:
+        The updated dataframe
+    """
+    index_to_id = schema.get_schema(config)['index_to_id']
+    keys = df['id'].map(normalize_id)
+
+    by_column = {}
+    for (row_id, col_idx), value in changes.get('updates', {}).items():
+        column_id = index_to_id.get(col_idx)
+        if column_id in df.columns:
+            by_column.setdefault(column_id, {})[normalize_id(row_id)] = value
+    for column_id, values in by_column.items():
+        mask = keys.isin(values.keys()).to_numpy()
+        new_values = keys[mask].map(values)
+        if isinstance(df[column_id].dtype, pd.CategoricalDtype):
+            schema.add_categories(df, column_id, new_values)
+        elif df[column_id].dtype != object and new_values.map(lambda value: isinstance(value, str)).any():
+            df[column_id] = df[column_id].astype(object)
+        df.loc[mask, column_id] = new_values.to_numpy()
+
+    deletes = {normalize_id(row_id) for row_id in changes.get('deletes', [])}
+    if deletes:
+        df = df[~keys.isin(deletes).to_numpy()]
+
+    new_rows = [{index_to_id[col_idx]: value for col_idx, value in new_row.items() if col_idx in index_to_id}
+                for new_row in changes.get('inserts', [])]
+    if new_rows:
+        df = pd.concat([df, pd.DataFrame(new_rows, columns=df.columns)], ignore_index=True)
+        # concat falls back to object for categoricals whose categories differ
+        df = schema.apply_dtypes(df, config)
+    return df
+
+
+def apply_changes(config, changes):
+    """
+    Apply a change set from compute_changes to the configured store.
+
+    With a master database the change is committed there and the Excel snapshot is
+    exported later; with an edit journal the change is journaled and compacted into
+    the workbook later; otherwise the workbook is patched directly.
+    """
+    if master_store.is_enabled(config):
+        master_store.apply_changes(config, changes)
+    elif journal.is_enabled(config):
+        journal.append(config, changes)
+    else:
+        patch_workbook(config, changes)
+
+
+def patch_workbook(config, changes):
+    """
+    Patch the master workbook in place with a change set from compute_changes.
+
+    Only the affected cells are touched; the rest of the sheet (including columns
+    not mapped in config) is preserved. Inserts whose id is already in the sheet
+    overwrite that row, so re-applying a change set does not duplicate rows. Uses
+    atomic write pattern (temp file + replace).
+    """
+    updates = changes.get('updates', {})
+    inserts = changes.get('inserts', [])
+    deletes = changes.get('deletes', [])
+
+    if not updates and not inserts and not deletes:
+        return
+
+    excel_path = config['excel_path']
+    sheet = config['excel_interpreter_spec']['sheet_name']
+    id_col = get_column_index(config).get('id', 0) + 1
+
+    wb = load_workbook(excel_path)
+    ws = wb[sheet]
+
+    # Locate each id in the sheet (row 1 is the header)
+    row_by_id = {}
+    id_cells = ws.iter_rows(min_row=2, min_col=id_col, max_col=id_col, values_only=True)
+    for row_number, (value,) in enumerate(id_cells, start=2):
+        if value is not None:
+            row_by_id.setdefault(normalize_id(value), row_number)
+
+    for (row_id, col_idx), value in updates.items():
+        row_number = row_by_id.get(normalize_id(row_id))
+        if row_number is None:
+            logger.warning(f"⚠️ Could not find id {row_id} in Excel")
+            continue
+        ws.cell(row=row_number, column=col_idx + 1, value=to_cell_value(value))
+
+    # An inserted id already in the sheet was written by an earlier patch whose outbox or
+    # journal was not cleared (e.g. a crash in between); overwrite that row instead of
+    # appending a duplicate
+    new_rows = []
+    for new_row in inserts:
+        row_id = new_row.get(id_col - 1)
+        row_number = None if row_id is None or pd.isna(row_id) else row_by_id.get(normalize_id(row_id))
+        if row_number is None:
+            new_rows.append(new_row)
+            continue
+        for col_idx, value in new_row.items():
+            ws.cell(row=row_number, column=col_idx + 1, value=to_cell_value(value))
+
+    # Delete bottom-up so earlier row numbers stay valid
+    delete_rows = sorted((row_by_id[normalize_id(row_id)] for row_id in deletes if normalize_id(row_id) in row_by_id), reverse=True)
+    for row_number in delete_rows:
+        ws.delete_rows(row_number)
+
+    next_row = ws.max_row + 1
+    for new_row in new_rows:
+        for col_idx, value in new_row.items():
+            ws.cell(row=next_row, column=col_idx + 1, value=to_cell_value(value))
+        next_row += 1
+
+    # Write to a temporary file first
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', dir=os.path.dirname(excel_path)) as tmp_file:
+        tmp_path = tmp_file.name
+    wb.save(tmp_path)
+
+    # Atomically replace the original file
+    os.replace(tmp_path, excel_path)
+
+    logger.info(f"✅ Patched workbook: {len(updates)} cells updated, {len(new_rows)} rows added, {len(inserts) - len(new_rows)} rows rewritten, {len(delete_rows)} rows deleted")
+
+
+def save_changes(df, config, allow_deletes=True):
+    """
+    Persist df by writing only what changed since the last known workbook state.
+
+    Args:
+        df: Master dataframe (column_ids as columns)
+        config: Configuration dict
+        allow_deletes: If False, ids missing from df are left untouched in the workbook
+
+    Returns:
+        The change set that was applied
+    """
+    baseline = st.session_state.get(BASELINE_KEY)
+    if baseline is None:
+        baseline = load_master(config)
+
+    changes = compute_changes(baseline, df, config)
+    if not allow_deletes:
+        changes['deletes'] = []
+
+    previous_version = st.session_state.get(VERSION_KEY, 0)
+    apply_changes(config, changes)
+    remember_state(df)
+    # Counts built since unsaved edits already include them, so those are recounted instead
+    if not st.session_state.pop(UNSAVED_KEY, False):
+        # Keep the sidebar's value counts and participation counters current without recounting
+        facet_index.apply_changes(baseline, changes, config, previous_version)
+        participation_index.apply_changes(baseline, changes, config, previous_version)
+    return changes
+
+
+def normalize_id(value):
+    """Normalize an id so 12, 12.0 and '12' locate the same row."""
+    if isinstance(value, str):
+        value = value.strip()
+        try:
+            value = float(value)
+        except ValueError:
+            return value
+    try:
+        as_float = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    return int(as_float) if as_float.is_integer() else as_float
+
+
+def to_cell_value(value):
+    """Convert pandas/numpy scalars to values openpyxl can write."""
+    if value is None:
+        return None
+    if not isinstance(value, (list, tuple, dict)) and pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
 import logging
-from fuzzywuzzy import fuzz
-from fuzzywuzzy import process
+import persistence
+import schema
+import filter_index
+import name_index
 
 logger = logging.getLogger(__name__)
 
@@ -34,21 +36,16 @@ def run(df, filters, config):
         st.session_state['last_tab'] = 'phase_two_entry'
     
     # Apply filters
-    filtered_df = df.copy()
-    for col, selected in filters.items():
-        if selected and col in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df[col].isin(selected) | filtered_df[col].isna()]
+    mask = filter_index.get_mask(df, filters, include_missing=True)
+    filtered_df = df[mask]
     
     # Search bar
     search_term = st.text_input("Search by name (fuzzy)", "", key="phase2_search")
     
     # Fuzzy search
     if search_term:
-        names = filtered_df['name'].dropna().tolist()
-        matches = process.extract(search_term, names, scorer=fuzz.partial_ratio, limit=None)
-        good_matches = [(match[0], match[1]) for match in matches if match[1] >= 70]
+        good_matches = name_index.extract(df, search_term, mask, score_cutoff=70)
         if good_matches:
-            good_matches.sort(key=lambda x: x[1], reverse=True)
             matched_names = [name for name, score in good_matches]
             filtered_df = filtered_df[filtered_df['name'].isin(matched_names)]
             name_to_order = {name: i for i, (name, _) in enumerate(good_matches)}
@@ -128,7 +125,7 @@ def render_phase2_edit_form(df, selected_row, config):
     for i, field in enumerate(PHASE1_INDICATOR_FIELDS):
         if field in df.columns:
             with ind_cols[i]:
-                checked = bool(selected_row[field] == 1 or selected_row[field] == '1')
+                checked = schema.is_flag_set(selected_row[field])
                 st.checkbox(field, value=checked, key=f"p2edit_{selected_id}_{field}")
     
     # Phase 2 Fields (editable)
@@ -146,7 +143,7 @@ def render_phase2_edit_form(df, selected_row, config):
     for i, field in enumerate(PHASE2_INDICATOR_FIELDS):
         if field in df.columns:
             with ind_cols[i]:
-                checked = bool(selected_row[field] == 1 or selected_row[field] == '1')
+                checked = schema.is_flag_set(selected_row[field])
                 st.checkbox(field, value=checked, key=f"p2edit_{selected_id}_{field}")
 
     # separator field
@@ -191,7 +188,7 @@ def check_phase2_changes(selected_row, selected_id, df):
             original_value = selected_row.get(field)
             
             if field in PHASE1_INDICATOR_FIELDS + PHASE2_INDICATOR_FIELDS:
-                original_bool = bool(original_value == 1 or original_value == '1')
+                original_bool = schema.is_flag_set(original_value)
                 if current_value != original_bool:
                     return True
             else:
@@ -203,9 +200,6 @@ def check_phase2_changes(selected_row, selected_id, df):
 
 def save_phase2_changes(df, selected_row, selected_id, config):
     """Save Phase 2 changes to dataframe and Excel."""
-    import tempfile
-    import os
-    
     all_fields = PHASE1_INDICATOR_FIELDS + PHASE2_TEXT_FIELDS + PHASE2_INDICATOR_FIELDS + ['txt_review', 'url_1to1']
     idx = df[df['id'] == selected_id].index[0]
     
@@ -220,39 +214,8 @@ def save_phase2_changes(df, selected_row, selected_id, config):
                 new_value = int(1 if new_value else 0)
             df.at[idx, field] = new_value
     
-    # Save to Excel
-    excel_path = config['excel_path']
-    sheet = config['excel_interpreter_spec']['sheet_name']
-    excel_spec = config['excel_interpreter_spec']
-    
-    # Load full Excel
-    full_df = pd.read_excel(excel_path, sheet_name=sheet, header=0, engine='openpyxl')
-    
-    # Get column mapping
-    column_id_to_index = {col['column_id']: col['column'] for col in excel_spec['columns'] if col['column_id'] != 'skip'}
-    
-    # Find ID column
-    id_column_idx = column_id_to_index.get('id', 0)
-    id_column_name = full_df.columns[id_column_idx]
-    
-    # Find row in full_df
-    full_df_mask = full_df[id_column_name] == selected_id
-    if full_df_mask.any():
-        full_df_idx = full_df[full_df_mask].index[0]
-        
-        # Update columns
-        for field in all_fields:
-            if field in column_id_to_index and field in df.columns:
-                col_idx = column_id_to_index[field]
-                if col_idx < len(full_df.columns):
-                    full_df.at[full_df_idx, full_df.columns[col_idx]] = df.at[idx, field]
-        
-        # Write atomically
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', dir=os.path.dirname(excel_path)) as tmp_file:
-            tmp_path = tmp_file.name
-            with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
-                full_df.to_excel(writer, sheet_name=sheet, index=False)
-        os.replace(tmp_path, excel_path)
+    # Save only the changed cells to Excel
+    persistence.save_changes(df, config)
     
     return df
 
@@ -1,8 +1,12 @@
 import streamlit as st
 import pandas as pd
 import logging
-from fuzzywuzzy import fuzz
-from fuzzywuzzy import process
+import persistence
+import schema
+import name_index
+import match_cache
+import sync_rules
+import workbook_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -70,33 +74,23 @@ def run(df, filters, config):
     if st.button("🔍 Load Phase 2 Data"):
         with st.spinner("Loading Phase 2 data..."):
             try:
+                # Parse the workbook once; the views below reuse the parsed cells
+                snapshot = workbook_snapshot.load(phase_two_path, source_sheet, config)
+                
                 # First, get total rows in Excel
-                total_df = pd.read_excel(phase_two_path, sheet_name=source_sheet, header=0, engine='openpyxl')
+                total_df = workbook_snapshot.frame(snapshot, header=0)
                 total_rows = len(total_df)
                 st.info(f"ℹ️ **Total rows in Excel (excluding header)**: {total_rows}")
                 
-                # Read Phase 2 Excel with specified columns
-                df_phase2 = pd.read_excel(
-                    phase_two_path,
-                    sheet_name=source_sheet,
-                    header=None,
-                    usecols=source_columns,
-                    skiprows=1,
-                    engine='openpyxl'
-                )
+                # Phase 2 data with specified columns
+                df_phase2 = workbook_snapshot.frame(snapshot, usecols=source_columns, skiprows=1)
                 df_phase2.columns = [str(i) for i in source_columns[:len(df_phase2.columns)]]
                 
                 loaded_rows = len(df_phase2)
                 st.success(f"✅ Loaded {loaded_rows} records from Phase 2 source (columns {source_columns})")
                 
-                # Load full data to identify rows with no data in source columns
-                full_phase2 = pd.read_excel(
-                    phase_two_path,
-                    sheet_name=source_sheet,
-                    header=None,
-                    skiprows=1,
-                    engine='openpyxl'
-                )
+                # Full data to identify rows with no data in source columns
+                full_phase2 = workbook_snapshot.frame(snapshot, skiprows=1)
                 # Find rows where all source_columns are empty
                 empty_mask = full_phase2[source_columns].isna().all(axis=1) | (full_phase2[source_columns].astype(str) == '').all(axis=1)
                 empty_rows = full_phase2[empty_mask]
@@ -126,7 +120,7 @@ def run(df, filters, config):
         # Match Phase 2 records to existing Phase 1 records by name
         with st.spinner("Matching names..."):
             matched_records, unmatched_records = match_phase2_to_phase1(
-                df, df_phase2, str(name_column)
+                df, df_phase2, str(name_column), config
             )
         
         if len(matched_records) == 0:
@@ -224,7 +218,7 @@ def run(df, filters, config):
     return df
 
 
-def match_phase2_to_phase1(df_master, df_phase2, name_column):
+def match_phase2_to_phase1(df_master, df_phase2, name_column, config=None):
     """
     Match Phase 2 records to Phase 1 records using fuzzy name matching.
     
@@ -232,6 +226,7 @@ def match_phase2_to_phase1(df_master, df_phase2, name_column):
         df_master: Master dataframe (Phase 1 records)
         df_phase2: Phase 2 dataframe
         name_column: Column name containing names in Phase 2 data
+        config: Configuration dict; with a match_cache entry, earlier decisions are reused
     
     Returns:
         matched_records: DataFrame with matched records (master_id, master_name, phase2_name, phase2_idx, match_score)
@@ -244,18 +239,23 @@ def match_phase2_to_phase1(df_master, df_phase2, name_column):
     matched = []
     unmatched = []
     
-    for idx, row in df_phase2.iterrows():
-        phase2_name = row.get(name_column)
-        if pd.isna(phase2_name) or str(phase2_name).strip() == '':
-            unmatched.append(row)
-            continue
-        
-        phase2_name = str(phase2_name).strip()
-        
-        # Fuzzy match
-        match_result = process.extractOne(phase2_name, master_names, scorer=fuzz.ratio)
-        
-        if match_result and match_result[1] >= 85:  # 85% threshold for matching
+    # Names to match; blank ones are unmatched
+    if name_column in df_phase2.columns:
+        phase2_names = [('' if pd.isna(name) else str(name).strip()) for name in df_phase2[name_column]]
+    else:
+        phase2_names = [''] * len(df_phase2)
+    
+    # Fuzzy match, 85% threshold for matching
+    names_to_match = [name for name in phase2_names if name]
+    if config is not None and match_cache.is_enabled(config):
+        match_results = iter(match_cache.extract_best(config, names_to_match, master_names, score_cutoff=85))
+    else:
+        match_results = iter(name_index.extract_best(names_to_match, master_names, score_cutoff=85,
+                                                    processor=match_cache.PROCESSOR))
+    
+    for position, (idx, phase2_name) in enumerate(zip(df_phase2.index, phase2_names)):
+        match_result = next(match_results) if phase2_name else None
+        if match_result:
             best_match_name = match_result[0]
             match_score = match_result[1]
             master_id = name_to_id[best_match_name]
@@ -268,10 +268,10 @@ def match_phase2_to_phase1(df_master, df_phase2, name_column):
                 'match_score': match_score
             })
         else:
-            unmatched.append(row)
+            unmatched.append(position)
     
     matched_df = pd.DataFrame(matched) if matched else pd.DataFrame()
-    unmatched_df = pd.DataFrame(unmatched) if unmatched else pd.DataFrame()
+    unmatched_df = df_phase2.iloc[unmatched] if unmatched else pd.DataFrame()
     
     return matched_df, unmatched_df
 
@@ -289,114 +289,43 @@ def sync_phase2_data(df_master, matched_records, df_phase2, config):
     Returns:
         Updated master dataframe
     """
-    import tempfile
-    import os
-    
     try:
-        excel_path = config['excel_path']
-        sheet = config['excel_interpreter_spec']['sheet_name']
-        excel_spec = config['excel_interpreter_spec']
         phase_two_spec = config['phase_two_spec']
         
-        # Load full Excel with header
-        full_df = pd.read_excel(excel_path, sheet_name=sheet, header=0, engine='openpyxl')
+        # First master row of each matched id; matches whose id is gone are skipped
+        first_rows = ~df_master['id'].duplicated()
+        positions = pd.Index(df_master['id'][first_rows]).get_indexer(matched_records['master_id'])
+        found = positions >= 0
+        master_ids = matched_records['master_id'].to_numpy()[found]
+        master_idx = df_master.index[first_rows.to_numpy()][positions[found]]
         
-        # Get column mapping from config (column_id -> column index in Excel)
-        column_id_to_index = {col['column_id']: col['column'] for col in excel_spec['columns'] if col['column_id'] != 'skip'}
+        # Phase 2 rows of the matches, with the replicate and binary_check rules applied column by column
+        phase2_rows = df_phase2.loc[matched_records['phase2_idx'].to_numpy()[found]]
+        rules = sync_rules.apply_rules(phase_two_spec, phase2_rows)
         
-        # Find the ID column in full_df
-        id_column_idx = None
-        for col_spec in excel_spec['columns']:
-            if col_spec['column_id'] == 'id':
-                id_column_idx = col_spec['column']
-                break
+        # Cells of destinations not mapped to a master column: {(master_id, column index): value}
+        index_to_id = schema.get_schema(config)['index_to_id']
+        unmapped_updates = {}
         
-        id_column_name = full_df.columns[id_column_idx] if id_column_idx is not None else full_df.columns[0]
-        
-        # Get rules from Phase 2 spec
-        replicate_rules = phase_two_spec.get('replicate', [])
-        binary_check_rules = phase_two_spec.get('binary_check', [])
-        missing_field_value = phase_two_spec.get('missing_field_value', 'sin respuesta')
-        missing_fields = phase_two_spec.get('missing_fields', [])
-        
-        # Process each matched record
-        for _, match in matched_records.iterrows():
-            master_id = match['master_id']
-            phase2_idx = match['phase2_idx']
-            
-            # Get Phase 2 row
-            phase2_row = df_phase2.iloc[phase2_idx]
-            
-            # Find the row in full_df
-            full_df_mask = full_df[id_column_name] == master_id
-            if not full_df_mask.any():
-                logger.warning(f"⚠️ Could not find master_id {master_id} in Excel")
-                continue
-            
-            full_df_idx = full_df[full_df_mask].index[0]
-            
-            # Also update df_master
-            master_mask = df_master['id'] == master_id
-            if not master_mask.any():
-                continue
-            master_idx = df_master[master_mask].index[0]
-            
-            # Apply replicate rules
-            for rule in replicate_rules:
-                origin_col = str(rule.get('origin'))
-                dest_col_idx = rule.get('destination')
-                column_id = rule.get('column_id')
-                
-                if origin_col in phase2_row.index:
-                    value = phase2_row[origin_col]
-                    
-                    # Check if value is missing and origin is in missing_fields
-                    origin_int = int(origin_col) if origin_col.isdigit() else None
-                    if (pd.isna(value) or str(value).strip() == '') and origin_int in missing_fields:
-                        value = missing_field_value
-                    
-                    # Update Excel full_df
-                    if dest_col_idx < len(full_df.columns):
-                        full_df.at[full_df_idx, full_df.columns[dest_col_idx]] = value
-                    
-                    # Update df_master
-                    if column_id and column_id in df_master.columns:
-                        df_master.at[master_idx, column_id] = value
-            
-            # Apply binary_check rules
-            for rule in binary_check_rules:
-                source_col = str(rule.get('column'))
-                dest_col_idx = rule.get('destination')
-                column_id = rule.get('column_id', '')
-                
-                if source_col in phase2_row.index:
-                    original_value = phase2_row[source_col]
-                    
-                    # Convert to binary
-                    value_str = str(original_value).strip() if pd.notna(original_value) else ''
-                    binary_value = 1 if 'sí' in value_str.lower() else 0
-                    
-                    # Update Excel full_df
-                    if dest_col_idx < len(full_df.columns):
-                        full_df.at[full_df_idx, full_df.columns[dest_col_idx]] = binary_value
-                    
-                    # Update df_master
-                    if column_id and column_id in df_master.columns:
-                        df_master.at[master_idx, column_id] = binary_value
-        
-        # Write to temporary file first (atomic write)
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', dir=os.path.dirname(excel_path)) as tmp_file:
-            tmp_path = tmp_file.name
-            with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
-                full_df.to_excel(writer, sheet_name=sheet, index=False)
-        
-        # Atomically replace the original file
-        os.replace(tmp_path, excel_path)
+        for rule, values in rules['replicate'] + rules['binary_check']:
+            values = values.to_numpy()
+            column_id = index_to_id.get(rule['destination'])
+            if column_id and column_id in df_master.columns:
+                # Update df_master
+                df_master.loc[master_idx, column_id] = values
+            else:
+                unmapped_updates.update(zip(zip(master_ids, [rule['destination']] * len(master_ids)), values))
         
         # Set all 'ind_' columns to zero where null/NaN
         ind_cols = [col for col in df_master.columns if col.startswith('ind_')]
         if ind_cols:
             df_master[ind_cols] = df_master[ind_cols].fillna(0)
+        
+        # Write every cell that now differs from the stored state (the synced answers,
+        # the zero-filled flags and any other unsaved edit of the session)
+        persistence.save_changes(df_master, config, allow_deletes=False)
+        if unmapped_updates:
+            persistence.apply_changes(config, {'updates': unmapped_updates})
         logger.info(f"✅ Synced {len(matched_records)} Phase 2 records successfully")
         return df_master
         
@@ -0,0 +1,113 @@
+import pandas as pd
+import logging
+import hashlib
+import json
+import os
+import threading
+import load_cache
+
+logger = logging.getLogger(__name__)
+
+# Declared dtypes of the reference columns; 'keep' columns not listed here are inferred
+EMPLOYEE_DTYPES = {
+    'FK_CENTRO': 'float64',
+    'PK_EMPL': 'Int64',
+    'FK_USUARIO': str,
+    'DES_FUN_MAS_CASTELLANO': str,
+    'DES_TAREA_CASTELLANO': str,
+    'DES_POSICION_CASTELLANO': str,
+    'NOMBRE_EMPLEADO': str,
+    'APELLIDO1_EMPLEADO': str,
+    'APELLIDO2_EMPLEADO': str,
+}
+WORKCENTER_DTYPES = {
+    'PK_CENTRO': 'float64',
+    'DES_CENTRO_GES': str,
+    'COD_DAN': 'Int64',
+    'DES_DAN': str,
+    'COD_DG': 'Int64',
+    'DES_DG': str,
+    'COD_DT': 'Int64',
+    'DES_DT': str,
+    'COD_RED': 'Int64',
+    'DES_RED': str,
+    'COD_TOTAL_EMPRESA': 'Int64',
+    'DES_TOTAL_EMPRESA': str,
+}
+
+# Latest frame per name, shared by all sessions of this process: {name: (version, df)}
+_memory = {}
+_lock = threading.Lock()
+
+
+def get_source_path(source_config):
+    """CSV path of a source_path_employees / source_path_workcenters entry."""
+    return os.path.join(source_config.get('path', ''), source_config.get('file', ''))
+
+
+def load_employees(config):
+    """
+    Employee table (source_path_employees): the 'keep' columns, read with EMPLOYEE_DTYPES.
+
+    The frame is shared by all sessions and must not be modified.
+    """
+    return _load_source(config, 'employees', config['source_path_employees'], ';', EMPLOYEE_DTYPES)[1]
+
+
+def load_workcenters(config):
+    """
+    Work center table (source_path_workcenters): the 'keep' columns, read with WORKCENTER_DTYPES.
+
+    The frame is shared by all sessions and must not be modified.
+    """
+    return _load_source(config, 'workcenters', config['source_path_workcenters'], ',', WORKCENTER_DTYPES)[1]
+
+
+def load_total(config):
+    """
+    Employees joined with their work center hierarchy (FK_CENTRO -> PK_CENTRO).
+
+    Rebuilt only when either CSV changes. The frame is shared by all sessions and must
+    not be modified.
+    """
+    emp_version, df_emp = _load_source(config, 'employees', config['source_path_employees'], ';', EMPLOYEE_DTYPES)
+    wc_version, df_wc = _load_source(config, 'workcenters', config['source_path_workcenters'], ',', WORKCENTER_DTYPES)
+    version = (emp_version, wc_version)
+
+    with _lock:
+        cached = _memory.get('total')
+    if cached and cached[0] == version:
+        return cached[1]
+
+    df_total = df_emp.merge(df_wc, left_on='FK_CENTRO', right_on='PK_CENTRO', how='left')
+    with _lock:
+        _memory['total'] = (version, df_total)
+    logger.info(f"✅ Joined {len(df_total)} employees with hierarchy data")
+    return df_total
+
+
+def _load_source(config, name, source_config, sep, dtypes):
+    """(version, frame) of a CSV, reloaded when the file's mtime/size or the 'keep' columns change."""
+    path = get_source_path(source_config)
+    keep = source_config.get('keep', [])
+    stat = os.stat(path)
+    spec = json.dumps({'keep': keep, 'dtypes': {col: str(dtypes.get(col)) for col in keep}})
+    version = f"{stat.st_mtime_ns}-{stat.st_size}-{hashlib.sha1(spec.encode('utf-8')).hexdigest()[:12]}"
+
+    with _lock:
+        cached = _memory.get(name)
+    if cached and cached[0] == version:
+        return cached
+
+    def read_csv():
+        df = pd.read_csv(path, sep=sep, encoding='utf-8', usecols=keep,
+                         dtype={col: dtype for col, dtype in dtypes.items() if col in keep})
+        logger.info(f"✅ Read {len(df)} {name} records from {path}")
+        # Column order of 'keep', not of the file
+        return df[keep]
+
+    # Columnar sidecar (load_cache) when enabled, so new processes skip the CSV parse
+    df = load_cache.get_or_load(config, name, version, read_csv, copy=False)
+    with _lock:
+        _memory[name] = (version, df)
+    return version, df
@@ -0,0 +1,121 @@
+import pandas as pd
+import logging
+import hashlib
+import json
+
+logger = logging.getLogger(__name__)
+
+# Low-cardinality survey fields kept as categoricals (filters then compare category codes);
+# numeric cod_ codes stay numeric, since SQLite and Parquet bring them back dense anyway
+CATEGORY_COLUMNS = ('company', 'place')
+CATEGORY_PREFIXES = ('nvl_', 'des_')
+# 0/1 indicator flags, kept as nullable 1-byte integers
+FLAG_PREFIXES = ('ind_',)
+
+# Bump when the dtype rules above change, so cached frames are rebuilt
+DTYPE_RULES_VERSION = 2
+
+# Key added to a config the first time its schema is needed: (spec, compiled schema), so
+# excel_interpreter_spec is compiled once per loaded config
+SCHEMA_KEY = 'compiled_schema'
+
+
+def get_schema(config):
+    """
+    Compiled view of excel_interpreter_spec.
+
+    Returns:
+        dict with:
+            'sheet_name': Master sheet name
+            'columns': Mapped column_ids in config order
+            'id_to_index': column_id -> zero-based Excel column index
+            'index_to_id': zero-based Excel column index -> column_id
+            'id_to_header': column_id -> Excel header text ('content' in config)
+            'dtypes': column_id -> declared dtype ('category', 'Int8' or None to keep the loaded dtype)
+            'fingerprint': Hash of the spec and dtype rules, for cache keys
+
+        The returned dicts are shared; callers must not modify them (nor the spec once
+        compiled).
+    """
+    spec = config['excel_interpreter_spec']
+    entry = config.get(SCHEMA_KEY)
+    if entry is None or entry[0] is not spec:
+        fingerprint = hashlib.sha1(json.dumps([spec, DTYPE_RULES_VERSION], sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        entry = config[SCHEMA_KEY] = (spec, _compile(spec, fingerprint))
+    return entry[1]
+
+
+def declared_dtype(column_id):
+    """Dtype for a column_id by naming convention (None keeps the loaded dtype)."""
+    if column_id in CATEGORY_COLUMNS or column_id.startswith(CATEGORY_PREFIXES):
+        return 'category'
+    if column_id.startswith(FLAG_PREFIXES):
+        return 'Int8'
+    return None
+
+
+def apply_dtypes(df, config):
+    """
+    Convert the columns of a master dataframe to their declared dtypes.
+
+    A flag column holding anything other than whole numbers keeps its loaded dtype,
+    so no value is lost.
+    """
+    for column_id, dtype in get_schema(config)['dtypes'].items():
+        if dtype is None or column_id not in df.columns or df[column_id].dtype == dtype:
+            continue
+        if dtype == 'category':
+            df[column_id] = df[column_id].astype('category')
+        else:
+            try:
+                df[column_id] = pd.to_numeric(df[column_id]).astype(dtype)
+            except (ValueError, TypeError):
+                logger.warning(f"⚠️ Column {column_id} has non-flag values; keeping dtype {df[column_id].dtype}")
+    return df
+
+
+def is_flag_set(value):
+    """True for a set 0/1 flag (1 or '1'); missing values count as unset."""
+    return bool(pd.notna(value) and (value == 1 or value == '1'))
+
+
+def coerce_value(df, column_id, value):
+    """
+    Form input converted for assignment into a numeric column.
+
+    Text inputs return strings ('0', '1', ''), which nullable Int8 flag columns reject;
+    they are parsed as numbers, with an empty string as missing. Values that are not
+    numeric are returned unchanged.
+    """
+    dtype = df[column_id].dtype
+    if not isinstance(value, str) or pd.api.types.is_bool_dtype(dtype) or not pd.api.types.is_numeric_dtype(dtype):
+        return value
+    if not value.strip():
+        return pd.NA
+    try:
+        return pd.to_numeric(value.strip())
+    except (ValueError, TypeError):
+        return value
+
+
+def add_categories(df, column_id, values):
+    """Extend a categorical column's categories so values can be assigned to it."""
+    series = df[column_id]
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return
+    new_categories = pd.Index(pd.Series(list(values), dtype=object).dropna().unique()).difference(series.cat.categories)
+    if len(new_categories):
+        df[column_id] = series.cat.add_categories(new_categories)
+
+
+def _compile(spec, fingerprint):
+    columns = [col for col in spec['columns'] if col['column_id'] != 'skip']
+    return {
+        'sheet_name': spec['sheet_name'],
+        'columns': [col['column_id'] for col in columns],
+        'id_to_index': {col['column_id']: col['column'] for col in columns},
+        'index_to_id': {col['column']: col['column_id'] for col in columns},
+        'id_to_header': {col['column_id']: col.get('content', col['column_id']) for col in columns},
+        'dtypes': {col['column_id']: declared_dtype(col['column_id']) for col in columns},
+        'fingerprint': fingerprint,
+    }
@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
 import logging
-import tempfile
-import os
+import filter_index
+import status_buffer
 
 logger = logging.getLogger(__name__)
 
@@ -20,11 +20,11 @@ def run(df, filters, config):
     st.header("🎯 Selection Management")
     st.markdown("Manage Phase 2 candidate selections and waitlist")
     
+    # Status changes kept in memory until saved (see status_buffer.py)
+    render_pending_changes(df, config)
+    
     # Apply filters
-    filtered_df = df.copy()
-    for col, selected in filters.items():
-        if selected and col in filtered_df.columns:
-            filtered_df = filtered_df[filtered_df[col].isin(selected) | filtered_df[col].isna()]
+    filtered_df = filter_index.apply(df, filters, include_missing=True)
     
     # Ensure ind_confirm is numeric with no NULLs
     if 'ind_confirm' in filtered_df.columns:
@@ -71,6 +71,31 @@ def run(df, filters, config):
     return df
 
 
+def render_pending_changes(df, config):
+    """Render the unsaved status changes counter with save and discard controls."""
+    pending = status_buffer.pending()
+    if not pending:
+        return
+    
+    col1, col2, col3 = st.columns([3, 1, 1])
+    with col1:
+        st.warning(f"📝 **{pending}** unsaved status change(s)")
+    with col2:
+        if st.button("💾 Save changes", type="primary", key="sm_save_pending"):
+            try:
+                status_buffer.flush(df, config)
+            except Exception as e:
+                st.error(f"❌ Could not save status changes: {e}")
+                return
+            st.session_state['df'] = df
+            st.rerun()
+    with col3:
+        if st.button("↩️ Discard", key="sm_discard_pending"):
+            status_buffer.discard(df, config)
+            st.session_state['df'] = df
+            st.rerun()
+
+
 def render_candidate_list(df, candidates_df, config):
     """Render the main candidate list with inline selection controls."""
     st.subheader("📋 All Phase 2 Candidates")
@@ -121,7 +146,7 @@ def render_candidate_list(df, candidates_df, config):
     if selected_grouping == 'none':
         df = render_candidate_table(df, filtered_candidates, config)
     else:
-        groups = filtered_candidates.groupby(selected_grouping)
+        groups = filtered_candidates.groupby(selected_grouping, observed=True)
         for group_name, group_df in groups:
             group_display = str(group_name) if pd.notna(group_name) else 'Unknown'
             with st.expander(f"📁 {group_display} ({len(group_df)} candidates)", expanded=False):
@@ -161,14 +186,14 @@ def render_candidate_table(df, candidates_df, config, group_key=""):
     
     with col1:
         if st.button(f"Select All Pending ({len(pending_ids)})", key=f"select_all_{group_key}", disabled=len(pending_ids) == 0):
-            df = bulk_update_status(df, pending_ids, 'ind_session', 1, config)
+            df = status_buffer.update(df, [(pending_ids, 'ind_session', 1)], config)
             st.session_state['df'] = df
             st.success(f"✅ Selected {len(pending_ids)} candidates")
             st.rerun()
     
     with col2:
         if st.button(f"Waitlist All Pending", key=f"waitlist_all_{group_key}", disabled=len(pending_ids) == 0):
-            df = bulk_update_status(df, pending_ids, 'ind_waitlist', 1, config)
+            df = status_buffer.update(df, [(pending_ids, 'ind_waitlist', 1)], config)
             st.session_state['df'] = df
             st.success(f"⏳ Added {len(pending_ids)} to waitlist")
             st.rerun()
@@ -176,7 +201,7 @@ def render_candidate_table(df, candidates_df, config, group_key=""):
     with col3:
         selected_ids = candidates_df[candidates_df['_status'] == 'Selected']['id'].tolist()
         if st.button(f"Clear Selected ({len(selected_ids)})", key=f"clear_selected_{group_key}", disabled=len(selected_ids) == 0):
-            df = bulk_update_status(df, selected_ids, 'ind_session', 0, config)
+            df = status_buffer.update(df, [(selected_ids, 'ind_session', 0)], config)
             st.session_state['df'] = df
             st.success(f"Cleared {len(selected_ids)} selections")
             st.rerun()
@@ -184,7 +209,7 @@ def render_candidate_table(df, candidates_df, config, group_key=""):
     with col4:
         waitlist_ids = candidates_df[candidates_df['_status'] == 'Waitlist']['id'].tolist()
         if st.button(f"Clear Waitlist ({len(waitlist_ids)})", key=f"clear_waitlist_{group_key}", disabled=len(waitlist_ids) == 0):
-            df = bulk_update_status(df, waitlist_ids, 'ind_waitlist', 0, config)
+            df = status_buffer.update(df, [(waitlist_ids, 'ind_waitlist', 0)], config)
             st.session_state['df'] = df
             st.success(f"Cleared {len(waitlist_ids)} from waitlist")
             st.rerun()
@@ -211,7 +236,7 @@ def render_team_balance_overview(candidates_df, config):
         st.markdown(f"### {display_name}")
         
         # Group by this hierarchy level
-        grouped = candidates_df.groupby(col_name).agg({
+        grouped = candidates_df.groupby(col_name, observed=True).agg({
             'id': 'count',
             'ind_session': lambda x: (x == 1).sum(),
             'ind_waitlist': lambda x: (x == 1).sum()
@@ -284,9 +309,8 @@ def render_quick_actions(df, candidates_df, config):
     
     with col1:
         if st.button("🔄 Reset All to Pending", type="secondary", key="reset_all"):
-            # Clear both ind_session and ind_waitlist
-            df = bulk_update_status(df, all_ids, 'ind_session', 0, config)
-            df = bulk_update_status(df, all_ids, 'ind_waitlist', 0, config, save=True)
+            # Clear both ind_session and ind_waitlist in one write
+            df = status_buffer.update(df, [(all_ids, 'ind_session', 0), (all_ids, 'ind_waitlist', 0)], config)
             st.session_state['df'] = df
             st.success(f"Reset {len(all_ids)} candidates to pending")
             st.rerun()
@@ -294,7 +318,7 @@ def render_quick_actions(df, candidates_df, config):
     with col2:
         pending_ids = candidates_df[(candidates_df['ind_session'] != 1) & (candidates_df['ind_waitlist'] != 1)]['id'].tolist()
         if st.button(f"✅ Select All Pending ({len(pending_ids)})", type="primary", key="select_all_pending", disabled=len(pending_ids) == 0):
-            df = bulk_update_status(df, pending_ids, 'ind_session', 1, config)
+            df = status_buffer.update(df, [(pending_ids, 'ind_session', 1)], config)
             st.session_state['df'] = df
             st.success(f"Selected {len(pending_ids)} candidates")
             st.rerun()
@@ -306,53 +330,6 @@ def render_quick_actions(df, candidates_df, config):
     return df
 
 
-def bulk_update_status(df, ids, column, value, config, save=True):
-    """Bulk update a status column for multiple records."""
-    # Update df
-    mask = df['id'].isin(ids)
-    df.loc[mask, column] = value
-    
-    if not save:
-        return df
-    
-    # Save to Excel
-    excel_path = config['excel_path']
-    sheet = config['excel_interpreter_spec']['sheet_name']
-    excel_spec = config['excel_interpreter_spec']
-    
-    # Load full Excel
-    full_df = pd.read_excel(excel_path, sheet_name=sheet, header=0, engine='openpyxl')
-    
-    # Get column mapping
-    column_id_to_index = {col['column_id']: col['column'] for col in excel_spec['columns'] if col['column_id'] != 'skip'}
-    
-    # Find ID column
-    id_column_idx = column_id_to_index.get('id', 0)
-    id_column_name = full_df.columns[id_column_idx]
-    
-    # Find target column
-    if column not in column_id_to_index:
-        logger.warning(f"Column {column} not found in config")
-        return df
-    
-    target_col_idx = column_id_to_index[column]
-    target_col_name = full_df.columns[target_col_idx]
-    
-    # Update rows
-    mask = full_df[id_column_name].isin(ids)
-    full_df.loc[mask, target_col_name] = value
-    
-    # Write atomically
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', dir=os.path.dirname(excel_path)) as tmp_file:
-        tmp_path = tmp_file.name
-        with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
-            full_df.to_excel(writer, sheet_name=sheet, index=False)
-    os.replace(tmp_path, excel_path)
-    
-    logger.info(f"✅ Bulk updated {len(ids)} records: {column} = {value}")
-    return df
-
-
 def export_selection_report(candidates_df):
     """Export selection report to Excel."""
     import io
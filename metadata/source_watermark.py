@@ -0,0 +1,132 @@
+import pandas as pd
+import logging
+import json
+import os
+import tempfile
+import time
+import config_paths
+import workbook_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled(config):
+    """True when config.json has a source_watermark entry."""
+    return bool(config.get('source_watermark', {}).get('path'))
+
+
+def get_watermark_path(config):
+    """Watermark file path (see config_paths.resolve)."""
+    return config_paths.resolve(config, config['source_watermark']['path'])
+
+
+def read_new_rows(config):
+    """
+    Rows appended to the phase 1 source (source_path) since the last completed sync.
+
+    The form export only grows at the bottom, so the source is read row by row (see
+    workbook_snapshot.iter_rows for the backend) starting at the stored watermark (last
+    ingested row and its id); earlier rows are not converted or kept. An unchanged file (same mtime and size) is not opened at all.
+    If the row at the watermark no longer holds the same id (rows deleted or re-sorted),
+    or the source spec changed, the whole sheet is returned.
+
+    Returns:
+        (df_rows, watermark): df_rows read like pd.read_excel(source_path, header=None,
+        usecols=columns, skiprows=1), columns named str(column index); watermark to pass
+        to save() once those rows are in the master
+    """
+    source_path = config['source_path']
+    spec = config['source_path_spec']
+    columns = spec['columns']
+    id_position = columns.index(spec.get('id', 0))
+    stat = os.stat(source_path)
+    watermark = {
+        'spec': {'sheet_name': spec.get('sheet_name', 'Sheet1'), 'columns': columns, 'id': spec.get('id', 0)},
+        'source': {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size},
+    }
+
+    stored = _read(config)
+    if stored.get('spec') != watermark['spec']:
+        stored = {}
+    if stored and stored.get('source') == watermark['source']:
+        logger.info("✅ Source unchanged since the last sync")
+        return _to_frame([], columns), stored
+
+    sheet_name = watermark['spec']['sheet_name']
+    engine = workbook_snapshot.get_engine(config)
+    start = time.perf_counter()
+    skip = stored.get('rows', 0)
+    scanned = _scan(source_path, sheet_name, engine, columns, id_position, skip, stored.get('last_id'))
+    if scanned is None:
+        logger.warning("⚠️ Source rows before the watermark changed, reading the whole sheet")
+        skip = 0
+        scanned = _scan(source_path, sheet_name, engine, columns, id_position, 0, None)
+    rows, last_row, last_id = scanned
+    workbook_snapshot.record_read(f"{os.path.basename(source_path)} ({sheet_name}, new rows)", engine,
+                                  len(rows), time.perf_counter() - start)
+
+    watermark.update(rows=last_row, last_id=last_id)
+    logger.info(f"✅ Read {len(rows)} source rows after row {skip}")
+    return _to_frame(rows, columns), watermark
+
+
+def save(config, watermark):
+    """Record the source state whose rows are now all in the master."""
+    _write(config, watermark)
+
+
+def _scan(source_path, sheet_name, engine, columns, id_position, skip, skip_id):
+    """
+    Values of the given columns for the data rows after row skip.
+
+    Returns:
+        (rows, last non-empty row number, its id), or None when row skip doesn't
+        hold skip_id or the sheet no longer has that many rows
+    """
+    rows = []
+    last_row, last_id = 0, None
+    # Data row n is sheet row n + 1 (after the header); start at the watermark row itself
+    first = max(skip, 1)
+    sheet_rows = workbook_snapshot.iter_rows(source_path, sheet_name, engine, min_row=first + 1, max_col=max(columns) + 1)
+    for row_number, row in enumerate(sheet_rows, start=first):
+        values = [row[col] if col < len(row) else '' for col in columns]
+        if row_number == skip and str(values[id_position]) != skip_id:
+            sheet_rows.close()
+            return None
+        if any(value != '' for value in values):
+            last_row, last_id = row_number, str(values[id_position])
+        if row_number > skip:
+            rows.append(values)
+    if last_row < skip:
+        return None
+    # Trailing empty rows are not data
+    return rows[:last_row - skip], last_row, last_id
+
+
+def _to_frame(rows, columns):
+    names = [str(col) for col in columns]
+    if not rows:
+        return pd.DataFrame(columns=names)
+    df = workbook_snapshot.to_frame(rows)
+    df.columns = names
+    return df
+
+
+def _read(config):
+    try:
+        with open(get_watermark_path(config), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(config, watermark):
+    path = get_watermark_path(config)
+    try:
+        with tempfile.NamedTemporaryFile('w', delete=False, dir=os.path.dirname(path), suffix='.json', encoding='utf-8') as tmp_file:
+            json.dump(watermark, tmp_file)
+            tmp_path = tmp_file.name
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # Without a watermark the next sync reads the whole source
+        logger.warning(f"⚠️ Could not write source watermark {path}: {e}")
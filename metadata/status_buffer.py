@@ -0,0 +1,169 @@
+import streamlit as st
+import pandas as pd
+import logging
+import time
+import persistence
+
+logger = logging.getLogger(__name__)
+
+# Session key holding selection status changes made in memory but not yet written:
+# {'version', 'since', 'cells': {(row_id, column): (saved value, new value)}}, where
+# 'version' is the df_version the cells were last checked against the saved baseline
+BUFFER_KEY = 'status_buffer'
+
+
+def is_enabled(config):
+    """True when config.json has a selection_buffer entry."""
+    return 'selection_buffer' in config
+
+
+def update(df, updates, config):
+    """
+    Set status columns for groups of records with a single write.
+
+    With a selection_buffer entry the changes are only applied to the session
+    dataframe and kept as pending until flush(); otherwise all of them are saved
+    at once.
+
+    Args:
+        df: Session dataframe (updated in place)
+        updates: List of (ids, column, value)
+        config: Configuration dict
+
+    Returns:
+        df
+    """
+    column_index = persistence.get_column_index(config)
+    buffered = is_enabled(config)
+    buffer = _get_buffer() if buffered else None
+
+    for ids, column, value in updates:
+        mask = df['id'].isin(ids)
+        if column not in column_index:
+            logger.warning(f"Column {column} not found in config")
+        elif buffered:
+            rows = df.loc[mask, ['id', column]]
+            for row_id, current in zip(rows['id'].tolist(), rows[column].tolist()):
+                saved = buffer['cells'].get((row_id, column), (current,))[0]
+                if not pd.isna(saved) and saved == value:
+                    # Back to the saved value; nothing left to write for this cell
+                    buffer['cells'].pop((row_id, column), None)
+                else:
+                    buffer['cells'][(row_id, column)] = (saved, value)
+        df.loc[mask, column] = value
+        logger.info(f"✅ Bulk updated {int(mask.sum())} records: {column} = {value}")
+
+    if not buffered:
+        # Save only the changed cells to Excel
+        persistence.save_changes(df, config)
+        return df
+
+    persistence.mark_unsaved()
+    buffer['version'] = st.session_state.get(persistence.VERSION_KEY, 0)
+    if not buffer['cells']:
+        buffer['since'] = None
+    elif buffer['since'] is None:
+        buffer['since'] = time.time()
+    st.session_state[BUFFER_KEY] = buffer
+    return df
+
+
+def pending():
+    """Number of status cells changed in memory and not yet written."""
+    return len(_get_buffer()['cells'])
+
+
+def flush(df, config):
+    """
+    Write all pending status changes in one save.
+
+    Returns:
+        Number of status cells written
+    """
+    count = pending()
+    if count:
+        persistence.save_changes(df, config)
+        logger.info(f"✅ Wrote {count} pending status change(s)")
+    st.session_state.pop(BUFFER_KEY, None)
+    return count
+
+
+def flush_if_due(df, config):
+    """
+    Flush when the oldest pending change is older than selection_buffer.flush_delay_seconds.
+
+    Checked on each rerun rather than from a timer, since the write needs the session's
+    dataframe; an idle session writes on its next interaction. A missing or zero delay
+    leaves flushing to the user.
+
+    Returns:
+        Number of status cells written
+    """
+    if not is_enabled(config):
+        return 0
+    delay = config['selection_buffer'].get('flush_delay_seconds', 0)
+    since = _get_buffer()['since']
+    if not delay or since is None or time.time() - since < delay:
+        return 0
+    return flush(df, config)
+
+
+def discard(df, config):
+    """
+    Restore the saved value of every pending status cell.
+
+    Returns:
+        Number of status cells restored
+    """
+    cells = _get_buffer()['cells']
+    saved_by_column = {}
+    for (row_id, column), (saved, _) in cells.items():
+        saved_by_column.setdefault(column, {})[row_id] = saved
+    for column, saved in saved_by_column.items():
+        mask = df['id'].isin(list(saved))
+        df.loc[mask, column] = df.loc[mask, 'id'].map(saved).tolist()
+    if cells:
+        persistence.mark_unsaved()
+    st.session_state.pop(BUFFER_KEY, None)
+    return len(cells)
+
+
+def _get_buffer():
+    """
+    Pending changes, less the cells a save since the last check (from any tab) has written.
+
+    A cell stays pending while the session dataframe and the saved baseline disagree
+    on it, so edits that change df_version without saving (see persistence.mark_unsaved)
+    keep it.
+    """
+    version = st.session_state.get(persistence.VERSION_KEY, 0)
+    buffer = st.session_state.get(BUFFER_KEY)
+    if buffer is None:
+        return {'version': version, 'since': None, 'cells': {}}
+    if buffer['version'] != version:
+        buffer['cells'] = _unwritten(
+            buffer['cells'], st.session_state.get('df'), st.session_state.get(persistence.BASELINE_KEY)
+        )
+        buffer['version'] = version
+        if not buffer['cells']:
+            buffer['since'] = None
+    return buffer
+
+
+def _unwritten(cells, df, baseline):
+    """Cells whose value in the session dataframe differs from the saved baseline."""
+    if df is None or baseline is None or not cells:
+        return cells
+    current = df.drop_duplicates('id').set_index('id')
+    saved = baseline.drop_duplicates('id').set_index('id')
+    unwritten = {}
+    for (row_id, column), change in cells.items():
+        values = [
+            frame.at[row_id, column] if row_id in frame.index and column in frame.columns else None
+            for frame in (current, saved)
+        ]
+        if pd.isna(values[0]) and pd.isna(values[1]):
+            continue
+        if pd.isna(values[0]) or pd.isna(values[1]) or values[0] != values[1]:
+            unwritten[(row_id, column)] = change
+    return unwritten
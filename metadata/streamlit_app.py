@@ -1,50 +1,73 @@
 import streamlit as st
 import pandas as pd
-import json
+import config_paths
+import persistence
+import master_store
+import journal
+import facet_index
+import status_buffer
+import workbook_snapshot
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Dashboard sections: (label, module, whether run() returns the updated dataframe)
+TABS = [
+    ("Data entry", "data_entry", True),
+    ("Explore", "explore", False),
+    ("Data Sync", "data_sync", False),
+    ("Data Import", "data_import", False),
+    ("Participation Analysis", "participation_analysis", False),
+    ("Phase 2 Sync", "phase_two_sync", True),
+    ("Phase 2 Entry", "phase_two_entry", True),
+    ("Selection Management", "selection_management", True),
+]
+
+# Key prefixes of the input widgets each section creates with a key (lazy navigation keeps
+# their values while another section is shown)
+SECTION_WIDGET_KEYS = {
+    "data_entry": ("de_",),
+    "phase_two_entry": ("phase2_search", "p2_hierarchy_select", "p2edit_"),
+    "selection_management": ("sm_group_by", "sm_status_filter", "target_selected", "target_waitlist"),
+}
 
 # Page Config
 st.set_page_config(page_title="Survey Data Dashboard", layout="wide")
 
-st.markdown("""
-<style>
-    /* Vertically align tabs with Deploy button */
-    .stTabs {margin-top: -64px !important;
-</style>
-""", unsafe_allow_html=True)
-
-
 # Load config
-with open('config.json') as f:
-    config = json.load(f)
+config = config_paths.load_config('config.json')
+
+if config.get('navigation', 'tabs') == 'lazy':
+    # Widgets of the sections not rendered in a run lose their values; re-assigning the keyed
+    # input widgets of SECTION_WIDGET_KEYS (before any widget is created) keeps them for when
+    # their section is shown again. Unkeyed widgets, buttons and table selections start over.
+    widget_prefixes = tuple(prefix for prefixes in SECTION_WIDGET_KEYS.values() for prefix in prefixes)
+    for key in list(st.session_state.keys()):
+        if key.startswith(widget_prefixes):
+            st.session_state[key] = st.session_state[key]
+else:
+    st.markdown("""
+    <style>
+        /* Vertically align tabs with Deploy button */
+        .stTabs {margin-top: -64px !important;
+    </style>
+    """, unsafe_allow_html=True)
 
 excel_path = config['excel_path']
-sheet = config['excel_interpreter_spec']['sheet_name']
-
-# Load dataframe - preserve column order from config
-usecols = [col['column'] for col in config['excel_interpreter_spec']['columns']]
 
 # Load dataframe from session state or Excel
 if 'df' not in st.session_state:
     try:
-        df = pd.read_excel(excel_path, sheet_name=sheet, header=None, usecols=usecols, skiprows=1, engine='openpyxl')
-        df.columns = [str(i) for i in usecols]
+        # Columns mapped to column_ids, in config order
+        df = persistence.load_master(config)
     except FileNotFoundError:
         st.error(f"Excel file not found at {excel_path}. Please check the path in config.json.")
         st.stop()
     except Exception as e:
         st.error(f"Error loading Excel file: {e}")
         st.stop()
-
-    # Map columns based on config
-    for col_spec in config['excel_interpreter_spec']['columns']:
-        if col_spec['column_id'] != 'skip':
-            column_idx = str(col_spec['column'])
-            if column_idx in df.columns:
-                df[col_spec['column_id']] = df[column_idx]
-
-    # Keep only the mapped columns
-    mapped_columns = [col_spec['column_id'] for col_spec in config['excel_interpreter_spec']['columns'] if col_spec['column_id'] != 'skip']
-    df = df[mapped_columns]
     
     # Ensure Phase 2 columns exist with default values
     phase2_columns = ['ind_confirm', 'ide_python', 'ide_sql', 'txt_usecase_data', 
@@ -58,9 +81,11 @@ if 'df' not in st.session_state:
     default_zero_cols = ['ind_confirm', 'ind_facilitate', 'ind_session', 'ind_waitlist', 'ind_review_phasetwo']
     for col in default_zero_cols:
         if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('Int8')
     
     st.session_state['df'] = df
+    # Baseline for cell-level delta saves
+    persistence.remember_state(df)
 else:
     df = st.session_state['df']
     
@@ -76,7 +101,7 @@ else:
     default_zero_cols = ['ind_confirm', 'ind_facilitate', 'ind_session', 'ind_waitlist', 'ind_review_phasetwo']
     for col in default_zero_cols:
         if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('Int8')
     st.session_state['df'] = df
 
 # --- Sidebar ---
@@ -86,181 +111,140 @@ st.sidebar.markdown("Data entry and visualization")
 # Filters
 filter_columns = ['nvl_excel', 'nvl_python', 'nvl_sas', 'nvl_sql', 'nvl_vba']
 filters = {}
-# Add company filter
-company_vals = sorted(df['company'].dropna().unique())
-company_options = ['All'] + company_vals
-company_selected = st.sidebar.multiselect(
-    "Filter by Company",
-    company_options,
-    default=['All'],
-    key="company_multiselect"
-)
-filters['company'] = company_vals if 'All' in company_selected else company_selected
-# Add place filter
-place_vals = sorted(df['place'].dropna().unique())
-place_options = ['All'] + place_vals
-place_selected = st.sidebar.multiselect(
-    "Filter by Place",
-    place_options,
-    default=['All'],
-    key="place_multiselect"
-)
-
-# Add phase one filters
-st.sidebar.markdown("---")
-
 
-filters['place'] = place_vals if 'All' in place_selected else place_selected
-# Add ind_review filter
-ind_review_vals = sorted(df['ind_review'].dropna().unique())
-ind_review_options = ['All'] + list(ind_review_vals)
-ind_review_selected = st.sidebar.multiselect(
-    "Filter by Ind Review",
-    ind_review_options,
-    default=['All'],
-    key="ind_review_multiselect"
-)
-filters['ind_review'] = list(ind_review_vals) if 'All' in ind_review_selected else ind_review_selected
-# Add ind_select filter
-ind_select_vals = sorted(df['ind_select'].dropna().unique())
-ind_select_options = ['All'] + list(ind_select_vals)
-ind_select_selected = st.sidebar.multiselect(
-    "Filter by Ind Select",
-    ind_select_options,
-    default=['All'],
-    key="ind_select_multiselect"
-)
-filters['ind_select'] = list(ind_select_vals) if 'All' in ind_select_selected else ind_select_selected
-# Add ind_1to1 filter
-ind_1to1_vals = sorted(df['ind_1to1'].dropna().unique())
-ind_1to1_options = ['All'] + list(ind_1to1_vals)
-ind_1to1_selected = st.sidebar.multiselect(
-    "Filter by Ind 1to1",
-    ind_1to1_options,
-    default=['All'],
-    key="ind_1to1_multiselect"
-)
-filters['ind_1to1'] = list(ind_1to1_vals) if 'All' in ind_1to1_selected else ind_1to1_selected
 
-# Add phase two filters
-st.sidebar.markdown("---")
-
-# Add ind_confirm filter (Phase 2 confirmation)
-ind_confirm_vals = sorted(set(int(x) for x in df['ind_confirm'].dropna().unique()))
-ind_confirm_options = ['All'] + ind_confirm_vals
-ind_confirm_selected = st.sidebar.multiselect(
-    "Filter by Confirmed (Phase 2)",
-    ind_confirm_options,
-    default=['All'],
-    key="ind_confirm_multiselect"
-)
-filters['ind_confirm'] = list(ind_confirm_vals) if 'All' in ind_confirm_selected else ind_confirm_selected
+def facet_filter(col, label, as_int=False):
+    """Sidebar multiselect for one column; options and their record counts come from the facet index."""
+    counts = facet_index.get_counts(df, col)
+    if as_int:
+        int_counts = {}
+        for value, count in counts.items():
+            int_counts[int(value)] = int_counts.get(int(value), 0) + count
+        counts = int_counts
+    values = sorted(counts)
+    key = f"{col}_multiselect"
+    default = ['All']
+    if key in st.session_state:
+        # Re-set the selection so it survives option labels changing with the counts
+        st.session_state[key] = [value for value in st.session_state[key] if value == 'All' or value in counts]
+        default = None
+    selected = st.sidebar.multiselect(
+        label,
+        ['All'] + values,
+        default=default,
+        key=key,
+        format_func=lambda value: value if value == 'All' else f"{value} ({counts[value]})"
+    )
+    filters[col] = values if 'All' in selected else selected
 
-# Add ind_session filter
-ind_session_vals = sorted(set(int(x) for x in df['ind_session'].dropna().unique()))
-ind_session_options = ['All'] + ind_session_vals
-ind_session_selected = st.sidebar.multiselect(
-    "Filter by Session Selected",
-    ind_session_options,
-    default=['All'],
-    key="ind_session_multiselect"
-)
-filters['ind_session'] = list(ind_session_vals) if 'All' in ind_session_selected else ind_session_selected
 
-# Add ind_waitlist filter
-ind_waitlist_vals = sorted(set(int(x) for x in df['ind_waitlist'].dropna().unique()))
-ind_waitlist_options = ['All'] + ind_waitlist_vals
-ind_waitlist_selected = st.sidebar.multiselect(
-    "Filter by Waitlist",
-    ind_waitlist_options,
-    default=['All'],
-    key="ind_waitlist_multiselect"
-)
-filters['ind_waitlist'] = list(ind_waitlist_vals) if 'All' in ind_waitlist_selected else ind_waitlist_selected
+facet_filter('company', "Filter by Company")
+facet_filter('place', "Filter by Place")
 
-# Add ind_review_phasetwo filter
-ind_review_phasetwo_vals = sorted(set(int(x) for x in df['ind_review_phasetwo'].dropna().unique()))
-ind_review_phasetwo_options = ['All'] + ind_review_phasetwo_vals
-ind_review_phasetwo_selected = st.sidebar.multiselect(
-    "Filter by Review (Phase 2)",
-    ind_review_phasetwo_options,
-    default=['All'],
-    key="ind_review_phasetwo_multiselect"
-)
-filters['ind_review_phasetwo'] = list(ind_review_phasetwo_vals) if 'All' in ind_review_phasetwo_selected else ind_review_phasetwo_selected
+# Add phase one filters
+st.sidebar.markdown("---")
+facet_filter('ind_review', "Filter by Ind Review")
+facet_filter('ind_select', "Filter by Ind Select")
+facet_filter('ind_1to1', "Filter by Ind 1to1")
 
+# Add phase two filters
 st.sidebar.markdown("---")
+facet_filter('ind_confirm', "Filter by Confirmed (Phase 2)", as_int=True)
+facet_filter('ind_session', "Filter by Session Selected", as_int=True)
+facet_filter('ind_waitlist', "Filter by Waitlist", as_int=True)
+facet_filter('ind_review_phasetwo', "Filter by Review (Phase 2)", as_int=True)
 
+st.sidebar.markdown("---")
 for col in filter_columns:
-    unique_vals = sorted(df[col].dropna().unique())
-    options = ['All'] + unique_vals
-    selected = st.sidebar.multiselect(
-        f"Filter by {col.replace('nvl_', '').replace('_', ' ').title()}",
-        options,
-        default=['All'],
-        key=f"{col}_multiselect"
-    )
-    if 'All' in selected:
-        filters[col] = unique_vals
-    else:
-        filters[col] = selected
+    facet_filter(col, f"Filter by {col.replace('nvl_', '').replace('_', ' ').title()}")
 
 # Add hierarchy filters
 st.sidebar.markdown("---")
-
-# Additional filters
 additional_filter_columns = ['des_red', 'des_dt', 'des_dg', 'des_dan','des_centro_ges' ]
 for col in additional_filter_columns:
-    unique_vals = sorted(df[col].dropna().unique())
-    options = ['All'] + unique_vals
-    selected = st.sidebar.multiselect(
-        f"Filter by {col.replace('_', ' ').title()}",
-        options,
-        default=['All'],
-        key=f"{col}_multiselect"
-    )
-    if 'All' in selected:
-        filters[col] = unique_vals
-    else:
-        filters[col] = selected
-
-tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
-    "Data entry", "Explore", "Data Sync", "Data Import", "Participation Analysis",
-    "Phase 2 Sync", "Phase 2 Entry", "Selection Management"
-])
-
-with tab1:
-    import data_entry
-    df = data_entry.run(df, filters, config)
-    st.session_state['df'] = df
-
-with tab2:
-    import explore
-    explore.run(df, filters, config)
-
-with tab3:
-    import data_sync
-    data_sync.run(df, filters, config)
-
-with tab4:
-    import data_import
-    data_import.run(df, filters, config)
-
-with tab5:
-    import participation_analysis
-    participation_analysis.run(df, filters, config)
-
-with tab6:
-    import phase_two_sync
-    df = phase_two_sync.run(df, filters, config)
-    st.session_state['df'] = df
-
-with tab7:
-    import phase_two_entry
-    df = phase_two_entry.run(df, filters, config)
-    st.session_state['df'] = df
-
-with tab8:
-    import selection_management
-    df = selection_management.run(df, filters, config)
-    st.session_state['df'] = df
\ No newline at end of file
+    facet_filter(col, f"Filter by {col.replace('_', ' ').title()}")
+
+# Pending Excel writes (embedded database snapshot or edit journal)
+if master_store.is_enabled(config):
+    st.sidebar.markdown("---")
+    pending_exports = master_store.pending_exports(config)
+    st.sidebar.caption(f"💾 Excel snapshot: {pending_exports} change(s) pending export")
+    if master_store.workbook_modified(config):
+        st.sidebar.warning("⚠️ The workbook was edited outside the app. Close it in Excel and export; "
+                           "its edits are loaded after the pending changes are written.")
+    if st.sidebar.button("Export Excel snapshot now", disabled=pending_exports == 0, key="export_snapshot"):
+        try:
+            exported = master_store.export_snapshot(config)
+            st.sidebar.success(f"✅ Exported {exported} change(s) to Excel")
+        except Exception as e:
+            st.sidebar.error(f"❌ Could not write Excel snapshot: {e}")
+elif journal.is_enabled(config):
+    st.sidebar.markdown("---")
+    pending_edits = journal.pending(config)
+    st.sidebar.caption(f"📝 Edit journal: {pending_edits} edit(s) pending write to Excel")
+    if st.sidebar.button("Write journaled edits to Excel now", disabled=pending_edits == 0, key="compact_journal"):
+        try:
+            compacted = journal.compact(config)
+            st.sidebar.success(f"✅ Wrote {compacted} edit(s) to Excel")
+        except Exception as e:
+            st.sidebar.error(f"❌ Could not write journaled edits to Excel: {e}")
+
+# Selection status changes kept in memory, written after selection_buffer.flush_delay_seconds
+if status_buffer.is_enabled(config):
+    try:
+        flushed = status_buffer.flush_if_due(df, config)
+        if flushed:
+            st.sidebar.success(f"✅ Saved {flushed} pending status change(s)")
+    except Exception as e:
+        st.sidebar.error(f"❌ Could not save pending status changes: {e}")
+    if status_buffer.pending():
+        pending_caption = st.sidebar.empty()
+        if st.sidebar.button("Save status changes now", key="flush_status_buffer"):
+            try:
+                flushed = status_buffer.flush(df, config)
+                st.sidebar.success(f"✅ Saved {flushed} pending status change(s)")
+            except Exception as e:
+                st.sidebar.error(f"❌ Could not save pending status changes: {e}")
+        pending_statuses = status_buffer.pending()
+        if pending_statuses:
+            pending_caption.caption(f"📝 Selection: {pending_statuses} unsaved status change(s)")
+
+def run_tab(label, module_name, updates_df, df):
+    """Run one tab's module, recording how long it took. Returns the session dataframe."""
+    module = importlib.import_module(module_name)
+    start = time.perf_counter()
+    result = module.run(df, filters, config)
+    elapsed = time.perf_counter() - start
+    st.session_state.setdefault('module_timings', {})[label] = elapsed
+    logger.info(f"⏱️ {label}: {elapsed * 1000:.0f} ms")
+    if updates_df:
+        df = result
+        st.session_state['df'] = df
+    return df
+
+
+if config.get('navigation', 'tabs') == 'lazy':
+    # Only the selected section runs on each rerun; its state in st.session_state is kept
+    active_tab = st.radio("Section", [label for label, _, _ in TABS], horizontal=True,
+                          key="active_tab", label_visibility="collapsed")
+    for label, module_name, updates_df in TABS:
+        if label == active_tab:
+            df = run_tab(label, module_name, updates_df, df)
+else:
+    for tab, (label, module_name, updates_df) in zip(st.tabs([label for label, _, _ in TABS]), TABS):
+        with tab:
+            df = run_tab(label, module_name, updates_df, df)
+
+# Per-module timings of this session (last run of each section)
+module_timings = st.session_state.get('module_timings', {})
+if module_timings:
+    with st.sidebar.expander("⏱️ Module timings"):
+        for label, elapsed in module_timings.items():
+            st.caption(f"{label}: {elapsed * 1000:.0f} ms")
+
+# Latest workbook reads, with the backend (or sidecar) that served each one
+workbook_reads = workbook_snapshot.recent_reads()
+if workbook_reads:
+    with st.sidebar.expander("⏱️ Workbook reads"):
+        for label, source, n_rows, elapsed in reversed(workbook_reads):
+            st.caption(f"{label}: {n_rows} rows, {source}, {elapsed * 1000:.0f} ms")
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Compiled rules by spec hash; each source spec is interpreted once per process
+_compiled = {}
+
+
+def get_rules(spec):
+    """
+    Compiled replicate / binary_check / missing_fields rules of a source spec
+    (source_path_spec or phase_two_spec).
+
+    Returns:
+        dict with:
+            'replicate': [{'origin', 'destination', 'column_id', 'fill_missing'}]
+            'binary_check': [{'column', 'destination', 'column_id'}]
+            'missing_field_value': Value written for empty answers to missing_fields
+
+        The returned dict is shared; callers must not modify it.
+    """
+    fingerprint = hashlib.sha1(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    if fingerprint not in _compiled:
+        _compiled[fingerprint] = _compile(spec)
+    return _compiled[fingerprint]
+
+
+def apply_rules(spec, df_source):
+    """
+    Column-level results of the spec's rules for every row of a source frame.
+
+    replicate copies the origin column, with empty answers (missing, blank or
+    whitespace) to a missing_fields column replaced by missing_field_value.
+    binary_check gives 1 where the answer contains 'sí' (case-insensitive), 0 otherwise.
+    Rules whose source column was not loaded are skipped.
+
+    Args:
+        spec: source_path_spec or phase_two_spec
+        df_source: Source rows, columns named by str(source column index)
+
+    Returns:
+        dict with 'replicate' and 'binary_check': [(rule, Series aligned with df_source)]
+    """
+    rules = get_rules(spec)
+    replicated = []
+    for rule in rules['replicate']:
+        values = df_source.get(str(rule['origin']))
+        if values is None:
+            continue
+        if rule['fill_missing']:
+            empty = values.isna() | (values.astype(str).str.strip() == '')
+            if empty.any():
+                values = values.astype(object).where(~empty, rules['missing_field_value'])
+        replicated.append((rule, values))
+
+    checked = []
+    for rule in rules['binary_check']:
+        values = df_source.get(str(rule['column']))
+        if values is None:
+            continue
+        answered_yes = values.notna() & values.astype(str).str.lower().str.contains('sí', regex=False)
+        checked.append((rule, answered_yes.astype(int)))
+
+    return {'replicate': replicated, 'binary_check': checked}
+
+
+def _compile(spec):
+    missing_fields = set(spec.get('missing_fields', []))
+    replicate = []
+    for rule in spec.get('replicate', []):
+        origin = _column_number(rule.get('origin'))
+        if origin is None:
+            logger.warning(f"⚠️ Skipping replicate rule with non-numeric origin {rule.get('origin')!r}")
+            continue
+        replicate.append({
+            'origin': origin,
+            'destination': rule.get('destination'),
+            'column_id': rule.get('column_id'),
+            'fill_missing': origin in missing_fields,
+        })
+    binary_check = []
+    for rule in spec.get('binary_check', []):
+        column = _column_number(rule.get('column'))
+        if column is None:
+            logger.warning(f"⚠️ Skipping binary_check rule with non-numeric column {rule.get('column')!r}")
+            continue
+        binary_check.append({
+            'column': column,
+            'destination': rule.get('destination'),
+            'column_id': rule.get('column_id', ''),
+        })
+    return {
+        'replicate': replicate,
+        'binary_check': binary_check,
+        'missing_field_value': spec.get('missing_field_value', 'sin respuesta'),
+    }
+
+
+def _column_number(value):
+    """Source column index of a rule ('3' or 3), None when it is not one."""
+    text = str(value).strip()
+    return int(text) if text.isdigit() else None
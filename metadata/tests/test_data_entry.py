@@ -0,0 +1,58 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Folder with a small master workbook and a config.json that saves straight to it."""
+    with open(os.path.join(APP_DIR, 'config.json'), encoding='utf-8') as f:
+        config = json.load(f)
+    for key in ('master_store', 'edit_journal', 'load_cache', 'match_cache', 'source_watermark', 'selection_buffer'):
+        config.pop(key, None)
+    config['excel_path'] = 'python_community.xlsx'
+
+    columns = {col['column']: col['column_id'] for col in config['excel_interpreter_spec']['columns']}
+    rows = []
+    for i in range(3):
+        row = {}
+        for index in range(max(columns) + 1):
+            column_id = columns.get(index, f'extra_{index}')
+            if column_id == 'id':
+                row[column_id] = i + 1
+            elif column_id.startswith('timestamp'):
+                row[column_id] = pd.Timestamp('2025-01-01') + pd.Timedelta(hours=i)
+            elif column_id.startswith(('ind_', 'cod_', 'pk_', 'fk_')):
+                row[column_id] = i % 2
+            else:
+                row[column_id] = f'{column_id} {i}'
+        rows.append(row)
+    pd.DataFrame(rows).to_excel(tmp_path / 'python_community.xlsx', sheet_name='Sheet1', index=False)
+    with open(tmp_path / 'config.json', 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_save_record_changes_with_phase_two_flags(workspace):
+    at = AppTest.from_file(os.path.join(APP_DIR, 'streamlit_app.py'), default_timeout=60)
+    at.run()
+    at.radio(key='active_tab').set_value('Data entry').run()
+    records = next(s for s in at.selectbox if s.label == 'Select a record to edit')
+    records.set_value('name 1 (ID: 2)').run()
+
+    # Phase 2 flags are plain text inputs ('0' / '1') next to the edited field
+    assert at.text_input(key='de_2_ind_confirm').value == '1'
+    at.text_input(key='de_2_email').set_value('new@example.com').run()
+    next(b for b in at.button if b.label == 'Save Changes').click().run()
+
+    assert not at.exception
+    saved = pd.read_excel(workspace / 'python_community.xlsx', sheet_name='Sheet1')
+    assert saved.loc[saved['id'] == 2, 'email'].tolist() == ['new@example.com']
+    assert saved.loc[saved['id'] == 2, 'ind_confirm'].tolist() == [1]
+    assert at.session_state['df']['ind_confirm'].dtype == 'Int8'
@@ -0,0 +1,250 @@
+import pandas as pd
+import logging
+import collections
+import datetime
+import hashlib
+import os
+import threading
+import time
+from openpyxl import load_workbook
+import load_cache
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+logger = logging.getLogger(__name__)
+
+# Reader backends; 'auto' picks calamine when python-calamine is installed, openpyxl otherwise
+ENGINES = ('auto', 'openpyxl', 'calamine')
+
+# Cell texts pd.read_excel reads as missing by default (its documented na_values)
+NA_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+# Latest workbook reads of this process, newest last: (label, source, rows, seconds)
+_reads = collections.deque(maxlen=10)
+_lock = threading.Lock()
+
+
+def get_engine(config):
+    """
+    Reader backend for workbook reads, from excel_reader.engine in config.json
+    ('openpyxl' when absent). Falls back to openpyxl when calamine is requested but
+    python-calamine is not installed.
+    """
+    requested = (config or {}).get('excel_reader', {}).get('engine', 'openpyxl')
+    if requested not in ENGINES:
+        logger.warning(f"⚠️ Unknown excel_reader engine '{requested}', using openpyxl")
+        requested = 'openpyxl'
+    if requested in ('auto', 'calamine') and CalamineWorkbook is not None:
+        return 'calamine'
+    if requested == 'calamine':
+        logger.warning("⚠️ python-calamine is not installed, reading workbooks with openpyxl")
+    return 'openpyxl'
+
+
+def load(path, sheet_name, config=None, use_cache=True):
+    """
+    Parse a workbook sheet once into a snapshot that any number of views are built from.
+
+    Cells are converted as pandas' openpyxl reader does (empty -> '', integral numbers
+    -> int), trailing empty cells and rows are dropped, and the values are kept column
+    by column, so a view of a few columns only touches those columns. The sheet is read
+    with the backend from get_engine(); when load_cache is configured the parsed cells
+    are also kept in a sidecar until the file's mtime or size change.
+
+    Args:
+        path: Workbook path
+        sheet_name: Sheet to read
+        config: Configuration dict (excel_reader and load_cache entries)
+        use_cache: Keep the parsed cells in the load cache; off for callers that cache
+            the frame they build from the snapshot
+
+    Returns:
+        dict with 'path', 'sheet_name', 'n_rows' (including the header row) and 'columns'
+        (one list of cell values per sheet column); callers must not modify it
+    """
+    config = config or {}
+    engine = get_engine(config)
+    start = time.perf_counter()
+    if use_cache and load_cache.is_enabled(config):
+        source = ['sidecar']
+
+        def parse():
+            source[0] = engine
+            return _to_cells(_read_columns(path, sheet_name, engine))
+
+        stat = os.stat(path)
+        name = 'sheet_' + hashlib.sha1(f"{os.path.abspath(path)}|{sheet_name}".encode('utf-8')).hexdigest()[:12]
+        cells = load_cache.get_or_load(config, name, f"{stat.st_mtime_ns}-{stat.st_size}", parse, copy=False)
+        columns = [cells[col].tolist() for col in cells.columns]
+        source = source[0]
+    else:
+        columns = _read_columns(path, sheet_name, engine)
+        source = engine
+    n_rows = len(columns[0]) if columns else 0
+    record_read(f"{os.path.basename(path)} ({sheet_name})", source, n_rows, time.perf_counter() - start)
+    return {'path': path, 'sheet_name': sheet_name, 'n_rows': n_rows, 'columns': columns}
+
+
+def iter_rows(path, sheet_name, engine='openpyxl', min_row=1, max_col=None):
+    """
+    Converted cell values (see convert_cell) of each sheet row, as lists.
+
+    openpyxl streams the sheet in read-only mode; calamine reads it whole, which is
+    still faster for any sheet size. Rows may end in empty cells.
+
+    Args:
+        path: Workbook path
+        sheet_name: Sheet to read
+        engine: 'openpyxl' or 'calamine' (see get_engine)
+        min_row: First row to return (1-based)
+        max_col: Number of leading columns to return; all when None
+    """
+    if engine == 'calamine':
+        wb = CalamineWorkbook.from_path(path)
+        try:
+            rows = wb.get_sheet_by_name(sheet_name).to_python(skip_empty_area=False)
+        finally:
+            wb.close()
+        for row in rows[min_row - 1:]:
+            yield [_convert_calamine_cell(value) for value in row[:max_col]]
+        return
+
+    wb = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb[sheet_name]
+        # Read-only sheets trust the stored <dimension>, which some writers (form exports,
+        # other tools) leave stale; pandas' reader resets it too
+        ws.reset_dimensions()
+        for row in ws.iter_rows(min_row=min_row, max_col=max_col, values_only=True):
+            yield [convert_cell(value) for value in row]
+    finally:
+        wb.close()
+
+
+def record_read(label, source, n_rows, elapsed):
+    """Log a workbook read and add it to recent_reads()."""
+    with _lock:
+        _reads.append((label, source, n_rows, elapsed))
+    logger.info(f"⏱️ Read {n_rows} rows of {label} with {source} in {elapsed * 1000:.0f} ms")
+
+
+def recent_reads():
+    """Latest workbook reads of this process, newest last: [(label, source, rows, seconds)]."""
+    with _lock:
+        return list(_reads)
+
+
+def frame(snapshot, header=None, usecols=None, skiprows=None):
+    """
+    DataFrame view of a snapshot, as pd.read_excel(path, sheet_name=..., header=...,
+    usecols=..., skiprows=...) would return it, without reading the workbook again.
+
+    Args:
+        snapshot: Snapshot from load()
+        header: Row number of the column names, or None (columns named by sheet column index)
+        usecols: Sheet column indexes to keep, returned in sheet order as read_excel does;
+            all columns when None
+        skiprows: Number of leading rows to skip
+    """
+    if not snapshot['n_rows']:
+        return pd.DataFrame()
+    cols = list(range(len(snapshot['columns']))) if usecols is None else sorted(set(usecols))
+    out_of_range = [col for col in cols if col >= len(snapshot['columns'])]
+    if out_of_range:
+        raise ValueError(f"usecols {out_of_range} out of bounds of sheet {snapshot['sheet_name']}")
+    rows = [list(row) for row in zip(*(snapshot['columns'][col] for col in cols))]
+    df = to_frame(rows, header=header, skiprows=skiprows)
+    if header is None:
+        df.columns = cols
+    return df
+
+
+def to_frame(rows, header=None, skiprows=None):
+    """
+    DataFrame from converted cell rows, typed as pd.read_excel types a sheet.
+
+    NA texts become missing values, columns whose values are all numbers (or numeric
+    text) become numeric, and the rest are inferred (datetimes) or kept as objects.
+    """
+    rows = rows[skiprows or 0:]
+    columns = None
+    if header is not None:
+        columns = _header_names(rows[header]) if len(rows) > header else None
+        rows = rows[header + 1:]
+    df = pd.DataFrame(rows, columns=columns, dtype=object)
+    for position in range(df.shape[1]):
+        values = df.iloc[:, position]
+        values = values.mask(values.isin(NA_STRINGS))
+        try:
+            values = pd.to_numeric(values)
+        except (ValueError, TypeError):
+            values = values.infer_objects()
+        df.isetitem(position, values)
+    return df
+
+
+def _header_names(names):
+    """Column names as read_excel gives them: blanks as 'Unnamed: i', repeats as 'name.1'."""
+    seen = {}
+    result = []
+    for position, name in enumerate(names):
+        name = f'Unnamed: {position}' if name == '' else name
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        result.append(name)
+    return result
+
+
+def convert_cell(value):
+    """Cell value as pandas' openpyxl reader returns it: empty cells are '', integral numbers are int."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _read_columns(path, sheet_name, engine):
+    """Cell values of a sheet, column by column, trimmed as pandas does."""
+    rows = []
+    last_row_with_data = -1
+    for row_number, row in enumerate(iter_rows(path, sheet_name, engine)):
+        while row and row[-1] == '':
+            row.pop()
+        if row:
+            last_row_with_data = row_number
+        rows.append(row)
+
+    rows = rows[:last_row_with_data + 1]
+    width = max((len(row) for row in rows), default=0)
+    columns = [[] for _ in range(width)]
+    for row in rows:
+        for col, value in enumerate(row):
+            columns[col].append(value)
+        for col in range(len(row), width):
+            columns[col].append('')
+    return columns
+
+
+def _to_cells(columns):
+    """Frame of a snapshot's columns, for the load cache."""
+    return pd.DataFrame({str(col): pd.Series(values, dtype=object) for col, values in enumerate(columns)})
+
+
+def _convert_calamine_cell(value):
+    """Cell value as the openpyxl reader gives it (see convert_cell), from a calamine cell."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        # openpyxl returns date-formatted cells as datetimes
+        return datetime.datetime.combine(value, datetime.time())
+    return value